@@ -5,6 +5,7 @@ from collections import defaultdict
 
 import cv2
 import numpy as np
+import pypdfium2 as pdfium
 from loguru import logger
 from mineru_vl_utils import MinerUClient
 from mineru_vl_utils.structs import BlockType
@@ -15,12 +16,15 @@ from mineru.backend.pipeline.model_init import HybridModelSingleton
 from mineru.backend.vlm.vlm_analyze import ModelSingleton
 from mineru.data.data_reader_writer import DataWriter
 from mineru.utils.config_reader import get_device
-from mineru.utils.enum_class import ImageType, NotExtractType
+from mineru.utils.enum_class import NotExtractType
 from mineru.utils.model_utils import crop_img, get_vram, clean_memory
 from mineru.utils.ocr_utils import get_adjusted_mfdetrec_res, get_ocr_result_list, sorted_boxes, merge_det_boxes, \
     update_det_boxes, OcrConfidence
 from mineru.utils.pdf_classify import classify
-from mineru.utils.pdf_image_tools import load_images_from_pdf
+from mineru.utils.os_env_config import get_min_batch_inference_size
+from mineru.utils.cut_image import set_pdf_doc_key
+from mineru.utils.pdf_image_tools import AsyncWindowIterator, iter_prefetch_windows, load_images_by_windows
+from mineru.utils.pdf_text_layer import get_doc_text_layer
 
 os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'  # 让mps可以fallback
 os.environ['NO_ALBUMENTATIONS_UPDATE'] = '1'  # 禁止albumentations检查更新
@@ -30,11 +34,11 @@ OCR_DET_BASE_BATCH_SIZE = 16
 
 not_extract_list = [item.value for item in NotExtractType]
 
-def ocr_classify(pdf_bytes, parse_method: str = 'auto',) -> bool:
+def ocr_classify(pdf_bytes, parse_method: str = 'auto', pdf_doc=None) -> bool:
     # 确定OCR设置
     _ocr_enable = False
     if parse_method == 'auto':
-        if classify(pdf_bytes) == 'ocr':
+        if classify(pdf_bytes, pdf_doc) == 'ocr':
             _ocr_enable = True
     elif parse_method == 'ocr':
         _ocr_enable = True
@@ -397,44 +401,61 @@ def doc_analyze(
     if predictor is None:
         predictor = ModelSingleton().get_model(backend, model_path, server_url, **kwargs)
 
-    # 加载图像
-    load_images_start = time.time()
-    images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
-    images_pil_list = [image_dict["img_pil"] for image_dict in images_list]
-    load_images_time = round(time.time() - load_images_start, 2)
-    logger.debug(f"load images cost: {load_images_time}, speed: {round(len(images_pil_list)/load_images_time, 3)} images/s")
+    pdf_doc = set_pdf_doc_key(pdfium.PdfDocument(pdf_bytes), pdf_bytes)
 
     # 获取设备信息
     device = get_device()
 
     # 确定OCR配置
-    _ocr_enable = ocr_classify(pdf_bytes, parse_method=parse_method)
+    _ocr_enable = ocr_classify(pdf_bytes, parse_method=parse_method, pdf_doc=pdf_doc)
     _vlm_ocr_enable = _should_enable_vlm_ocr(_ocr_enable, language, inline_formula_enable)
+    doc_text_layer = get_doc_text_layer(pdf_doc)
+    if _ocr_enable or _vlm_ocr_enable:
+        # 不使用文本层, 释放类型判断时加载的textpage
+        doc_text_layer.clear()
+    batch_ratio = 1 if _vlm_ocr_enable else get_batch_ratio(device)
+
+    images_list = []
+    results = []
+    inline_formula_list = []
+    ocr_res_list = []
+    hybrid_pipeline_model = None
 
     infer_start = time.time()
-    # VLM提取
-    if _vlm_ocr_enable:
-        results = predictor.batch_two_step_extract(images=images_pil_list)
-        hybrid_pipeline_model = None
-        inline_formula_list = [[] for _ in images_pil_list]
-        ocr_res_list = [[] for _ in images_pil_list]
-    else:
-        batch_ratio = get_batch_ratio(device)
-        results = predictor.batch_two_step_extract(
-            images=images_pil_list,
-            not_extract_list=not_extract_list
-        )
-        inline_formula_list, ocr_res_list, hybrid_pipeline_model = _process_ocr_and_formulas(
-            images_pil_list,
-            results,
-            language,
-            inline_formula_enable,
-            _ocr_enable,
-            batch_radio=batch_ratio,
-        )
-        _normalize_bbox(inline_formula_list, ocr_res_list, images_pil_list)
+    # 分批渲染, 后台线程预取下一批页面, 渲染与推理并行
+    windows = iter_prefetch_windows([len(pdf_doc)], get_min_batch_inference_size())
+    window_iter = load_images_by_windows([pdf_bytes], windows, doc_keys=[pdf_doc._mineru_doc_key])
+    for ((_, start_page_id, end_page_id),), (window_images,) in window_iter:
+        if not (_ocr_enable or _vlm_ocr_enable):
+            # 文本层提取与当前批的推理并行
+            doc_text_layer.prefetch(pdf_bytes, range(start_page_id, end_page_id + 1))
+        images_list.extend(window_images)
+        images_pil_list = [image_dict["img_pil"] for image_dict in window_images]
+        # VLM提取
+        if _vlm_ocr_enable:
+            window_results = predictor.batch_two_step_extract(images=images_pil_list)
+            window_inline_formula_list = [[] for _ in images_pil_list]
+            window_ocr_res_list = [[] for _ in images_pil_list]
+        else:
+            window_results = predictor.batch_two_step_extract(
+                images=images_pil_list,
+                not_extract_list=not_extract_list
+            )
+            window_inline_formula_list, window_ocr_res_list, hybrid_pipeline_model = _process_ocr_and_formulas(
+                images_pil_list,
+                window_results,
+                language,
+                inline_formula_enable,
+                _ocr_enable,
+                batch_radio=batch_ratio,
+            )
+            _normalize_bbox(window_inline_formula_list, window_ocr_res_list, images_pil_list)
+        results.extend(window_results)
+        inline_formula_list.extend(window_inline_formula_list)
+        ocr_res_list.extend(window_ocr_res_list)
     infer_time = round(time.time() - infer_start, 2)
-    logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
+    if infer_time > 0:
+        logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
 
     # 生成中间JSON
     middle_json = result_to_middle_json(
@@ -469,44 +490,66 @@ async def aio_doc_analyze(
     if predictor is None:
         predictor = ModelSingleton().get_model(backend, model_path, server_url, **kwargs)
 
-    # 加载图像
-    load_images_start = time.time()
-    images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
-    images_pil_list = [image_dict["img_pil"] for image_dict in images_list]
-    load_images_time = round(time.time() - load_images_start, 2)
-    logger.debug(f"load images cost: {load_images_time}, speed: {round(len(images_pil_list)/load_images_time, 3)} images/s")
+    pdf_doc = set_pdf_doc_key(pdfium.PdfDocument(pdf_bytes), pdf_bytes)
 
     # 获取设备信息
     device = get_device()
 
     # 确定OCR配置
-    _ocr_enable = ocr_classify(pdf_bytes, parse_method=parse_method)
+    _ocr_enable = ocr_classify(pdf_bytes, parse_method=parse_method, pdf_doc=pdf_doc)
     _vlm_ocr_enable = _should_enable_vlm_ocr(_ocr_enable, language, inline_formula_enable)
+    doc_text_layer = get_doc_text_layer(pdf_doc)
+    if _ocr_enable or _vlm_ocr_enable:
+        # 不使用文本层, 释放类型判断时加载的textpage
+        doc_text_layer.clear()
+    batch_ratio = 1 if _vlm_ocr_enable else get_batch_ratio(device)
+
+    images_list = []
+    results = []
+    inline_formula_list = []
+    ocr_res_list = []
+    hybrid_pipeline_model = None
 
     infer_start = time.time()
-    # VLM提取
-    if _vlm_ocr_enable:
-        results = await predictor.aio_batch_two_step_extract(images=images_pil_list)
-        hybrid_pipeline_model = None
-        inline_formula_list = [[] for _ in images_pil_list]
-        ocr_res_list = [[] for _ in images_pil_list]
-    else:
-        batch_ratio = get_batch_ratio(device)
-        results = await predictor.aio_batch_two_step_extract(
-            images=images_pil_list,
-            not_extract_list=not_extract_list
-        )
-        inline_formula_list, ocr_res_list, hybrid_pipeline_model = _process_ocr_and_formulas(
-            images_pil_list,
-            results,
-            language,
-            inline_formula_enable,
-            _ocr_enable,
-            batch_radio=batch_ratio,
-        )
-        _normalize_bbox(inline_formula_list, ocr_res_list, images_pil_list)
+    # 分批渲染, 后台线程预取下一批页面, 渲染与推理并行
+    windows = iter_prefetch_windows([len(pdf_doc)], get_min_batch_inference_size())
+    window_iter = load_images_by_windows([pdf_bytes], windows, doc_keys=[pdf_doc._mineru_doc_key])
+    async_window_iter = AsyncWindowIterator(window_iter)
+    try:
+        while (item := await async_window_iter.next()) is not None:
+            ((_, start_page_id, end_page_id),), (window_images,) = item
+            if not (_ocr_enable or _vlm_ocr_enable):
+                # 文本层提取与当前批的推理并行
+                doc_text_layer.prefetch(pdf_bytes, range(start_page_id, end_page_id + 1))
+            images_list.extend(window_images)
+            images_pil_list = [image_dict["img_pil"] for image_dict in window_images]
+            # VLM提取
+            if _vlm_ocr_enable:
+                window_results = await predictor.aio_batch_two_step_extract(images=images_pil_list)
+                window_inline_formula_list = [[] for _ in images_pil_list]
+                window_ocr_res_list = [[] for _ in images_pil_list]
+            else:
+                window_results = await predictor.aio_batch_two_step_extract(
+                    images=images_pil_list,
+                    not_extract_list=not_extract_list
+                )
+                window_inline_formula_list, window_ocr_res_list, hybrid_pipeline_model = _process_ocr_and_formulas(
+                    images_pil_list,
+                    window_results,
+                    language,
+                    inline_formula_enable,
+                    _ocr_enable,
+                    batch_radio=batch_ratio,
+                )
+                _normalize_bbox(window_inline_formula_list, window_ocr_res_list, images_pil_list)
+            results.extend(window_results)
+            inline_formula_list.extend(window_inline_formula_list)
+            ocr_res_list.extend(window_ocr_res_list)
+    finally:
+        await async_window_iter.close()
     infer_time = round(time.time() - infer_start, 2)
-    logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
+    if infer_time > 0:
+        logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
 
     # 生成中间JSON
     middle_json = result_to_middle_json(
@@ -24,6 +24,7 @@ class MagicModel:
         height,
         _ocr_enable,
         _vlm_ocr_enable,
+        text_layer=None,
     ):
         self.page_blocks = page_blocks
         self.page_inline_formula = page_inline_formula
@@ -58,7 +59,7 @@ class MagicModel:
                     })
             if not _ocr_enable:
                 virtual_block = [0, 0, width, height, None, None, None, "text"]
-                page_text_inline_formula_spans = txt_spans_extract(page, page_text_inline_formula_spans, page_pil_img, scale, [virtual_block],[])
+                page_text_inline_formula_spans = txt_spans_extract(page, page_text_inline_formula_spans, page_pil_img, scale, [virtual_block], [], text_layer)
 
         # 解析每个块
         for index, block_info in enumerate(page_blocks):
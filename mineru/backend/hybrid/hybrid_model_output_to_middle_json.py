@@ -10,11 +10,11 @@ from loguru import logger
 from mineru.backend.hybrid.hybrid_magic_model import MagicModel
 from mineru.backend.utils import cross_page_table_merge
 from mineru.utils.config_reader import get_table_enable, get_llm_aided_config
-from mineru.utils.cut_image import cut_image_and_table
+from mineru.utils.cut_image import cut_image_and_table, ImageExporter, get_page_img_id
 from mineru.utils.enum_class import ContentType
-from mineru.utils.hash_utils import bytes_md5
 from mineru.utils.ocr_utils import OcrConfidence
 from mineru.utils.pdf_image_tools import get_crop_img
+from mineru.utils.pdf_text_layer import get_doc_text_layer
 from mineru.version import __version__
 
 
@@ -47,9 +47,14 @@ def blocks_to_page_info(
 
     scale = image_dict["scale"]
     page_pil_img = image_dict["img_pil"]
-    page_img_md5 = bytes_md5(page_pil_img.tobytes())
+    page_img_md5 = get_page_img_id(page_pil_img, page, page_index, scale)
     width, height = map(int, page.get_size())
 
+    text_layer = None
+    if not (_ocr_enable or _vlm_ocr_enable):
+        # 文本层在推理期间已由渲染进程池预取
+        text_layer = get_doc_text_layer(page.pdf).take_page(page_index)
+
     magic_model = MagicModel(
         page_blocks,
         page_inline_formula,
@@ -61,6 +66,7 @@ def blocks_to_page_info(
         height,
         _ocr_enable,
         _vlm_ocr_enable,
+        text_layer,
     )
     image_blocks = magic_model.get_image_blocks()
     table_blocks = magic_model.get_table_blocks()
@@ -151,12 +157,14 @@ def result_to_middle_json(
         "_version_name": __version__
     }
 
+    # 图片的裁剪、编码和写入在线程池中进行, 与后续页面的处理和后置ocr并行
+    image_exporter = ImageExporter(image_writer) if image_writer else image_writer
     for index, (page_blocks, page_inline_formula, page_ocr_res) in enumerate(zip(model_output_blocks_list, inline_formula_list, ocr_res_list)):
         page = pdf_doc[index]
         image_dict = images_list[index]
         page_info = blocks_to_page_info(
             page_blocks, page_inline_formula, page_ocr_res,
-            image_dict, page, image_writer, index,
+            image_dict, page, image_exporter, index,
             _ocr_enable, _vlm_ocr_enable
         )
         middle_json["pdf_info"].append(page_info)
@@ -196,6 +204,9 @@ def result_to_middle_json(
                     span['content'] = ''
                     span['score'] = 0.0
 
+    if image_exporter:
+        image_exporter.flush(middle_json["pdf_info"])
+
     """表格跨页合并"""
     table_enable = get_table_enable(os.getenv('MINERU_VLM_TABLE_ENABLE', 'True').lower() == 'true')
     if table_enable:
@@ -6,6 +6,7 @@ from tqdm import tqdm
 from collections import defaultdict
 import numpy as np
 
+from .batch_controller import BatchSizeController
 from .model_init import AtomModelSingleton
 from .model_list import AtomicModel
 from ...utils.config_reader import get_formula_enable, get_table_enable
@@ -29,6 +30,7 @@ class BatchAnalyze:
         self.table_enable = get_table_enable(table_enable)
         self.model_manager = model_manager
         self.enable_ocr_det_batch = enable_ocr_det_batch
+        self.batch_controller = BatchSizeController()
 
     def __call__(self, images_with_extra_info: list) -> list:
         if len(images_with_extra_info) == 0:
@@ -49,21 +51,37 @@ class BatchAnalyze:
 
         # doclayout_yolo
 
-        images_layout_res += self.model.layout_model.batch_predict(
-            pil_images, YOLO_LAYOUT_BASE_BATCH_SIZE
+        images_layout_res += self.batch_controller.run(
+            self.model.device, "layout",
+            self.model.layout_model.batch_predict,
+            pil_images,
+            initial_batch_size=self.batch_ratio * YOLO_LAYOUT_BASE_BATCH_SIZE,
+            base_batch_size=YOLO_LAYOUT_BASE_BATCH_SIZE,
         )
 
         if self.formula_enable:
             # 公式检测
-            images_mfd_res = self.model.mfd_model.batch_predict(
-                np_images, MFD_BASE_BATCH_SIZE
+            images_mfd_res = self.batch_controller.run(
+                self.model.device, "mfd",
+                self.model.mfd_model.batch_predict,
+                np_images,
+                initial_batch_size=self.batch_ratio * MFD_BASE_BATCH_SIZE,
+                base_batch_size=MFD_BASE_BATCH_SIZE,
             )
 
             # 公式识别
-            images_formula_list = self.model.mfr_model.batch_predict(
-                images_mfd_res,
-                np_images,
-                batch_size=self.batch_ratio * MFR_BASE_BATCH_SIZE,
+            images_formula_list = self.batch_controller.run(
+                self.model.device, "mfr",
+                lambda batch_items, batch_size: self.model.mfr_model.batch_predict(
+                    [mfd_res for mfd_res, _ in batch_items],
+                    [np_image for _, np_image in batch_items],
+                    batch_size=batch_size,
+                ),
+                list(zip(images_mfd_res, np_images)),
+                initial_batch_size=self.batch_ratio * MFR_BASE_BATCH_SIZE,
+                base_batch_size=MFR_BASE_BATCH_SIZE,
+                # MFR的batch大小按公式数计算, 按页分批时以每页的公式检测框数量计入
+                item_size_fn=lambda item: len(item[0].boxes),
             )
             mfr_count = 0
             for image_index in range(len(np_images)):
@@ -306,8 +324,13 @@ class BatchAnalyze:
                         batch_images.append(padded_img)
 
                     # 批处理检测
-                    det_batch_size = min(len(batch_images), self.batch_ratio * OCR_DET_BASE_BATCH_SIZE)
-                    batch_results = ocr_model.text_detector.batch_predict(batch_images, det_batch_size)
+                    batch_results = self.batch_controller.run(
+                        self.model.device, "ocr_det",
+                        ocr_model.text_detector.batch_predict,
+                        batch_images,
+                        initial_batch_size=self.batch_ratio * OCR_DET_BASE_BATCH_SIZE,
+                        base_batch_size=OCR_DET_BASE_BATCH_SIZE,
+                    )
 
                     # 处理批处理结果
                     for crop_info, (dt_boxes, _) in zip(group_crops, batch_results):
@@ -402,7 +425,26 @@ class BatchAnalyze:
                         det_db_box_thresh=0.3,
                         lang=lang
                     )
-                    ocr_res_list = ocr_model.ocr(img_crop_list, det=False, tqdm_enable=True)[0]
+                    rec_batch_num = ocr_model.text_recognizer.rec_batch_num
+                    # batch倍率按显存选择, 非cuda设备上的显存估计不可靠(如mps取的是系统内存), 只用rec_batch_num作为初始大小
+                    rec_batch_ratio = self.batch_ratio if str(self.model.device).startswith('cuda') else 1
+                    # 先按宽高比整体排序再分批, 与识别模型内部的排序一致, 使宽度相近的文本行落在同一批
+                    rec_order = sorted(
+                        range(len(img_crop_list)),
+                        key=lambda i: img_crop_list[i].shape[1] / float(img_crop_list[i].shape[0])
+                    )
+                    sorted_ocr_res_list = self.batch_controller.run(
+                        self.model.device, "ocr_rec",
+                        lambda batch_items, batch_size: ocr_model.ocr(
+                            batch_items, det=False, tqdm_enable=True, rec_batch_num=batch_size
+                        )[0],
+                        [img_crop_list[i] for i in rec_order],
+                        initial_batch_size=rec_batch_ratio * rec_batch_num,
+                        base_batch_size=rec_batch_num,
+                    )
+                    ocr_res_list = [None] * len(img_crop_list)
+                    for i, ocr_res in zip(rec_order, sorted_ocr_res_list):
+                        ocr_res_list[i] = ocr_res
 
                     # Verify we have matching counts
                     assert len(ocr_res_list) == len(
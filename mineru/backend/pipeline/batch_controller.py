@@ -0,0 +1,109 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+
+import torch
+from loguru import logger
+
+from ...utils.model_utils import clean_memory, is_oom_error
+from ...utils.os_env_config import get_adaptive_batch_enable, get_adaptive_batch_target_utilization
+
+# 自适应增长时batch大小相对于基础batch大小的最大倍数
+MAX_BATCH_RATIO = 64
+
+
+class BatchSizeController:
+    """
+    按(device, stage)记录各推理阶段学习到的batch大小, 在多次调用之间保留。
+    - 某一批推理抛出OOM时清理显存并将batch大小减半, 只重试失败的这一批, 直到batch大小为1仍失败才抛出异常;
+    - cuda设备上若本次推理的显存峰值低于目标占用比例的一半, 且batch大小确实限制了并行度, 则将batch大小翻倍。
+    """
+    _instance = None
+    _batch_sizes = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def get_batch_size(self, device, stage: str, initial_batch_size: int) -> int:
+        key = (str(device), stage)
+        with self._lock:
+            if key not in self._batch_sizes:
+                self._batch_sizes[key] = max(1, initial_batch_size)
+            return self._batch_sizes[key]
+
+    def _set_batch_size(self, device, stage: str, batch_size: int):
+        with self._lock:
+            self._batch_sizes[(str(device), stage)] = batch_size
+
+    def run(
+            self, device, stage: str, predict_fn, items: list, initial_batch_size: int, base_batch_size: int,
+            item_size_fn=None,
+    ) -> list:
+        """
+        将items按学习到的batch大小分批, 逐批调用predict_fn(batch_items, batch_size), 按items的顺序返回每个样本的结果。
+        某一批抛出OOM时只将这一批按减半后的batch大小重新拆分重试, 之前已完成的批次不会重新推理。
+        item_size_fn返回单个样本计入batch大小的数量(例如一页中的公式数), 默认每个样本计为1。
+        """
+        if item_size_fn is None:
+            item_size_fn = _one
+        batch_size = self.get_batch_size(device, stage, initial_batch_size)
+        measure = get_adaptive_batch_enable() and _is_cuda_device(device)
+        if measure:
+            budget = _get_cuda_memory_budget(device)
+
+        results = []
+        total_size = 0
+        start = 0
+        while start < len(items):
+            # 至少放入一个样本, 单个样本超过batch大小时由predict_fn内部按batch_size分批
+            end = start + 1
+            size = item_size_fn(items[start])
+            while end < len(items) and size + item_size_fn(items[end]) <= batch_size:
+                size += item_size_fn(items[end])
+                end += 1
+            try:
+                batch_results = predict_fn(items[start:end], batch_size)
+            except Exception as e:
+                if not is_oom_error(e) or batch_size <= 1:
+                    raise
+                batch_size = batch_size // 2
+                self._set_batch_size(device, stage, batch_size)
+                logger.warning(f"{stage} out of memory on {device}, retry the failed batch with batch size {batch_size}")
+                clean_memory(device)
+                continue
+            results.extend(batch_results)
+            total_size += size
+            start = end
+
+        if measure and total_size > batch_size and batch_size * 2 <= base_batch_size * MAX_BATCH_RATIO:
+            peak = torch.cuda.max_memory_allocated(device)
+            if peak * 2 < budget * get_adaptive_batch_target_utilization():
+                self._set_batch_size(device, stage, batch_size * 2)
+                logger.debug(f"{stage} peak memory {peak / 1024 ** 3:.2f} GB, grow batch size to {batch_size * 2}")
+        return results
+
+
+def _one(item) -> int:
+    return 1
+
+
+def _is_cuda_device(device) -> bool:
+    return str(device).startswith("cuda") and torch.cuda.is_available()
+
+
+def _get_cuda_memory_budget(device) -> int:
+    """本进程可用的显存: 空闲显存加上本进程已缓存的显存, 同时重置峰值统计"""
+    free_memory, _ = torch.cuda.mem_get_info(device)
+    budget = free_memory + torch.cuda.memory_reserved(device)
+    torch.cuda.reset_peak_memory_stats(device)
+    return budget
+
+
+def get_free_vram(device) -> int | None:
+    """cuda设备当前可用显存(GB), 其他设备返回None"""
+    if not _is_cuda_device(device):
+        return None
+    free_memory, _ = torch.cuda.mem_get_info(device)
+    return round((free_memory + torch.cuda.memory_reserved(device)) / (1024 ** 3))
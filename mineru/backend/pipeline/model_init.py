@@ -17,6 +17,7 @@ from ...model.table.rec.unet_table.main import UnetTableModel
 from ...utils.config_reader import get_device
 from ...utils.enum_class import ModelPath
 from ...utils.models_download_utils import auto_download_and_get_model_root_path
+from ...utils.os_env_config import get_ocr_det_batch_enable
 
 MFR_MODEL = os.getenv('MINERU_FORMULA_CH_SUPPORT', 'False')
 if MFR_MODEL.lower() in ['true', '1', 'yes']:
@@ -294,19 +295,10 @@ class HybridModelSingleton:
         return self._models[key]
 
 def ocr_det_batch_setting(device):
-    # 检测torch的版本号
-    import torch
-    from packaging import version
-
-    device_type = os.getenv("MINERU_LMDEPLOY_DEVICE", "")
-
-    if (
-            version.parse(torch.__version__) >= version.parse("2.8.0")
-            or str(device).startswith('mps')
-            or device_type.lower() in ["corex"]
-    ):
-        enable_ocr_det_batch = False
-    else:
+    # 默认开启批量检测, 可通过MINERU_OCR_DET_BATCH_ENABLE强制开启或关闭;
+    # 批量前向的正确性由TextDetector按输入尺寸做的一致性检查保证, 不一致或报错的尺寸自动改为逐张前向
+    enable_ocr_det_batch = get_ocr_det_batch_enable()
+    if enable_ocr_det_batch is None:
         enable_ocr_det_batch = True
     return enable_ocr_det_batch
 
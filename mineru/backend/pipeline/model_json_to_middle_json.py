@@ -10,26 +10,36 @@ from mineru.utils.config_reader import get_device, get_llm_aided_config, get_for
 from mineru.backend.pipeline.model_init import AtomModelSingleton
 from mineru.backend.pipeline.para_split import para_split
 from mineru.utils.block_pre_proc import prepare_block_bboxes, process_groups
-from mineru.utils.block_sort import sort_blocks_by_bbox
+from mineru.utils.block_sort import batch_sort_blocks_by_bbox
 from mineru.utils.boxbase import calculate_overlap_area_in_bbox1_area_ratio
-from mineru.utils.cut_image import cut_image_and_table
+from mineru.utils.cut_image import cut_image_and_table, ImageExporter, get_page_img_id
 from mineru.utils.enum_class import ContentType
 from mineru.utils.llm_aided import llm_aided_title
 from mineru.utils.model_utils import clean_memory
 from mineru.backend.pipeline.pipeline_magic_model import MagicModel
 from mineru.utils.ocr_utils import OcrConfidence
+from mineru.utils.pdf_text_layer import get_doc_text_layer
 from mineru.utils.span_block_fix import fill_spans_in_blocks, fix_discarded_block, fix_block_spans
 from mineru.utils.span_pre_proc import remove_outside_spans, remove_overlaps_low_confidence_spans, \
     remove_overlaps_min_spans, txt_spans_extract
 from mineru.version import __version__
-from mineru.utils.hash_utils import bytes_md5
 
 
 def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer, page_index, ocr_enable=False, formula_enabled=True):
+    unsorted_page = page_model_info_to_unsorted_page(
+        page_model_info, image_dict, page, image_writer, page_index, ocr_enable=ocr_enable, formula_enabled=formula_enabled
+    )
+    if unsorted_page is None:
+        return None
+    return batch_sort_unsorted_pages([unsorted_page])[0]
+
+
+def page_model_info_to_unsorted_page(page_model_info, image_dict, page, image_writer, page_index, ocr_enable=False, formula_enabled=True):
+    """完成排序之前的所有页面处理, 排序由batch_sort_unsorted_pages对多个页面统一进行"""
     scale = image_dict["scale"]
     page_pil_img = image_dict["img_pil"]
     # page_img_md5 = str_md5(image_dict["img_base64"])
-    page_img_md5 = bytes_md5(page_pil_img.tobytes())
+    page_img_md5 = get_page_img_id(page_pil_img, page, page_index, scale)
     page_w, page_h = map(int, page.get_size())
     magic_model = MagicModel(page_model_info, scale)
 
@@ -139,7 +149,9 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
         pass
     else:
         """使用新版本的混合ocr方案."""
-        spans = txt_spans_extract(page, spans, page_pil_img, scale, all_bboxes, all_discarded_blocks)
+        # 文本层在推理期间已由渲染进程池预取, 类型判断加载过的页面复用其textpage
+        text_layer = get_doc_text_layer(page.pdf).take_page(page_index)
+        spans = txt_spans_extract(page, spans, page_pil_img, scale, all_bboxes, all_discarded_blocks, text_layer)
 
     """先处理不需要排版的discarded_blocks"""
     discarded_block_with_spans, spans = fill_spans_in_blocks(
@@ -164,34 +176,99 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
     """对block进行fix操作"""
     fix_blocks = fix_block_spans(block_with_spans)
 
-    """对block进行排序"""
-    sorted_blocks = sort_blocks_by_bbox(fix_blocks, page_w, page_h, footnote_blocks)
+    return {
+        'fix_blocks': fix_blocks,
+        'footnote_blocks': footnote_blocks,
+        'fix_discarded_blocks': fix_discarded_blocks,
+        'page_index': page_index,
+        'page_w': page_w,
+        'page_h': page_h,
+    }
 
-    """构造page_info"""
-    page_info = make_page_info_dict(sorted_blocks, page_index, page_w, page_h, fix_discarded_blocks)
 
-    return page_info
+def batch_sort_unsorted_pages(unsorted_pages):
+    """对block进行排序, 多个页面的layoutreader推理合并为批量推理, 返回page_info列表"""
+    sorted_blocks_list = batch_sort_blocks_by_bbox([
+        (page['fix_blocks'], page['page_w'], page['page_h'], page['footnote_blocks'])
+        for page in unsorted_pages
+    ])
+
+    """构造page_info"""
+    return [
+        make_page_info_dict(sorted_blocks, page['page_index'], page['page_w'], page['page_h'], page['fix_discarded_blocks'])
+        for page, sorted_blocks in zip(unsorted_pages, sorted_blocks_list)
+    ]
 
 
 def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=None, ocr_enable=False, formula_enabled=True):
-    middle_json = {"pdf_info": [], "_backend":"pipeline", "_version_name": __version__}
+    middle_json = init_middle_json()
+    append_batch_results_to_middle_json(
+        middle_json, model_list, images_list, pdf_doc, image_writer,
+        lang=lang, ocr_enable=ocr_enable, formula_enabled=formula_enabled,
+    )
+    finalize_middle_json(middle_json)
+
+    """清理内存"""
+    pdf_doc.close()
+    if os.getenv('MINERU_DONOT_CLEAN_MEM') is None and len(model_list) >= 10:
+        clean_memory(get_device())
+
+    return middle_json
+
+
+def init_middle_json():
+    return {"pdf_info": [], "_backend":"pipeline", "_version_name": __version__}
+
+
+def append_batch_results_to_middle_json(
+        middle_json,
+        model_list,
+        images_list,
+        pdf_doc,
+        image_writer,
+        page_start_index=0,
+        lang=None,
+        ocr_enable=False,
+        formula_enabled=True,
+):
+    """将一段连续页面(从page_start_index开始)的模型结果转换为page_info并追加到middle_json中,
+    流式处理时每个窗口调用一次, 图片可在调用结束后立即释放"""
     formula_enabled = get_formula_enable(formula_enabled)
-    for page_index, page_model_info in tqdm(enumerate(model_list), total=len(model_list), desc="Processing pages"):
+    # 图片的裁剪、编码和写入在线程池中进行, 与版面排序和后置ocr并行
+    image_exporter = ImageExporter(image_writer) if image_writer else image_writer
+    batch_page_info_list = []
+    unsorted_pages = []
+    unsorted_positions = []
+    # doc_analyze逐页判断是否使用OCR, 结果记录在pdf_doc上, 没有时使用文档级的ocr_enable
+    page_ocr_enable_list = getattr(pdf_doc, '_mineru_page_ocr_enable', None)
+    for batch_index, page_model_info in tqdm(enumerate(model_list), total=len(model_list), desc="Processing pages"):
+        page_index = page_start_index + batch_index
         page = pdf_doc[page_index]
-        image_dict = images_list[page_index]
-        page_info = page_model_info_to_page_info(
-            page_model_info, image_dict, page, image_writer, page_index, ocr_enable=ocr_enable, formula_enabled=formula_enabled
+        image_dict = images_list[batch_index]
+        page_ocr_enable = ocr_enable
+        if page_ocr_enable_list is not None and page_ocr_enable_list[page_index] is not None:
+            page_ocr_enable = page_ocr_enable_list[page_index]
+        unsorted_page = page_model_info_to_unsorted_page(
+            page_model_info, image_dict, page, image_exporter, page_index, ocr_enable=page_ocr_enable, formula_enabled=formula_enabled
         )
-        if page_info is None:
+        if unsorted_page is None:
             page_w, page_h = map(int, page.get_size())
-            page_info = make_page_info_dict([], page_index, page_w, page_h, [])
-        middle_json["pdf_info"].append(page_info)
+            batch_page_info_list.append(make_page_info_dict([], page_index, page_w, page_h, []))
+        else:
+            unsorted_positions.append(len(batch_page_info_list))
+            unsorted_pages.append(unsorted_page)
+            batch_page_info_list.append(None)
+
+    """阅读顺序排序, 所有页面的layoutreader推理批量进行"""
+    if unsorted_pages:
+        for position, page_info in zip(unsorted_positions, batch_sort_unsorted_pages(unsorted_pages)):
+            batch_page_info_list[position] = page_info
 
     """后置ocr处理"""
     need_ocr_list = []
     img_crop_list = []
     text_block_list = []
-    for page_info in middle_json["pdf_info"]:
+    for page_info in batch_page_info_list:
         for block in page_info['preproc_blocks']:
             if block['type'] in ['table', 'image']:
                 for sub_block in block['blocks']:
@@ -227,6 +304,16 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
                 span['content'] = ''
                 span['score'] = 0.0
 
+    if image_exporter:
+        image_exporter.flush(batch_page_info_list)
+
+    middle_json["pdf_info"].extend(batch_page_info_list)
+    return middle_json
+
+
+def finalize_middle_json(middle_json):
+    """所有页面追加完成后执行的跨页后处理, 仅依赖page_info, 不需要页面图片"""
+
     """分段"""
     para_split(middle_json["pdf_info"])
 
@@ -245,11 +332,6 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
                 llm_aided_title(middle_json["pdf_info"], title_aided_config)
                 logger.info(f'llm aided title time: {round(time.time() - llm_aided_title_start_time, 2)}')
 
-    """清理内存"""
-    pdf_doc.close()
-    if os.getenv('MINERU_DONOT_CLEAN_MEM') is None and len(model_list) >= 10:
-        clean_memory(get_device())
-
     return middle_json
 
 
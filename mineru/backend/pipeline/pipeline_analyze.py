@@ -1,15 +1,24 @@
+import copy
 import os
 import time
-from typing import List, Tuple
+from typing import Callable, List, Tuple
+
+import pypdfium2 as pdfium
 from PIL import Image
 from loguru import logger
 
-from .model_init import MineruPipelineModel
+from .model_init import MineruPipelineModel, ocr_det_batch_setting
 from mineru.utils.config_reader import get_device
 from ...utils.enum_class import ImageType
-from ...utils.pdf_classify import classify
-from ...utils.pdf_image_tools import load_images_from_pdf
+from ...utils.hash_utils import bytes_md5
+from ...utils.parse_cache import get_page_model_cache, make_page_model_cache_key
+from ...utils.pdf_classify import classify, classify_doc
+from ...utils.cut_image import set_pdf_doc_key
+from ...utils.pdf_image_tools import iter_prefetch_windows, load_images_by_windows
+from ...utils.pdf_text_layer import get_doc_text_layer
 from ...utils.model_utils import get_vram, clean_memory
+from ...utils.os_env_config import get_pipeline_window_size, get_min_batch_inference_size, \
+    get_adaptive_batch_enable
 
 
 os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'  # 让mps可以fallback
@@ -77,63 +86,71 @@ def doc_analyze(
     """
     适当调大MIN_BATCH_INFERENCE_SIZE可以提高性能，更大的 MIN_BATCH_INFERENCE_SIZE会消耗更多内存，
     可通过环境变量MINERU_MIN_BATCH_INFERENCE_SIZE设置，默认值为384。
+    页面按批渲染，下一批的渲染与当前批的推理并行进行，预取深度可通过环境变量MINERU_PDF_RENDER_PREFETCH_DEPTH设置。
+    预取时第一批只有MINERU_PDF_RENDER_CHUNK_SIZE页，之后逐批翻倍直到MIN_BATCH_INFERENCE_SIZE。
     """
-    min_batch_inference_size = int(os.environ.get('MINERU_MIN_BATCH_INFERENCE_SIZE', 384))
+    min_batch_inference_size = get_min_batch_inference_size()
 
     # 收集所有页面信息
     all_pages_info = []  # 存储(dataset_index, page_index, img, ocr, lang, width, height)
 
-    all_image_lists = []
-    all_pdf_docs = []
-    ocr_enabled_list = []
-    load_images_start = time.time()
-    for pdf_idx, pdf_bytes in enumerate(pdf_bytes_list):
-        # 确定OCR设置
-        _ocr_enable = False
-        if parse_method == 'auto':
-            if classify(pdf_bytes) == 'ocr':
-                _ocr_enable = True
-        elif parse_method == 'ocr':
-            _ocr_enable = True
+    all_pdf_docs = [set_pdf_doc_key(pdfium.PdfDocument(pdf_bytes), pdf_bytes) for pdf_bytes in pdf_bytes_list]
+    page_count_list = [len(pdf_doc) for pdf_doc in all_pdf_docs]
+    all_image_lists = [[] for _ in pdf_bytes_list]
+    # 确定OCR设置, 文档级结果用于返回, 推理和构建middle_json时使用逐页结果
+    ocr_enabled_list, page_ocr_enabled_lists, page_classify_doc_types = get_page_ocr_enabled_lists(
+        pdf_bytes_list, all_pdf_docs, parse_method
+    )
 
-        ocr_enabled_list.append(_ocr_enable)
-        _lang = lang_list[pdf_idx]
-
-        # 收集每个数据集中的页面
-        images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
-        all_image_lists.append(images_list)
-        all_pdf_docs.append(pdf_doc)
-        for page_idx in range(len(images_list)):
-            img_dict = images_list[page_idx]
-            all_pages_info.append((
-                pdf_idx, page_idx,
-                img_dict['img_pil'], _ocr_enable, _lang,
-            ))
-    load_images_time = round(time.time() - load_images_start, 2)
-    logger.debug(f"load images cost: {load_images_time}, speed: {round(len(all_pages_info) / load_images_time, 3)} images/s")
-
-    # 准备批处理
-    images_with_extra_info = [(info[2], info[3], info[4]) for info in all_pages_info]
-    batch_size = min_batch_inference_size
-    batch_images = [
-        images_with_extra_info[i:i + batch_size]
-        for i in range(0, len(images_with_extra_info), batch_size)
-    ]
+    total_pages = sum(page_count_list)
 
-    # 执行批处理
+    # 执行批处理, 渲染由后台线程预取
     results = []
     processed_images_count = 0
-    infer_start = time.time()
-    for index, batch_image in enumerate(batch_images):
+    infer_time = 0
+    analyze_start = time.time()
+    windows = list(iter_prefetch_windows(page_count_list, min_batch_inference_size))
+    batch_count = len(windows)
+    if windows:
+        prefetch_page_types(all_pdf_docs, pdf_bytes_list, page_classify_doc_types, windows[0])
+    doc_keys = [pdf_doc._mineru_doc_key for pdf_doc in all_pdf_docs]
+    window_iter = load_images_by_windows(pdf_bytes_list, windows, doc_keys=doc_keys)
+    for index, (window, window_images) in enumerate(window_iter):
+        # 下一个窗口的页面类型判断与当前窗口的推理并行
+        if index + 1 < len(windows):
+            prefetch_page_types(all_pdf_docs, pdf_bytes_list, page_classify_doc_types, windows[index + 1])
+        resolve_page_ocr_enable(all_pdf_docs, page_ocr_enabled_lists, page_classify_doc_types, window)
+        batch_image = []
+        for (pdf_idx, start_page_id, end_page_id), images_list in zip(window, window_images):
+            all_image_lists[pdf_idx].extend(images_list)
+            prefetch_text_layer(
+                all_pdf_docs[pdf_idx], pdf_bytes_list[pdf_idx], page_ocr_enabled_lists[pdf_idx], start_page_id, end_page_id
+            )
+            _lang = lang_list[pdf_idx]
+            for offset, img_dict in enumerate(images_list):
+                _ocr_enable = page_ocr_enabled_lists[pdf_idx][start_page_id + offset]
+                all_pages_info.append((
+                    pdf_idx, start_page_id + offset,
+                    img_dict['img_pil'], _ocr_enable, _lang,
+                ))
+                batch_image.append((img_dict['img_pil'], _ocr_enable, _lang))
+
         processed_images_count += len(batch_image)
         logger.info(
-            f'Batch {index + 1}/{len(batch_images)}: '
-            f'{processed_images_count} pages/{len(images_with_extra_info)} pages'
+            f'Batch {index + 1}/{batch_count}: '
+            f'{processed_images_count} pages/{total_pages} pages'
         )
+        infer_start = time.time()
         batch_results = batch_image_analyze(batch_image, formula_enable, table_enable)
+        infer_time += time.time() - infer_start
         results.extend(batch_results)
-    infer_time = round(time.time() - infer_start, 2)
-    logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results) / infer_time, 3)} page/s")
+    analyze_time = round(time.time() - analyze_start, 2)
+    infer_time = round(infer_time, 2)
+    if analyze_time > 0:
+        logger.debug(
+            f"analyze finished, cost: {analyze_time}, infer cost: {infer_time}, "
+            f"speed: {round(len(results) / analyze_time, 3)} page/s"
+        )
 
     # 构建返回结果
     infer_results = []
@@ -142,7 +159,7 @@ def doc_analyze(
         infer_results.append([])
 
     for i, page_info in enumerate(all_pages_info):
-        pdf_idx, page_idx, pil_img, _, _ = page_info
+        pdf_idx, page_idx, pil_img, _ocr_enable, _ = page_info
         result = results[i]
 
         page_info_dict = {'page_no': page_idx, 'width': pil_img.width, 'height': pil_img.height}
@@ -153,12 +170,228 @@ def doc_analyze(
     return infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list
 
 
+def get_ocr_enable(pdf_bytes, parse_method: str = 'auto', pdf_doc=None) -> bool:
+    """pdf_doc为pdf_bytes已打开的文档, 传入时类型判断加载的文本层会保留给后续提取文本使用"""
+    _ocr_enable = False
+    if parse_method == 'auto':
+        if classify(pdf_bytes, pdf_doc) == 'ocr':
+            _ocr_enable = True
+    elif parse_method == 'ocr':
+        _ocr_enable = True
+    if _ocr_enable and pdf_doc is not None:
+        # ocr模式不使用文本层, 释放类型判断时加载的textpage
+        get_doc_text_layer(pdf_doc).clear()
+    return _ocr_enable
+
+
+def get_page_ocr_enabled_lists(pdf_bytes_list, pdf_docs, parse_method: str = 'auto'):
+    """
+    返回(每个文档的ocr开关, 每个文档逐页的ocr开关, 每个文档逐页判断时沿用的文档类型)。
+    auto模式下逐页判断, 扫描页使用OCR, 文本页直接提取文本, 无法单独判断的页面沿用文档级结果,
+    这样少量扫描页不会让整个文档都走OCR, 文本文档中的扫描页也不会因为没有文本层而内容为空。
+    逐页判断按窗口在渲染进程池中进行(见prefetch_page_types), 判断完成前逐页的ocr开关为None。
+    文档因乱码被判定为ocr时不做逐页判断, 所有页面都使用OCR, 对应的文档类型为None。
+    """
+    ocr_enabled_list = []
+    page_ocr_enabled_lists = []
+    page_classify_doc_types = []
+    for pdf_bytes, pdf_doc in zip(pdf_bytes_list, pdf_docs):
+        page_classify_doc_type = None
+        if parse_method == 'auto':
+            doc_type, is_garbled = classify_doc(pdf_bytes, pdf_doc)
+            _ocr_enable = doc_type == 'ocr'
+            if not is_garbled:
+                page_classify_doc_type = doc_type
+        else:
+            _ocr_enable = parse_method == 'ocr'
+
+        if page_classify_doc_type is None:
+            page_ocr_enabled_list = [_ocr_enable] * len(pdf_doc)
+            if _ocr_enable:
+                # 所有页面都不使用文本层, 释放类型判断时加载的textpage
+                get_doc_text_layer(pdf_doc).clear()
+        else:
+            page_ocr_enabled_list = [None] * len(pdf_doc)
+        # 逐页结果记录在pdf_doc上供构建middle_json时使用, 不写入模型输出的page_info, 保持model.json格式不变
+        pdf_doc._mineru_page_ocr_enable = page_ocr_enabled_list
+        ocr_enabled_list.append(_ocr_enable)
+        page_ocr_enabled_lists.append(page_ocr_enabled_list)
+        page_classify_doc_types.append(page_classify_doc_type)
+    return ocr_enabled_list, page_ocr_enabled_lists, page_classify_doc_types
+
+
+def prefetch_page_types(pdf_docs, pdf_bytes_list, page_classify_doc_types, window):
+    """在渲染进程池中逐页判断窗口内页面的类型, 同时提取txt页面的文本层"""
+    for pdf_idx, start_page_id, end_page_id in window:
+        doc_type = page_classify_doc_types[pdf_idx]
+        if doc_type is not None:
+            get_doc_text_layer(pdf_docs[pdf_idx]).prefetch_page_types(
+                pdf_bytes_list[pdf_idx], range(start_page_id, end_page_id + 1), doc_type
+            )
+
+
+def resolve_page_ocr_enable(pdf_docs, page_ocr_enabled_lists, page_classify_doc_types, window):
+    """取得窗口内页面的类型并填入逐页的ocr开关, 需在该窗口推理之前调用"""
+    for pdf_idx, start_page_id, end_page_id in window:
+        doc_type = page_classify_doc_types[pdf_idx]
+        if doc_type is None:
+            continue
+        doc_text_layer = get_doc_text_layer(pdf_docs[pdf_idx])
+        page_ocr_enabled_list = page_ocr_enabled_lists[pdf_idx]
+        for page_index in range(start_page_id, end_page_id + 1):
+            page_ocr_enabled_list[page_index] = doc_text_layer.get_page_type(page_index, doc_type) == 'ocr'
+        if end_page_id == len(page_ocr_enabled_list) - 1:
+            ocr_page_count = sum(page_ocr_enabled_list)
+            if 0 < ocr_page_count < len(page_ocr_enabled_list):
+                logger.info(f'{ocr_page_count}/{len(page_ocr_enabled_list)} pages use OCR')
+
+
+def prefetch_text_layer(pdf_doc, pdf_bytes, page_ocr_enabled_list, start_page_id, end_page_id):
+    """在渲染进程池中提取[start_page_id, end_page_id]内不使用OCR的页面的文本层, 与当前批的推理并行"""
+    txt_page_indices = [
+        page_index for page_index in range(start_page_id, end_page_id + 1) if not page_ocr_enabled_list[page_index]
+    ]
+    if txt_page_indices:
+        get_doc_text_layer(pdf_doc).prefetch(pdf_bytes, txt_page_indices)
+
+
+def doc_analyze_streaming(
+        pdf_bytes_list,
+        image_writer_list,
+        lang_list,
+        on_doc_ready: Callable,
+        parse_method: str = 'auto',
+        formula_enable=True,
+        table_enable=True,
+        window_size: int | None = None,
+):
+    """
+    流式版本的doc_analyze, 渲染、推理、middle_json构建按固定大小的页面窗口进行,
+    内存峰值由窗口大小决定而与文档页数无关。
+    每个文档的最后一个窗口处理完成后立即调用 on_doc_ready(pdf_idx, model_list, middle_json),
+    调用方可在回调中写出该文档的结果。
+    窗口大小可通过环境变量MINERU_PIPELINE_WINDOW_SIZE设置，未设置时使用MINERU_MIN_BATCH_INFERENCE_SIZE。
+    """
+    from .model_json_to_middle_json import init_middle_json, append_batch_results_to_middle_json, \
+        finalize_middle_json
+
+    if window_size is None:
+        window_size = get_pipeline_window_size() or get_min_batch_inference_size()
+
+    pdf_docs = [set_pdf_doc_key(pdfium.PdfDocument(pdf_bytes), pdf_bytes) for pdf_bytes in pdf_bytes_list]
+    page_count_list = [len(pdf_doc) for pdf_doc in pdf_docs]
+    ocr_enabled_list, page_ocr_enabled_lists, page_classify_doc_types = get_page_ocr_enabled_lists(
+        pdf_bytes_list, pdf_docs, parse_method
+    )
+    model_lists = [[] for _ in pdf_bytes_list]
+    middle_jsons = [init_middle_json() for _ in pdf_bytes_list]
+
+    # 空文档不会出现在任何窗口中, 直接回调
+    for pdf_idx, page_count in enumerate(page_count_list):
+        if page_count == 0:
+            on_doc_ready(pdf_idx, model_lists[pdf_idx], finalize_middle_json(middle_jsons[pdf_idx]))
+            pdf_docs[pdf_idx].close()
+
+    total_pages = sum(page_count_list)
+    processed_pages_count = 0
+    stream_start = time.time()
+    windows = list(iter_prefetch_windows(page_count_list, window_size))
+    if windows:
+        prefetch_page_types(pdf_docs, pdf_bytes_list, page_classify_doc_types, windows[0])
+    # 渲染由后台线程预取, 下一个窗口的渲染与当前窗口的推理并行
+    doc_keys = [pdf_doc._mineru_doc_key for pdf_doc in pdf_docs]
+    window_iter = load_images_by_windows(pdf_bytes_list, windows, doc_keys=doc_keys)
+    for index, (window, window_images) in enumerate(window_iter):
+        # 下一个窗口的页面类型判断与当前窗口的推理并行
+        if index + 1 < len(windows):
+            prefetch_page_types(pdf_docs, pdf_bytes_list, page_classify_doc_types, windows[index + 1])
+        resolve_page_ocr_enable(pdf_docs, page_ocr_enabled_lists, page_classify_doc_types, window)
+        # 文本层提取与当前窗口的推理并行
+        for pdf_idx, start_page_id, end_page_id in window:
+            prefetch_text_layer(
+                pdf_docs[pdf_idx], pdf_bytes_list[pdf_idx], page_ocr_enabled_lists[pdf_idx], start_page_id, end_page_id
+            )
+        images_with_extra_info = [
+            (img_dict['img_pil'], page_ocr_enabled_lists[pdf_idx][start_page_id + offset], lang_list[pdf_idx])
+            for (pdf_idx, start_page_id, _), images_list in zip(window, window_images)
+            for offset, img_dict in enumerate(images_list)
+        ]
+        processed_pages_count += len(images_with_extra_info)
+        logger.info(f'Window: {processed_pages_count} pages/{total_pages} pages')
+        window_results = batch_image_analyze(images_with_extra_info, formula_enable, table_enable)
+
+        # 将窗口内的结果分发回各文档
+        result_index = 0
+        for (pdf_idx, start_page_id, end_page_id), images_list in zip(window, window_images):
+            segment_model_list = []
+            for offset, img_dict in enumerate(images_list):
+                pil_img = img_dict['img_pil']
+                page_index = start_page_id + offset
+                page_info_dict = {'page_no': page_index, 'width': pil_img.width, 'height': pil_img.height}
+                segment_model_list.append({'layout_dets': window_results[result_index], 'page_info': page_info_dict})
+                result_index += 1
+
+            model_lists[pdf_idx].extend(copy.deepcopy(segment_model_list))
+            append_batch_results_to_middle_json(
+                middle_jsons[pdf_idx], segment_model_list, images_list, pdf_docs[pdf_idx],
+                image_writer_list[pdf_idx], page_start_index=start_page_id,
+                lang=lang_list[pdf_idx], ocr_enable=ocr_enabled_list[pdf_idx], formula_enabled=formula_enable,
+            )
+
+            if end_page_id == page_count_list[pdf_idx] - 1:
+                on_doc_ready(pdf_idx, model_lists[pdf_idx], finalize_middle_json(middle_jsons[pdf_idx]))
+                pdf_docs[pdf_idx].close()
+                # 已回调的文档不再持有结果
+                model_lists[pdf_idx] = None
+                middle_jsons[pdf_idx] = None
+
+        del window_images, images_with_extra_info, window_results
+
+    stream_time = round(time.time() - stream_start, 2)
+    if stream_time > 0:
+        logger.debug(f"streaming analyze finished, cost: {stream_time}, speed: {round(total_pages / stream_time, 3)} page/s")
+
+    return ocr_enabled_list
+
+
 def batch_image_analyze(
         images_with_extra_info: List[Tuple[Image.Image, bool, str]],
         formula_enable=True,
         table_enable=True):
+    """
+    设置MINERU_PARSE_CACHE_DIR后, 按页面图像内容缓存每页的模型输出,
+    之前推理过的页面(如重新解析部分页码范围、中途失败后重跑)直接使用缓存结果。
+    """
+    page_model_cache = get_page_model_cache()
+    if page_model_cache is None:
+        return _batch_image_analyze(images_with_extra_info, formula_enable, table_enable)
+
+    cache_keys = [
+        make_page_model_cache_key(bytes_md5(pil_img.tobytes()), ocr_enable, lang, formula_enable, table_enable)
+        for pil_img, ocr_enable, lang in images_with_extra_info
+    ]
+    results = [page_model_cache.get(cache_key) for cache_key in cache_keys]
+    miss_indices = [i for i, result in enumerate(results) if result is None]
+    if len(miss_indices) < len(results):
+        logger.info(f'Page model cache hit: {len(results) - len(miss_indices)}/{len(results)} pages')
+    if miss_indices:
+        miss_results = _batch_image_analyze(
+            [images_with_extra_info[i] for i in miss_indices], formula_enable, table_enable
+        )
+        # 推理结果在后续构建middle_json时会被修改, 先写入缓存
+        page_model_cache.put_many([(cache_keys[i], result) for i, result in zip(miss_indices, miss_results)])
+        for i, result in zip(miss_indices, miss_results):
+            results[i] = result
+    return results
+
+
+def _batch_image_analyze(
+        images_with_extra_info: List[Tuple[Image.Image, bool, str]],
+        formula_enable=True,
+        table_enable=True):
 
     from .batch_analyze import BatchAnalyze
+    from .batch_controller import get_free_vram
 
     model_manager = ModelSingleton()
 
@@ -176,6 +409,11 @@ def batch_image_analyze(
             ) from e
 
     gpu_memory = get_vram(device)
+    if get_adaptive_batch_enable() and os.getenv("MINERU_VIRTUAL_VRAM_SIZE") is None:
+        # 按当前可用显存而非总显存选择初始batch倍率, 避免与其他进程共享显卡时OOM
+        free_memory = get_free_vram(device)
+        if free_memory is not None:
+            gpu_memory = min(gpu_memory, free_memory)
     if gpu_memory >= 16:
         batch_ratio = 16
     elif gpu_memory >= 12:
@@ -190,18 +428,7 @@ def batch_image_analyze(
             f'GPU Memory: {gpu_memory} GB, Batch Ratio: {batch_ratio}. '
     )
 
-    # 检测torch的版本号
-    import torch
-    from packaging import version
-    device_type = os.getenv("MINERU_LMDEPLOY_DEVICE", "")
-    if (
-            version.parse(torch.__version__) >= version.parse("2.8.0")
-            or str(device).startswith('mps')
-            or device_type.lower() in ["corex"]
-    ):
-        enable_ocr_det_batch = False
-    else:
-        enable_ocr_det_batch = True
+    enable_ocr_det_batch = ocr_det_batch_setting(device)
 
     batch_model = BatchAnalyze(model_manager, batch_ratio, formula_enable, table_enable, enable_ocr_det_batch)
     results = batch_model(images_with_extra_info)
@@ -8,9 +8,8 @@ from loguru import logger
 from mineru.backend.utils import cross_page_table_merge
 from mineru.backend.vlm.vlm_magic_model import MagicModel
 from mineru.utils.config_reader import get_table_enable, get_llm_aided_config
-from mineru.utils.cut_image import cut_image_and_table
+from mineru.utils.cut_image import cut_image_and_table, ImageExporter, get_page_img_id
 from mineru.utils.enum_class import ContentType
-from mineru.utils.hash_utils import bytes_md5
 from mineru.utils.pdf_image_tools import get_crop_img
 from mineru.version import __version__
 
@@ -35,7 +34,7 @@ def blocks_to_page_info(page_blocks, image_dict, page, image_writer, page_index)
     scale = image_dict["scale"]
     # page_pil_img = image_dict["img_pil"]
     page_pil_img = image_dict["img_pil"]
-    page_img_md5 = bytes_md5(page_pil_img.tobytes())
+    page_img_md5 = get_page_img_id(page_pil_img, page, page_index, scale)
     width, height = map(int, page.get_size())
 
     magic_model = MagicModel(page_blocks, width, height)
@@ -101,11 +100,15 @@ def blocks_to_page_info(page_blocks, image_dict, page, image_writer, page_index)
 
 def result_to_middle_json(model_output_blocks_list, images_list, pdf_doc, image_writer):
     middle_json = {"pdf_info": [], "_backend":"vlm", "_version_name": __version__}
+    # 图片的裁剪、编码和写入在线程池中进行, 与后续页面的处理并行
+    image_exporter = ImageExporter(image_writer) if image_writer else image_writer
     for index, page_blocks in enumerate(model_output_blocks_list):
         page = pdf_doc[index]
         image_dict = images_list[index]
-        page_info = blocks_to_page_info(page_blocks, image_dict, page, image_writer, index)
+        page_info = blocks_to_page_info(page_blocks, image_dict, page, image_exporter, index)
         middle_json["pdf_info"].append(page_info)
+    if image_exporter:
+        image_exporter.flush(middle_json["pdf_info"])
 
     """表格跨页合并"""
     table_enable = get_table_enable(os.getenv('MINERU_VLM_TABLE_ENABLE', 'True').lower() == 'true')
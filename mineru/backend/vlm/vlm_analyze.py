@@ -3,17 +3,19 @@ import os
 import time
 import json
 
+import pypdfium2 as pdfium
 from loguru import logger
 
 from .utils import enable_custom_logits_processors, set_default_gpu_memory_utilization, set_default_batch_size, \
     set_lmdeploy_backend, mod_kwargs_by_device_type
 from .model_output_to_middle_json import result_to_middle_json
 from ...data.data_reader_writer import DataWriter
-from mineru.utils.pdf_image_tools import load_images_from_pdf
+from mineru.utils.cut_image import set_pdf_doc_key
+from mineru.utils.pdf_image_tools import AsyncWindowIterator, iter_prefetch_windows, load_images_by_windows
 from ...utils.check_sys_env import is_mac_os_version_supported
 from ...utils.config_reader import get_device
+from ...utils.os_env_config import get_min_batch_inference_size
 
-from ...utils.enum_class import ImageType
 from ...utils.models_download_utils import auto_download_and_get_model_root_path
 
 from mineru_vl_utils import MinerUClient
@@ -231,16 +233,20 @@ def doc_analyze(
     if predictor is None:
         predictor = ModelSingleton().get_model(backend, model_path, server_url, **kwargs)
 
-    load_images_start = time.time()
-    images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
-    images_pil_list = [image_dict["img_pil"] for image_dict in images_list]
-    load_images_time = round(time.time() - load_images_start, 2)
-    logger.debug(f"load images cost: {load_images_time}, speed: {round(len(images_pil_list)/load_images_time, 3)} images/s")
-
+    # 分批渲染, 后台线程预取下一批页面, 渲染与推理并行
+    pdf_doc = set_pdf_doc_key(pdfium.PdfDocument(pdf_bytes), pdf_bytes)
+    windows = iter_prefetch_windows([len(pdf_doc)], get_min_batch_inference_size())
+    images_list = []
+    results = []
     infer_start = time.time()
-    results = predictor.batch_two_step_extract(images=images_pil_list)
+    window_iter = load_images_by_windows([pdf_bytes], windows, doc_keys=[pdf_doc._mineru_doc_key])
+    for _, (window_images,) in window_iter:
+        images_list.extend(window_images)
+        images_pil_list = [image_dict["img_pil"] for image_dict in window_images]
+        results.extend(predictor.batch_two_step_extract(images=images_pil_list))
     infer_time = round(time.time() - infer_start, 2)
-    logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
+    if infer_time > 0:
+        logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
 
     middle_json = result_to_middle_json(results, images_list, pdf_doc, image_writer)
     return middle_json, results
@@ -258,15 +264,24 @@ async def aio_doc_analyze(
     if predictor is None:
         predictor = ModelSingleton().get_model(backend, model_path, server_url, **kwargs)
 
-    load_images_start = time.time()
-    images_list, pdf_doc = load_images_from_pdf(pdf_bytes, image_type=ImageType.PIL)
-    images_pil_list = [image_dict["img_pil"] for image_dict in images_list]
-    load_images_time = round(time.time() - load_images_start, 2)
-    logger.debug(f"load images cost: {load_images_time}, speed: {round(len(images_pil_list)/load_images_time, 3)} images/s")
-
+    # 分批渲染, 后台线程预取下一批页面, 渲染与推理并行
+    pdf_doc = set_pdf_doc_key(pdfium.PdfDocument(pdf_bytes), pdf_bytes)
+    windows = iter_prefetch_windows([len(pdf_doc)], get_min_batch_inference_size())
+    window_iter = load_images_by_windows([pdf_bytes], windows, doc_keys=[pdf_doc._mineru_doc_key])
+    images_list = []
+    results = []
     infer_start = time.time()
-    results = await predictor.aio_batch_two_step_extract(images=images_pil_list)
+    async_window_iter = AsyncWindowIterator(window_iter)
+    try:
+        while (item := await async_window_iter.next()) is not None:
+            _, (window_images,) = item
+            images_list.extend(window_images)
+            images_pil_list = [image_dict["img_pil"] for image_dict in window_images]
+            results.extend(await predictor.aio_batch_two_step_extract(images=images_pil_list))
+    finally:
+        await async_window_iter.close()
     infer_time = round(time.time() - infer_start, 2)
-    logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
+    if infer_time > 0:
+        logger.debug(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
     middle_json = result_to_middle_json(results, images_list, pdf_doc, image_writer)
     return middle_json, results
@@ -7,6 +7,7 @@ from pathlib import Path
 
 from loguru import logger
 import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 
 from mineru.data.data_reader_writer import FileBasedDataWriter
 from mineru.utils.draw_bbox import draw_layout_bbox, draw_span_bbox, draw_line_sort_bbox
@@ -17,6 +18,8 @@ from mineru.utils.pdf_image_tools import images_bytes_to_pdf_bytes
 from mineru.backend.vlm.vlm_middle_json_mkcontent import union_make as vlm_union_make
 from mineru.backend.vlm.vlm_analyze import doc_analyze as vlm_doc_analyze
 from mineru.backend.vlm.vlm_analyze import aio_doc_analyze as aio_vlm_doc_analyze
+from mineru.utils.os_env_config import get_pipeline_window_size
+from mineru.utils.parse_cache import get_parse_cache, make_parse_cache_key
 from mineru.utils.pdf_page_id import get_end_page_id
 
 if os.getenv("MINERU_LMDEPLOY_DEVICE", "") == "maca":
@@ -51,22 +54,48 @@ def prepare_env(output_dir, pdf_file_name, parse_method):
     return local_image_dir, local_md_dir
 
 
+def _is_full_and_valid_pdf(pdf, start_page_id, end_page_id) -> bool:
+    """请求的是整个文档且交叉引用表完好(pdfium打开时无需修复)时, 不需要重写PDF"""
+    return (
+        start_page_id == 0
+        and end_page_id == len(pdf) - 1
+        and bool(pdfium_c.FPDF_DocumentHasValidCrossReferenceTable(pdf.raw))
+    )
+
+
 def convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id=0, end_page_id=None):
+    """截取[start_page_id, end_page_id]范围内的页面并重新保存PDF, 同时修复交叉引用表损坏的PDF。
+    请求整个文档且PDF完好时直接返回原始pdf_bytes, 不做任何拷贝"""
     pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        end_page_id = get_end_page_id(end_page_id, len(pdf))
+        if _is_full_and_valid_pdf(pdf, start_page_id, end_page_id):
+            pdf.close()
+            return pdf_bytes
+    except Exception as e:
+        logger.warning(f"Error in checking PDF: {e}, rewrite the PDF.")
+
     output_pdf = pdfium.PdfDocument.new()
     try:
         end_page_id = get_end_page_id(end_page_id, len(pdf))
 
-        # 逐页导入,失败则跳过
-        output_index = 0
-        for page_index in range(start_page_id, end_page_id + 1):
-            try:
-                output_pdf.import_pages(pdf, pages=[page_index])
-                output_index += 1
-            except Exception as page_error:
-                output_pdf.del_page(output_index)
-                logger.warning(f"Failed to import page {page_index}: {page_error}, skipping this page.")
-                continue
+        try:
+            # 一次性导入整个页面范围
+            output_pdf.import_pages(pdf, pages=list(range(start_page_id, end_page_id + 1)))
+        except Exception as range_error:
+            logger.warning(f"Failed to import pages {start_page_id}-{end_page_id}: {range_error}, import page by page.")
+            output_pdf.close()
+            output_pdf = pdfium.PdfDocument.new()
+            # 逐页导入,失败则跳过
+            output_index = 0
+            for page_index in range(start_page_id, end_page_id + 1):
+                try:
+                    output_pdf.import_pages(pdf, pages=[page_index])
+                    output_index += 1
+                except Exception as page_error:
+                    output_pdf.del_page(output_index)
+                    logger.warning(f"Failed to import page {page_index}: {page_error}, skipping this page.")
+                    continue
 
         # 将新PDF保存到内存缓冲区
         output_buffer = io.BytesIO()
@@ -108,11 +137,15 @@ def _process_output(
         f_make_md_mode,
         middle_json,
         model_output=None,
-        is_pipeline=True
+        is_pipeline=True,
+        cache_key=None,
 ):
     f_draw_line_sort_bbox = False
     from mineru.backend.pipeline.pipeline_middle_json_mkcontent import union_make as pipeline_union_make
     """处理输出文件"""
+    if cache_key is not None:
+        get_parse_cache().put(cache_key, middle_json, model_output, local_image_dir)
+
     if f_draw_layout_bbox:
         draw_layout_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
 
@@ -184,11 +217,22 @@ def _process_pipeline(
         f_dump_orig_pdf,
         f_dump_content_list,
         f_make_md_mode,
+        cache_keys=None,
 ):
     """处理pipeline后端逻辑"""
     from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json
     from mineru.backend.pipeline.pipeline_analyze import doc_analyze as pipeline_doc_analyze
 
+    if get_pipeline_window_size() > 0:
+        _process_pipeline_streaming(
+            output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
+            parse_method, p_formula_enable, p_table_enable,
+            f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
+            cache_keys,
+        )
+        return
+
     infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list = (
         pipeline_doc_analyze(
             pdf_bytes_list, p_lang_list, parse_method=parse_method,
@@ -219,9 +263,51 @@ def _process_pipeline(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
-            f_make_md_mode, middle_json, model_json, is_pipeline=True
+            f_make_md_mode, middle_json, model_json, is_pipeline=True,
+            cache_key=cache_keys[idx] if cache_keys else None,
+        )
+
+
+def _process_pipeline_streaming(
+        output_dir,
+        pdf_file_names,
+        pdf_bytes_list,
+        p_lang_list,
+        parse_method,
+        p_formula_enable,
+        p_table_enable,
+        f_draw_layout_bbox,
+        f_draw_span_bbox,
+        f_dump_md,
+        f_dump_middle_json,
+        f_dump_model_output,
+        f_dump_orig_pdf,
+        f_dump_content_list,
+        f_make_md_mode,
+        cache_keys=None,
+):
+    """按页面窗口流式处理pipeline后端, 每个文档处理完成后立即写出结果"""
+    from mineru.backend.pipeline.pipeline_analyze import doc_analyze_streaming as pipeline_doc_analyze_streaming
+
+    env_list = [prepare_env(output_dir, pdf_file_name, parse_method) for pdf_file_name in pdf_file_names]
+    image_writer_list = [FileBasedDataWriter(local_image_dir) for local_image_dir, _ in env_list]
+
+    def on_doc_ready(idx, model_json, middle_json):
+        local_image_dir, local_md_dir = env_list[idx]
+        md_writer = FileBasedDataWriter(local_md_dir)
+        _process_output(
+            middle_json["pdf_info"], pdf_bytes_list[idx], pdf_file_names[idx], local_md_dir, local_image_dir,
+            md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
+            f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
+            f_make_md_mode, middle_json, model_json, is_pipeline=True,
+            cache_key=cache_keys[idx] if cache_keys else None,
         )
 
+    pipeline_doc_analyze_streaming(
+        pdf_bytes_list, image_writer_list, p_lang_list, on_doc_ready,
+        parse_method=parse_method, formula_enable=p_formula_enable, table_enable=p_table_enable,
+    )
+
 
 async def _async_process_vlm(
         output_dir,
@@ -237,6 +323,7 @@ async def _async_process_vlm(
         f_dump_content_list,
         f_make_md_mode,
         server_url=None,
+        cache_keys=None,
         **kwargs,
 ):
     """异步处理VLM后端逻辑"""
@@ -260,7 +347,8 @@ async def _async_process_vlm(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
-            f_make_md_mode, middle_json, infer_result, is_pipeline=False
+            f_make_md_mode, middle_json, infer_result, is_pipeline=False,
+            cache_key=cache_keys[idx] if cache_keys else None,
         )
 
 
@@ -278,6 +366,7 @@ def _process_vlm(
         f_dump_content_list,
         f_make_md_mode,
         server_url=None,
+        cache_keys=None,
         **kwargs,
 ):
     """同步处理VLM后端逻辑"""
@@ -301,7 +390,8 @@ def _process_vlm(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
-            f_make_md_mode, middle_json, infer_result, is_pipeline=False
+            f_make_md_mode, middle_json, infer_result, is_pipeline=False,
+            cache_key=cache_keys[idx] if cache_keys else None,
         )
 
 
@@ -322,6 +412,7 @@ def _process_hybrid(
         f_dump_content_list,
         f_make_md_mode,
         server_url=None,
+        cache_keys=None,
         **kwargs,
 ):
     from mineru.backend.hybrid.hybrid_analyze import doc_analyze as hybrid_doc_analyze
@@ -354,7 +445,8 @@ def _process_hybrid(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
-            f_make_md_mode, middle_json, infer_result, is_pipeline=False
+            f_make_md_mode, middle_json, infer_result, is_pipeline=False,
+            cache_key=cache_keys[idx] if cache_keys else None,
         )
 
 
@@ -375,6 +467,7 @@ async def _async_process_hybrid(
         f_dump_content_list,
         f_make_md_mode,
         server_url=None,
+        cache_keys=None,
         **kwargs,
 ):
     from mineru.backend.hybrid.hybrid_analyze import aio_doc_analyze as aio_hybrid_doc_analyze
@@ -407,8 +500,72 @@ async def _async_process_hybrid(
             pdf_info, pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
             md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
             f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
-            f_make_md_mode, middle_json, infer_result, is_pipeline=False
+            f_make_md_mode, middle_json, infer_result, is_pipeline=False,
+            cache_key=cache_keys[idx] if cache_keys else None,
+        )
+
+
+def _process_cached(
+        output_dir,
+        pdf_file_names,
+        pdf_bytes_list,
+        p_lang_list,
+        backend,
+        parse_method,
+        formula_enable,
+        table_enable,
+        f_draw_layout_bbox,
+        f_draw_span_bbox,
+        f_dump_md,
+        f_dump_middle_json,
+        f_dump_model_output,
+        f_dump_orig_pdf,
+        f_dump_content_list,
+        f_make_md_mode,
+        start_page_id,
+        end_page_id,
+):
+    """从解析结果缓存中输出命中的文档, 返回未命中文档的文件名、原始pdf字节、语言以及缓存键
+
+    缓存键在按页码范围重写pdf之前由原始字节计算, 重写后的pdf带有随机的trailer /ID, 无法作为缓存键
+    """
+    parse_cache = get_parse_cache()
+    is_pipeline = backend == "pipeline"
+    if is_pipeline:
+        parse_dir_name = parse_method
+    elif backend.startswith("hybrid-"):
+        parse_dir_name = f"hybrid_{parse_method}"
+        f_draw_span_bbox = False
+    else:
+        parse_dir_name = "vlm"
+        f_draw_span_bbox = False
+
+    miss_file_names, miss_bytes_list, miss_lang_list, miss_cache_keys = [], [], [], []
+    for idx, (pdf_file_name, pdf_bytes) in enumerate(zip(pdf_file_names, pdf_bytes_list)):
+        lang = p_lang_list[idx] if idx < len(p_lang_list) else None
+        cache_key = make_parse_cache_key(
+            pdf_bytes, start_page_id, end_page_id, backend, parse_method, lang, formula_enable, table_enable
+        )
+        local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_dir_name)
+        cached = parse_cache.get(cache_key, local_image_dir)
+        if cached is None:
+            miss_file_names.append(pdf_file_name)
+            miss_bytes_list.append(pdf_bytes)
+            if idx < len(p_lang_list):
+                miss_lang_list.append(lang)
+            miss_cache_keys.append(cache_key)
+            continue
+
+        middle_json, model_output = cached
+        md_writer = FileBasedDataWriter(local_md_dir)
+        pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
+        _process_output(
+            middle_json["pdf_info"], pdf_bytes, pdf_file_name, local_md_dir, local_image_dir,
+            md_writer, f_draw_layout_bbox, f_draw_span_bbox, f_dump_orig_pdf,
+            f_dump_md, f_dump_content_list, f_dump_middle_json, f_dump_model_output,
+            f_make_md_mode, middle_json, model_output, is_pipeline=is_pipeline
         )
+    return miss_file_names, miss_bytes_list, miss_lang_list, miss_cache_keys
 
 
 def do_parse(
@@ -433,6 +590,19 @@ def do_parse(
         end_page_id=None,
         **kwargs,
 ):
+    # 解析结果缓存, 命中的文档直接输出, 只处理未命中的文档
+    cache_keys = None
+    if get_parse_cache() is not None:
+        pdf_file_names, pdf_bytes_list, p_lang_list, cache_keys = _process_cached(
+            output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
+            backend, parse_method, formula_enable, table_enable,
+            f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
+            start_page_id, end_page_id,
+        )
+        if len(pdf_bytes_list) == 0:
+            return
+
     # 预处理PDF字节数据
     pdf_bytes_list = _prepare_pdf_bytes(pdf_bytes_list, start_page_id, end_page_id)
 
@@ -441,7 +611,8 @@ def do_parse(
             output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
             parse_method, formula_enable, table_enable,
             f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
-            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
+            cache_keys,
         )
     else:
         if backend.startswith("vlm-"):
@@ -460,7 +631,7 @@ def do_parse(
                 output_dir, pdf_file_names, pdf_bytes_list, backend,
                 f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
                 f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
-                server_url, **kwargs,
+                server_url, cache_keys, **kwargs,
             )
         elif backend.startswith("hybrid-"):
             backend = backend[7:]
@@ -479,7 +650,7 @@ def do_parse(
                 output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method, formula_enable, backend,
                 f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
                 f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
-                server_url, **kwargs,
+                server_url, cache_keys, **kwargs,
             )
 
 
@@ -505,6 +676,19 @@ async def aio_do_parse(
         end_page_id=None,
         **kwargs,
 ):
+    # 解析结果缓存, 命中的文档直接输出, 只处理未命中的文档
+    cache_keys = None
+    if get_parse_cache() is not None:
+        pdf_file_names, pdf_bytes_list, p_lang_list, cache_keys = _process_cached(
+            output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
+            backend, parse_method, formula_enable, table_enable,
+            f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
+            start_page_id, end_page_id,
+        )
+        if len(pdf_bytes_list) == 0:
+            return
+
     # 预处理PDF字节数据
     pdf_bytes_list = _prepare_pdf_bytes(pdf_bytes_list, start_page_id, end_page_id)
 
@@ -514,7 +698,8 @@ async def aio_do_parse(
             output_dir, pdf_file_names, pdf_bytes_list, p_lang_list,
             parse_method, formula_enable, table_enable,
             f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
-            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
+            cache_keys,
         )
     else:
         if backend.startswith("vlm-"):
@@ -533,7 +718,7 @@ async def aio_do_parse(
                 output_dir, pdf_file_names, pdf_bytes_list, backend,
                 f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
                 f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
-                server_url, **kwargs,
+                server_url, cache_keys, **kwargs,
             )
         elif backend.startswith("hybrid-"):
             backend = backend[7:]
@@ -551,7 +736,7 @@ async def aio_do_parse(
                 output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method, formula_enable, backend,
                 f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
                 f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode,
-                server_url, **kwargs,
+                server_url, cache_keys, **kwargs,
             )
 
 
@@ -10,6 +10,7 @@ import zipfile
 import shutil
 from pathlib import Path
 import glob
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse, FileResponse
@@ -23,8 +24,10 @@ logger.add(sys.stderr, level=log_level)  # 添加新handler
 from base64 import b64encode
 
 from mineru.cli.common import aio_do_parse, read_fn, pdf_suffixes, image_suffixes
+from mineru.utils.check_sys_env import is_windows_environment
 from mineru.utils.cli_parser import arg_parse
 from mineru.utils.guess_suffix_or_lang import guess_suffix_by_path
+from mineru.utils.pdf_image_tools import RenderPoolSingleton
 from mineru.version import __version__
 
 # 并发控制器
@@ -46,6 +49,15 @@ async def limit_concurrency():
         yield
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 常驻渲染进程池在服务进程启动时创建并预热, 所有请求复用
+    if not is_windows_environment():
+        await asyncio.to_thread(RenderPoolSingleton().warm_up)
+    yield
+    RenderPoolSingleton().shutdown()
+
+
 def create_app():
     # By default, the OpenAPI documentation endpoints (openapi_url, docs_url, redoc_url) are enabled.
     # To disable the FastAPI docs and schema endpoints, set the environment variable MINERU_API_ENABLE_FASTAPI_DOCS=0.
@@ -58,6 +70,7 @@ def create_app():
         openapi_url="/openapi.json" if enable_docs else None,
         docs_url="/docs" if enable_docs else None,
         redoc_url="/redoc" if enable_docs else None,
+        lifespan=lifespan,
     )
 
     # 初始化并发控制器：从环境变量MINERU_API_MAX_CONCURRENT_REQUESTS读取
@@ -339,9 +352,13 @@ async def parse_pdf(
                     # 写入图片
                     if return_images:
                         images_dir = os.path.join(parse_dir, "images")
-                        image_paths = glob.glob(
-                            os.path.join(glob.escape(images_dir), "*.jpg")
-                        )
+                        image_paths = [
+                            image_path
+                            for suffix in ("jpg", "webp")
+                            for image_path in glob.glob(
+                                os.path.join(glob.escape(images_dir), f"*.{suffix}")
+                            )
+                        ]
                         for image_path in image_paths:
                             zf.write(
                                 image_path,
@@ -396,12 +413,17 @@ async def parse_pdf(
                         )
                     if return_images:
                         images_dir = os.path.join(parse_dir, "images")
-                        safe_pattern = os.path.join(glob.escape(images_dir), "*.jpg")
-                        image_paths = glob.glob(safe_pattern)
+                        image_paths = [
+                            image_path
+                            for suffix in ("jpg", "webp")
+                            for image_path in glob.glob(
+                                os.path.join(glob.escape(images_dir), f"*.{suffix}")
+                            )
+                        ]
                         data["images"] = {
                             os.path.basename(
                                 image_path
-                            ): f"data:image/jpeg;base64,{encode_image(image_path)}"
+                            ): f"data:image/{'webp' if image_path.endswith('.webp') else 'jpeg'};base64,{encode_image(image_path)}"
                             for image_path in image_paths
                         }
 
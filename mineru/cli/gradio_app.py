@@ -97,11 +97,12 @@ def replace_image_with_base64(markdown_text, image_dir_path):
     # 替换图片链接
     def replace(match):
         relative_path = match.group(1)
-        # 只处理以.jpg结尾的图片
-        if relative_path.endswith('.jpg'):
+        # 只处理以.jpg/.webp结尾的图片
+        if relative_path.endswith(('.jpg', '.webp')):
             full_path = os.path.join(image_dir_path, relative_path)
             base64_image = image_to_base64(full_path)
-            return f'![{relative_path}](data:image/jpeg;base64,{base64_image})'
+            mime_type = 'image/webp' if relative_path.endswith('.webp') else 'image/jpeg'
+            return f'![{relative_path}](data:{mime_type};base64,{base64_image})'
         else:
             # 其他格式的图片保持原样
             return match.group(0)
@@ -1,4 +1,5 @@
 from .base import DataReader, DataWriter
+from .cached import CachedDataReader
 from .dummy import DummyDataWriter
 from .filebase import FileBasedDataReader, FileBasedDataWriter
 from .multi_bucket_s3 import MultiBucketS3DataReader, MultiBucketS3DataWriter
@@ -14,4 +15,5 @@ __all__ = [
     "MultiBucketS3DataReader",
     "MultiBucketS3DataWriter",
     "DummyDataWriter",
+    "CachedDataReader",
 ]
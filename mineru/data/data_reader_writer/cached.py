@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import uuid
+
+from .base import DataReader
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class CachedDataReader(DataReader):
+    def __init__(
+        self,
+        reader: DataReader,
+        cache_dir: str,
+        max_size_mb: int = 10240,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ):
+        """Read-through cache in a local directory for a remote reader.
+
+        Files are cached in blocks of block_size bytes, so a range read of a large
+        remote file only downloads and stores the blocks it touches. When the total
+        size of the cache exceeds max_size_mb, the least recently used blocks are
+        evicted. The cached content is assumed to be immutable, use a different
+        cache_dir if the remote files may change.
+
+        Args:
+            reader (DataReader): the underlying reader, any object with read_at such as HttpReader works.
+            cache_dir (str): the local cache directory, can be shared by multiple processes.
+            max_size_mb (int, optional): the maximum size of the cache in MB. Defaults to 10240.
+            block_size (int, optional): the size of each cached block. Defaults to 8MB.
+        """
+        self._reader = reader
+        self._cache_dir = cache_dir
+        self._max_size = max_size_mb * 1024 * 1024
+        self._block_size = block_size
+        self._lock = threading.Lock()
+        self._cache_size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _block_path(self, path: str, block_index: int) -> str:
+        key = hashlib.sha256(f'{path}:{self._block_size}'.encode('utf-8')).hexdigest()
+        return os.path.join(self._cache_dir, f'{key}_{block_index}')
+
+    def _read_block(self, path: str, block_index: int) -> bytes:
+        block_path = self._block_path(path, block_index)
+        try:
+            with open(block_path, 'rb') as f:
+                data = f.read()
+            # update the access time for LRU eviction
+            os.utime(block_path)
+            return data
+        except OSError:
+            pass
+
+        data = self._reader.read_at(path, block_index * self._block_size, self._block_size)
+        # write to a temporary file and rename it, readers never see a partially written block
+        tmp_path = f'{block_path}.tmp_{uuid.uuid4().hex[:8]}'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, block_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return data
+        self._add_size(len(data))
+        return data
+
+    def _add_size(self, size: int):
+        with self._lock:
+            if self._cache_size is None:
+                self._cache_size = self._scan_size()
+            else:
+                self._cache_size += size
+            if self._cache_size > self._max_size:
+                self._evict()
+
+    def _scan_size(self) -> int:
+        total_size = 0
+        for entry in os.scandir(self._cache_dir):
+            try:
+                total_size += entry.stat().st_size
+            except OSError:
+                pass
+        return total_size
+
+    def _evict(self):
+        """Delete the least recently used blocks until the cache size is within max_size."""
+        entries = []
+        for entry in os.scandir(self._cache_dir):
+            if '.tmp_' in entry.name:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total_size <= self._max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total_size -= size
+        self._cache_size = total_size
+
+    def read_at(self, path: str, offset: int = 0, limit: int = -1) -> bytes:
+        """Read at offset and limit, the blocks covering the range are read from
+        the cache or fetched from the underlying reader.
+
+        Args:
+            path (str): the file path.
+            offset (int, optional): the number of bytes skipped. Defaults to 0.
+            limit (int, optional): the length of bytes want to read. Defaults to -1.
+
+        Returns:
+            bytes: the content of file
+        """
+        if limit == 0:
+            return b''
+        block_index = offset // self._block_size
+        skip = offset - block_index * self._block_size
+        chunks = []
+        remaining = limit
+        while True:
+            data = self._read_block(path, block_index)
+            chunk = data[skip:] if remaining < 0 else data[skip:skip + remaining]
+            chunks.append(chunk)
+            if remaining > -1:
+                remaining -= len(chunk)
+            # a short block is the last block of the file
+            if len(data) < self._block_size or remaining == 0:
+                break
+            block_index += 1
+            skip = 0
+        return b''.join(chunks)
@@ -1,3 +1,4 @@
+import threading
 
 from ..utils.exceptions import InvalidConfig, InvalidParams
 from .base import DataReader, DataWriter
@@ -45,6 +46,7 @@ class MultiS3Mixin:
 
         self.s3_configs = s3_configs
         self._s3_clients_h: dict = {}
+        self._s3_clients_lock = threading.Lock()
 
 
 class MultiBucketS3DataReader(DataReader, MultiS3Mixin):
@@ -72,18 +74,19 @@ class MultiBucketS3DataReader(DataReader, MultiS3Mixin):
             raise InvalidParams(
                 f'bucket name: {bucket_name} not found in s3_configs: {self.s3_configs}'
             )
-        if bucket_name not in self._s3_clients_h:
-            conf = next(
-                filter(lambda conf: conf.bucket_name == bucket_name, self.s3_configs)
-            )
-            self._s3_clients_h[bucket_name] = S3Reader(
-                bucket_name,
-                conf.access_key,
-                conf.secret_key,
-                conf.endpoint_url,
-                conf.addressing_style,
-            )
-        return self._s3_clients_h[bucket_name]
+        with self._s3_clients_lock:
+            if bucket_name not in self._s3_clients_h:
+                conf = next(
+                    filter(lambda conf: conf.bucket_name == bucket_name, self.s3_configs)
+                )
+                self._s3_clients_h[bucket_name] = S3Reader(
+                    bucket_name,
+                    conf.access_key,
+                    conf.secret_key,
+                    conf.endpoint_url,
+                    conf.addressing_style,
+                )
+            return self._s3_clients_h[bucket_name]
 
     def read_at(self, path: str, offset: int = 0, limit: int = -1) -> bytes:
         """Read the file with offset and limit, select diffect bucket client
@@ -113,18 +116,20 @@ class MultiBucketS3DataWriter(DataWriter, MultiS3Mixin):
             raise InvalidParams(
                 f'bucket name: {bucket_name} not found in s3_configs: {self.s3_configs}'
             )
-        if bucket_name not in self._s3_clients_h:
-            conf = next(
-                filter(lambda conf: conf.bucket_name == bucket_name, self.s3_configs)
-            )
-            self._s3_clients_h[bucket_name] = S3Writer(
-                bucket_name,
-                conf.access_key,
-                conf.secret_key,
-                conf.endpoint_url,
-                conf.addressing_style,
-            )
-        return self._s3_clients_h[bucket_name]
+        # the writer may be shared by the image export threads, create each client only once
+        with self._s3_clients_lock:
+            if bucket_name not in self._s3_clients_h:
+                conf = next(
+                    filter(lambda conf: conf.bucket_name == bucket_name, self.s3_configs)
+                )
+                self._s3_clients_h[bucket_name] = S3Writer(
+                    bucket_name,
+                    conf.access_key,
+                    conf.secret_key,
+                    conf.endpoint_url,
+                    conf.addressing_style,
+                )
+            return self._s3_clients_h[bucket_name]
 
     def write(self, path: str, data: bytes) -> None:
         """Write file with data, also select diffect bucket client for each
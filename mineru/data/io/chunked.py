@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def split_range(offset: int, length: int, chunk_size: int) -> list[tuple[int, int]]:
+    """Split [offset, offset + length) into (offset, length) chunks of at most chunk_size bytes."""
+    return [
+        (start, min(chunk_size, offset + length - start))
+        for start in range(offset, offset + length, chunk_size)
+    ]
+
+
+def read_range_concurrently(
+    read_range: Callable[[int, int], bytes],
+    offset: int,
+    length: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_workers: int = 8,
+) -> bytes:
+    """Read [offset, offset + length) by calling read_range(chunk_offset, chunk_length)
+    for each chunk in parallel, ranges not larger than chunk_size are read directly.
+
+    Args:
+        read_range (Callable[[int, int], bytes]): reads length bytes at offset, must be thread-safe.
+        offset (int): the number of bytes skipped.
+        length (int): the number of bytes want to read.
+        chunk_size (int, optional): the size of each chunk. Defaults to 8MB.
+        max_workers (int, optional): the maximum number of concurrent reads. Defaults to 8.
+
+    Returns:
+        bytes: the content of the range.
+    """
+    chunks = split_range(offset, length, chunk_size)
+    if len(chunks) <= 1 or max_workers <= 1:
+        return b''.join(read_range(start, size) for start, size in chunks)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        return b''.join(executor.map(lambda chunk: read_range(*chunk), chunks))
@@ -2,11 +2,34 @@
 import io
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .base import IOReader, IOWriter
+from .chunked import DEFAULT_CHUNK_SIZE, read_range_concurrently
+
+
+def create_session(pool_maxsize: int = 16) -> requests.Session:
+    """Create a session that keeps up to pool_maxsize connections alive per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 class HttpReader(IOReader):
+    def __init__(self, pool_maxsize: int = 16, chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: int = 8):
+        """http reader client, the connections are kept alive and shared between threads.
+
+        Args:
+            pool_maxsize (int, optional): the maximum number of connections kept per host. Defaults to 16.
+            chunk_size (int, optional): ranges larger than this are downloaded in chunks concurrently
+            when the server supports Range requests. Defaults to 8MB.
+            max_workers (int, optional): the maximum number of concurrent chunk downloads. Defaults to 8.
+        """
+        self._session = create_session(pool_maxsize)
+        self._chunk_size = chunk_size
+        self._max_workers = max_workers
 
     def read(self, url: str) -> bytes:
         """Read the file.
@@ -17,14 +40,73 @@ class HttpReader(IOReader):
         Returns:
             bytes: the content of the file
         """
-        return requests.get(url).content
+        return self.read_at(url)
+
+    def _get(self, url: str, offset: int, limit: int) -> bytes:
+        """GET the range with a Range header, slice the content if the server ignores it."""
+        if limit == 0:
+            return b''
+        if offset == 0 and limit == -1:
+            response = self._session.get(url)
+            response.raise_for_status()
+            return response.content
+        end = '' if limit == -1 else offset + limit - 1
+        response = self._session.get(url, headers={'Range': f'bytes={offset}-{end}'})
+        if response.status_code == 416:
+            return b''
+        response.raise_for_status()
+        if response.status_code == 206:
+            return response.content
+        # the server does not support Range requests and returned the whole file
+        return response.content[offset:] if limit == -1 else response.content[offset:offset + limit]
+
+    def _get_range_info(self, url: str) -> tuple[int, bool]:
+        """Return the content length (-1 if unknown) and whether Range requests are supported."""
+        response = self._session.head(url, allow_redirects=True)
+        if response.status_code >= 300:
+            return -1, False
+        content_length = int(response.headers.get('Content-Length', -1))
+        accept_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        return content_length, accept_ranges
 
     def read_at(self, path: str, offset: int = 0, limit: int = -1) -> bytes:
-        """Not Implemented."""
-        raise NotImplementedError
+        """Read at offset and limit with Range requests, large ranges are downloaded
+        in chunks concurrently.
+
+        Args:
+            path (str): the url of file.
+            offset (int, optional): the number of bytes skipped. Defaults to 0.
+            limit (int, optional): the length of bytes want to read. Defaults to -1.
+
+        Returns:
+            bytes: the content of file
+        """
+        if 0 <= limit <= self._chunk_size:
+            return self._get(path, offset, limit)
+        content_length, accept_ranges = self._get_range_info(path)
+        if not accept_ranges or content_length < 0:
+            return self._get(path, offset, limit)
+        length = max(0, content_length - offset)
+        if limit > -1:
+            length = min(length, limit)
+        return read_range_concurrently(
+            lambda chunk_offset, chunk_length: self._get(path, chunk_offset, chunk_length),
+            offset,
+            length,
+            self._chunk_size,
+            self._max_workers,
+        )
 
 
 class HttpWriter(IOWriter):
+    def __init__(self, pool_maxsize: int = 16):
+        """http writer client, the connections are kept alive and shared between threads.
+
+        Args:
+            pool_maxsize (int, optional): the maximum number of connections kept per host. Defaults to 16.
+        """
+        self._session = create_session(pool_maxsize)
+
     def write(self, url: str, data: bytes) -> None:
         """Write file with data.
 
@@ -33,5 +115,5 @@ class HttpWriter(IOWriter):
             data (bytes): the data want to write
         """
         files = {'file': io.BytesIO(data)}
-        response = requests.post(url, files=files)
+        response = self._session.post(url, files=files)
         assert 300 > response.status_code and response.status_code > 199
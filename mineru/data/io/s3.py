@@ -1,7 +1,12 @@
+import io
+
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from botocore.exceptions import ClientError
 
 from ..io.base import IOReader, IOWriter
+from ..io.chunked import DEFAULT_CHUNK_SIZE, read_range_concurrently
 
 
 class S3Reader(IOReader):
@@ -12,6 +17,9 @@ class S3Reader(IOReader):
         sk: str,
         endpoint_url: str,
         addressing_style: str = 'auto',
+        max_pool_connections: int = 32,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_workers: int = 8,
     ):
         """s3 reader client.
 
@@ -22,10 +30,15 @@ class S3Reader(IOReader):
             endpoint_url (str): endpoint url of s3
             addressing_style (str, optional): Defaults to 'auto'. Other valid options here are 'path' and 'virtual'
             refer to https://boto3.amazonaws.com/v1/documentation/api/1.9.42/guide/s3.html
+            max_pool_connections (int, optional): the size of the connection pool. Defaults to 32.
+            chunk_size (int, optional): ranges larger than this are downloaded in chunks concurrently. Defaults to 8MB.
+            max_workers (int, optional): the maximum number of concurrent chunk downloads. Defaults to 8.
         """
         self._bucket = bucket
         self._ak = ak
         self._sk = sk
+        self._chunk_size = chunk_size
+        self._max_workers = max_workers
         self._s3_client = boto3.client(
             service_name='s3',
             aws_access_key_id=ak,
@@ -34,6 +47,7 @@ class S3Reader(IOReader):
             config=Config(
                 s3={'addressing_style': addressing_style},
                 retries={'max_attempts': 5, 'mode': 'standard'},
+                max_pool_connections=max_pool_connections,
             ),
         )
 
@@ -59,15 +73,37 @@ class S3Reader(IOReader):
         Returns:
             bytes: the content of file
         """
+        if 0 <= limit <= self._chunk_size:
+            return self._get_object(key, offset, limit)
+        content_length = self._s3_client.head_object(Bucket=self._bucket, Key=key)['ContentLength']
+        length = max(0, content_length - offset)
+        if limit > -1:
+            length = min(length, limit)
+        # large objects are downloaded in chunks concurrently over the pooled connections
+        return read_range_concurrently(
+            lambda chunk_offset, chunk_length: self._get_object(key, chunk_offset, chunk_length),
+            offset,
+            length,
+            self._chunk_size,
+            self._max_workers,
+        )
+
+    def _get_object(self, key: str, offset: int, limit: int) -> bytes:
+        if limit == 0:
+            return b''
         if limit > -1:
             range_header = f'bytes={offset}-{offset+limit-1}'
-            res = self._s3_client.get_object(
-                Bucket=self._bucket, Key=key, Range=range_header
-            )
         else:
+            range_header = f'bytes={offset}-'
+        try:
             res = self._s3_client.get_object(
-                Bucket=self._bucket, Key=key, Range=f'bytes={offset}-'
+                Bucket=self._bucket, Key=key, Range=range_header
             )
+        except ClientError as e:
+            # the range starts at or after the end of the object
+            if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+                return b''
+            raise
         return res['Body'].read()
 
 
@@ -79,8 +115,11 @@ class S3Writer(IOWriter):
         sk: str,
         endpoint_url: str,
         addressing_style: str = 'auto',
+        max_pool_connections: int = 32,
+        multipart_threshold: int = 16 * 1024 * 1024,
     ):
-        """s3 reader client.
+        """s3 writer client, the client is thread-safe and keeps up to
+        max_pool_connections connections alive.
 
         Args:
             bucket (str): bucket name
@@ -89,10 +128,19 @@ class S3Writer(IOWriter):
             endpoint_url (str): endpoint url of s3
             addressing_style (str, optional): Defaults to 'auto'. Other valid options here are 'path' and 'virtual'
             refer to https://boto3.amazonaws.com/v1/documentation/api/1.9.42/guide/s3.html
+            max_pool_connections (int, optional): the size of the connection pool. Defaults to 32.
+            multipart_threshold (int, optional): files not smaller than this are uploaded in parts concurrently.
+            Defaults to 16MB.
         """
         self._bucket = bucket
         self._ak = ak
         self._sk = sk
+        self._multipart_threshold = multipart_threshold
+        self._transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=8 * 1024 * 1024,
+            max_concurrency=min(10, max_pool_connections),
+        )
         self._s3_client = boto3.client(
             service_name='s3',
             aws_access_key_id=ak,
@@ -101,14 +149,20 @@ class S3Writer(IOWriter):
             config=Config(
                 s3={'addressing_style': addressing_style},
                 retries={'max_attempts': 5, 'mode': 'standard'},
+                max_pool_connections=max_pool_connections,
             ),
         )
 
     def write(self, key: str, data: bytes):
-        """Write file with data.
+        """Write file with data, large files are uploaded with multipart upload.
 
         Args:
             path (str): the path of file, if the path is relative path, it will be joined with parent_dir.
             data (bytes): the data want to write
         """
-        self._s3_client.put_object(Bucket=self._bucket, Key=key, Body=data)
+        if len(data) < self._multipart_threshold:
+            self._s3_client.put_object(Bucket=self._bucket, Key=key, Body=data)
+        else:
+            self._s3_client.upload_fileobj(
+                io.BytesIO(data), self._bucket, key, Config=self._transfer_config
+            )
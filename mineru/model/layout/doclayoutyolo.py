@@ -7,6 +7,7 @@ import numpy as np
 from PIL import Image, ImageDraw
 
 from mineru.utils.enum_class import ModelPath
+from mineru.utils.model_utils import group_indices_by_image_size
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
 
 
@@ -61,24 +62,25 @@ class DocLayoutYOLOModel:
         images: List[Union[np.ndarray, Image.Image]],
         batch_size: int = 4
     ) -> List[List[Dict]]:
-        results = []
+        """
+        尺寸不同的图片放在同一批时会被letterbox到imgsz的正方形, 结果与单张推理不一致,
+        因此先按图片尺寸分组, 每组内再按batch_size分批, 保证结果与逐张推理相同。
+        """
+        results = [None] * len(images)
         with tqdm(total=len(images), desc="Layout Predict") as pbar:
-            for idx in range(0, len(images), batch_size):
-                batch = images[idx: idx + batch_size]
-                if batch_size == 1:
-                    conf = 0.9 * self.conf
-                else:
-                    conf = self.conf
-                predictions = self.model.predict(
-                    batch,
-                    imgsz=self.imgsz,
-                    conf=conf,
-                    iou=self.iou,
-                    verbose=False,
-                )
-                for pred in predictions:
-                    results.append(self._parse_prediction(pred))
-                pbar.update(len(batch))
+            for indices in group_indices_by_image_size(images).values():
+                for idx in range(0, len(indices), batch_size):
+                    batch_indices = indices[idx: idx + batch_size]
+                    predictions = self.model.predict(
+                        [images[i] for i in batch_indices],
+                        imgsz=self.imgsz,
+                        conf=0.9 * self.conf,
+                        iou=self.iou,
+                        verbose=False,
+                    )
+                    for i, pred in zip(batch_indices, predictions):
+                        results[i] = self._parse_prediction(pred)
+                    pbar.update(len(batch_indices))
         return results
 
     def visualize(
@@ -8,6 +8,7 @@ import numpy as np
 from PIL import Image, ImageDraw
 
 from mineru.utils.enum_class import ModelPath
+from mineru.utils.model_utils import group_indices_by_image_size
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
 
 
@@ -55,13 +56,16 @@ class YOLOv8MFDModel:
         batch_size: int = 4,
         conf: float = None,
     ) -> List:
-        results = []
+        # 按图片尺寸分组后再分批, 使每张图片的letterbox与单张推理一致
+        results = [None] * len(images)
         with tqdm(total=len(images), desc="MFD Predict") as pbar:
-            for idx in range(0, len(images), batch_size):
-                batch = images[idx: idx + batch_size]
-                batch_preds = self._run_predict(batch, is_batch=True, conf=conf)
-                results.extend(batch_preds)
-                pbar.update(len(batch))
+            for indices in group_indices_by_image_size(images).values():
+                for idx in range(0, len(indices), batch_size):
+                    batch_indices = indices[idx: idx + batch_size]
+                    batch_preds = self._run_predict([images[i] for i in batch_indices], is_batch=True, conf=conf)
+                    for i, pred in zip(batch_indices, batch_preds):
+                        results[i] = pred
+                    pbar.update(len(batch_indices))
         return results
 
     def visualize(
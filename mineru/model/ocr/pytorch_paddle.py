@@ -12,6 +12,7 @@ from loguru import logger
 from mineru.utils.config_reader import get_device
 from mineru.utils.enum_class import ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+from mineru.utils.os_env_config import get_ocr_rec_batch_size
 from mineru.utils.ocr_utils import check_img, preprocess_image, sorted_boxes, merge_det_boxes, update_det_boxes, get_rotate_crop_image
 from mineru.model.utils.tools.infer.predict_system import TextSystem
 from mineru.model.utils.tools.infer import pytorchocr_utility as utility
@@ -176,7 +177,9 @@ class PytorchPaddleOCR(TextSystem):
         kwargs['det_model_path'] = det_model_path
         kwargs['rec_model_path'] = rec_model_path
         kwargs['rec_char_dict_path'] = os.path.join(root_dir, 'pytorchocr', 'utils', 'resources', 'dict', dict_file)
-        kwargs['rec_batch_num'] = 6
+        # 按padding后的宽度分桶组batch, rec_batch_num为每个batch可容纳的标准宽度文本行数
+        kwargs['rec_batch_num'] = get_ocr_rec_batch_size()
+        kwargs['rec_width_bucket'] = True
 
         kwargs['device'] = device
 
@@ -193,6 +196,7 @@ class PytorchPaddleOCR(TextSystem):
             mfd_res=None,
             tqdm_enable=False,
             tqdm_desc="OCR-rec Predict",
+            rec_batch_num=None,
             ):
         assert isinstance(img, (np.ndarray, list, str, bytes))
         if isinstance(img, list) and det == True:
@@ -237,7 +241,9 @@ class PytorchPaddleOCR(TextSystem):
                     if not isinstance(img, list):
                         img = preprocess_image(img)
                         img = [img]
-                    rec_res, elapse = self.text_recognizer(img, tqdm_enable=tqdm_enable, tqdm_desc=tqdm_desc)
+                    rec_res, elapse = self.text_recognizer(
+                        img, tqdm_enable=tqdm_enable, tqdm_desc=tqdm_desc, batch_num=rec_batch_num
+                    )
                     # logger.debug("rec_res num  : {}, elapsed : {}".format(len(rec_res), elapse))
                     ocr_res.append(rec_res)
                 return ocr_res
@@ -174,12 +174,6 @@ class PaddleOrientationClsModel:
     def batch_predict(
         self, imgs: List[Dict], det_batch_size: int, batch_size: int = 16
     ) -> None:
-
-        import torch
-        from packaging import version
-        if version.parse(torch.__version__) >= version.parse("2.8.0"):
-            return None
-
         """
         批量预测传入的包含图片信息列表的旋转信息，并且将旋转过的图片正确地旋转回来
         """
@@ -253,7 +247,7 @@ class PaddleOrientationClsModel:
                 for img_batch in imgs:
                     x = self.batch_preprocess(img_batch)
                     results = self.sess.run(None, {"x": x})
-                    for img_info, res in zip(rotated_imgs, results[0]):
+                    for img_info, res in zip(img_batch, results[0]):
                         label = self.labels[np.argmax(res)]
                         self.img_rotate(img_info, label)
                         pbar.update(1)
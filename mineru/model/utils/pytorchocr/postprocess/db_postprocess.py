@@ -9,6 +9,7 @@ from __future__ import print_function
 import numpy as np
 import cv2
 import torch
+import shapely
 from shapely.geometry import Polygon
 import pyclipper
 
@@ -57,39 +58,57 @@ class DBPostProcess(object):
 
         num_contours = min(len(contours), self.max_candidates)
 
-        boxes = []
-        scores = []
+        candidates = []
         for index in range(num_contours):
             contour = contours[index]
             points, sside = self.get_mini_boxes(contour)
             if sside < self.min_size:
                 continue
-            points = np.array(points)
-            if self.score_mode == "fast":
-                score = self.box_score_fast(pred, points.reshape(-1, 2))
-            else:
-                score = self.box_score_slow(pred, contour)
-            if self.box_thresh > score:
-                continue
+            candidates.append((contour, np.array(points)))
 
-            box = self.unclip(points).reshape(-1, 1, 2)
+        # 先一次性算出所有候选框的得分并过滤, 只有通过box_thresh的框才进入开销较大的unclip
+        if self.score_mode == "fast":
+            candidate_scores = self.box_scores_fast(
+                pred, np.array([points for _, points in candidates], dtype=np.float32).reshape(-1, 4, 2))
+        else:
+            candidate_scores = [self.box_score_slow(pred, contour) for contour, _ in candidates]
+
+        kept = [(points, score) for (_, points), score in zip(candidates, candidate_scores)
+                if not self.box_thresh > score]
+        distances = self.unclip_distances(
+            np.array([points for points, _ in kept], dtype=np.float32).reshape(-1, 4, 2))
+
+        boxes = []
+        scores = []
+        for (points, score), distance in zip(kept, distances):
+            box = self.unclip(points, distance).reshape(-1, 1, 2)
             box, sside = self.get_mini_boxes(box)
             if sside < self.min_size + 2:
                 continue
-            box = np.array(box)
+            boxes.append(np.array(box))
+            scores.append(float(score))
 
-            box[:, 0] = np.clip(
-                np.round(box[:, 0] / width * dest_width), 0, dest_width)
-            box[:, 1] = np.clip(
-                np.round(box[:, 1] / height * dest_height), 0, dest_height)
-            boxes.append(box.astype(np.int16))
-            scores.append(score)
-        return np.array(boxes, dtype=np.int16), scores
+        if not boxes:
+            return np.array(boxes, dtype=np.int16), scores
+        # 所有框一次性缩放回原图尺寸
+        boxes = np.array(boxes)
+        boxes[:, :, 0] = np.clip(
+            np.round(boxes[:, :, 0] / width * dest_width), 0, dest_width)
+        boxes[:, :, 1] = np.clip(
+            np.round(boxes[:, :, 1] / height * dest_height), 0, dest_height)
+        return boxes.astype(np.int16), scores
+
+    def unclip_distances(self, boxes):
+        '''
+        unclip_distances: offset distances used by unclip for boxes with shape (N, 4, 2), computed at once
+        '''
+        polys = shapely.polygons(boxes)
+        return shapely.area(polys) * self.unclip_ratio / shapely.length(polys)
 
-    def unclip(self, box):
-        unclip_ratio = self.unclip_ratio
-        poly = Polygon(box)
-        distance = poly.area * unclip_ratio / poly.length
+    def unclip(self, box, distance=None):
+        if distance is None:
+            poly = Polygon(box)
+            distance = poly.area * self.unclip_ratio / poly.length
         offset = pyclipper.PyclipperOffset()
         offset.AddPath(box, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
         expanded = np.array(offset.Execute(distance))
@@ -135,6 +154,46 @@ class DBPostProcess(object):
         cv2.fillPoly(mask, box.reshape(1, -1, 2).astype(np.int32), 1)
         return cv2.mean(bitmap[ymin:ymax + 1, xmin:xmax + 1], mask)[0]
 
+    def box_scores_fast(self, bitmap, boxes):
+        '''
+        box_scores_fast: batched box_score_fast for boxes with shape (N, 4, 2)
+        轴对齐矩形框(文本行的绝大多数)经fillPoly得到的掩码就是一个矩形, 用积分图一次算出所有这类框的均值;
+        其他框, 以及均值与box_thresh过于接近、求和顺序可能影响过滤结果的框, 仍逐个调用box_score_fast,
+        因此保留下来的框与逐个计算完全一致。
+        '''
+        scores = np.zeros(len(boxes), dtype=np.float64)
+        if len(boxes) == 0:
+            return scores
+        h, w = bitmap.shape[:2]
+        xmin = np.clip(np.floor(boxes[:, :, 0].min(axis=1)).astype(np.int32), 0, w - 1)
+        xmax = np.clip(np.ceil(boxes[:, :, 0].max(axis=1)).astype(np.int32), 0, w - 1)
+        ymin = np.clip(np.floor(boxes[:, :, 1].min(axis=1)).astype(np.int32), 0, h - 1)
+        ymax = np.clip(np.ceil(boxes[:, :, 1].max(axis=1)).astype(np.int32), 0, h - 1)
+
+        # 与box_score_fast一致: 先平移到掩码坐标系再截断为整数
+        local_x = (boxes[:, :, 0] - xmin[:, None]).astype(np.float32).astype(np.int32)
+        local_y = (boxes[:, :, 1] - ymin[:, None]).astype(np.float32).astype(np.int32)
+        edge_dx = local_x - np.roll(local_x, 1, axis=1)
+        edge_dy = local_y - np.roll(local_y, 1, axis=1)
+        axis_aligned = np.all((edge_dx == 0) | (edge_dy == 0), axis=1)
+
+        # fillPoly对轴对齐矩形填充的是含边界的矩形区域, 再与掩码范围求交
+        x0 = xmin + np.maximum(local_x.min(axis=1), 0)
+        x1 = xmin + np.minimum(local_x.max(axis=1), xmax - xmin)
+        y0 = ymin + np.maximum(local_y.min(axis=1), 0)
+        y1 = ymin + np.minimum(local_y.max(axis=1), ymax - ymin)
+        rect = axis_aligned & (x1 >= x0) & (y1 >= y0)
+
+        integral = cv2.integral(bitmap, sdepth=cv2.CV_64F)
+        x0, x1, y0, y1 = x0[rect], x1[rect] + 1, y0[rect], y1[rect] + 1
+        area = (x1 - x0) * (y1 - y0)
+        scores[rect] = (integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]) / area
+
+        exact = ~rect | (np.abs(scores - self.box_thresh) < 1e-6)
+        for index in np.flatnonzero(exact):
+            scores[index] = self.box_score_fast(bitmap, boxes[index])
+        return scores
+
     def box_score_slow(self, bitmap, contour):
         '''
         box_score_slow: use polyon mean score as the mean score
@@ -176,4 +235,82 @@ class DBPostProcess(object):
                                                    src_w, src_h)
 
             boxes_batch.append({'points': boxes})
-        return boxes_batch
\ No newline at end of file
+        return boxes_batch
+
+if __name__ == '__main__':
+    # 合成的稠密文本页面概率图上, 批量打分/unclip与逐框处理的耗时对比及结果一致性检查
+    import time
+
+    def synth_page(seed, h=1280, w=960, rotated=0.1):
+        """大量文本行, 少量倾斜行, 以及噪声斑点"""
+        rng = np.random.default_rng(seed)
+        pred = (rng.random((h, w)) * 0.2).astype(np.float32)
+        y = 4
+        while y < h - 12:
+            lh = int(rng.integers(6, 14))
+            x = int(rng.integers(2, 30))
+            while x < w - 20:
+                lw = int(rng.integers(8, 200))
+                val = rng.uniform(0.35, 0.95)
+                if rng.random() < rotated:
+                    rect = ((x + lw / 2, y + lh / 2), (lw, lh), float(rng.uniform(-8, 8)))
+                    cv2.fillPoly(pred, [cv2.boxPoints(rect).astype(np.int32)], val)
+                else:
+                    pred[y:y + lh, x:min(x + lw, w - 1)] = val + rng.random((lh, min(x + lw, w - 1) - x)) * 0.05
+                x += lw + int(rng.integers(4, 20))
+            y += lh + int(rng.integers(3, 8))
+        for _ in range(800):
+            cy, cx = rng.integers(0, h - 4), rng.integers(0, w - 4)
+            pred[cy:cy + rng.integers(1, 4), cx:cx + rng.integers(1, 4)] = rng.uniform(0.31, 0.9)
+        return pred
+
+    def boxes_from_bitmap_per_box(post_process, pred, bitmap, dest_width, dest_height):
+        """逐框打分、unclip和缩放的实现, 作为对比基准"""
+        height, width = bitmap.shape
+        contours = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        boxes = []
+        scores = []
+        for contour in contours[:post_process.max_candidates]:
+            points, sside = post_process.get_mini_boxes(contour)
+            if sside < post_process.min_size:
+                continue
+            points = np.array(points)
+            if post_process.score_mode == "fast":
+                score = post_process.box_score_fast(pred, points.reshape(-1, 2))
+            else:
+                score = post_process.box_score_slow(pred, contour)
+            if post_process.box_thresh > score:
+                continue
+            box = post_process.unclip(points).reshape(-1, 1, 2)
+            box, sside = post_process.get_mini_boxes(box)
+            if sside < post_process.min_size + 2:
+                continue
+            box = np.array(box)
+            box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0, dest_width)
+            box[:, 1] = np.clip(np.round(box[:, 1] / height * dest_height), 0, dest_height)
+            boxes.append(box.astype(np.int16))
+            scores.append(score)
+        return np.array(boxes, dtype=np.int16), scores
+
+    page_count = 6
+    for kwargs in [dict(box_thresh=0.6), dict(box_thresh=0.3), dict(box_thresh=0.6, score_mode='slow')]:
+        post_process = DBPostProcess(thresh=0.3, max_candidates=100000, unclip_ratio=1.8, **kwargs)
+        per_box_time = batched_time = 0
+        box_count = 0
+        for seed in range(page_count):
+            pred = synth_page(seed)
+            bitmap = pred > 0.3
+            start = time.perf_counter()
+            per_box_boxes, per_box_scores = boxes_from_bitmap_per_box(post_process, pred, bitmap, 1920, 2560)
+            per_box_time += time.perf_counter() - start
+            start = time.perf_counter()
+            batched_boxes, batched_scores = post_process.boxes_from_bitmap(pred, bitmap, 1920, 2560)
+            batched_time += time.perf_counter() - start
+            assert np.array_equal(per_box_boxes, batched_boxes)
+            assert np.allclose(per_box_scores, batched_scores, rtol=0, atol=1e-9)
+            box_count += len(batched_boxes)
+        print(
+            f'{kwargs}: {box_count / page_count:.0f} boxes/page, '
+            f'per-box {per_box_time / page_count * 1000:.1f} ms/page, '
+            f'batched {batched_time / page_count * 1000:.1f} ms/page'
+        )
@@ -3,10 +3,15 @@ import sys
 import numpy as np
 import time
 import torch
+from loguru import logger
 from ...pytorchocr.base_ocr_v20 import BaseOCRV20
 from . import pytorchocr_utility as utility
 from ...pytorchocr.data import create_operators, transform
 from ...pytorchocr.postprocess import build_post_process
+from mineru.utils.model_utils import is_oom_error
+
+# 批量推理与逐张推理输出的概率图允许的最大差异
+BATCH_PARITY_TOLERANCE = 1e-3
 
 
 class TextDetector(BaseOCRV20):
@@ -119,6 +124,8 @@ class TextDetector(BaseOCRV20):
         for module in self.net.modules():
             if hasattr(module, 'rep'):
                 module.rep()
+        # 输入尺寸(C, H, W) -> 批量前向与逐张前向的输出是否一致, 每种尺寸首次批量推理时检查一次
+        self.batch_parity = {}
 
     def _batch_process_same_size(self, img_list):
         """
@@ -168,7 +175,7 @@ class TextDetector(BaseOCRV20):
         with torch.no_grad():
             inp = torch.from_numpy(batch_tensor)
             inp = inp.to(self.device)
-            outputs = self.net(inp)
+            outputs = self._batch_forward(inp)
 
         # 处理输出
         preds = {}
@@ -192,18 +199,26 @@ class TextDetector(BaseOCRV20):
         batch_results = []
         total_elapse = time.time() - starttime
 
+        # DB后处理支持整批输入, 整批完成阈值化后再逐张提取检测框
+        batch_post_result = None
+        if self.det_algorithm in ['DB', 'DB++']:
+            batch_post_result = self.postprocess_op(preds, batch_shapes)
+
         for i in range(len(img_list)):
-            # 提取单个图像的预测结果
-            single_preds = {}
-            for key, value in preds.items():
-                if isinstance(value, np.ndarray):
-                    single_preds[key] = value[i:i + 1]  # 保持批次维度
-                else:
-                    single_preds[key] = value
-
-            # 后处理
-            post_result = self.postprocess_op(single_preds, batch_shapes[i:i + 1])
-            dt_boxes = post_result[0]['points']
+            if batch_post_result is not None:
+                dt_boxes = batch_post_result[i]['points']
+            else:
+                # 提取单个图像的预测结果
+                single_preds = {}
+                for key, value in preds.items():
+                    if isinstance(value, np.ndarray):
+                        single_preds[key] = value[i:i + 1]  # 保持批次维度
+                    else:
+                        single_preds[key] = value
+
+                # 后处理
+                post_result = self.postprocess_op(single_preds, batch_shapes[i:i + 1])
+                dt_boxes = post_result[0]['points']
 
             # 过滤和裁剪检测框
             if (self.det_algorithm == "SAST" and
@@ -217,6 +232,54 @@ class TextDetector(BaseOCRV20):
 
         return batch_results, total_elapse
 
+    def _batch_forward(self, inp):
+        """
+        对已在设备上的batch做前向推理
+        每种输入尺寸首次遇到多张图的batch时, 用相同输入逐张推理一次并比较输出, 一致才对该尺寸继续使用批量前向,
+        否则记录差异并在之后对该尺寸逐张前向再拼接, 预处理和后处理仍按batch进行;
+        批量前向抛出OOM以外的RuntimeError时, 该尺寸同样改为逐张前向。
+        """
+        shape_key = tuple(inp.shape[1:])
+        batch_parity = self.batch_parity.get(shape_key)
+        if batch_parity is False:
+            return self._single_forward(inp)
+        try:
+            outputs = self.net(inp)
+        except RuntimeError as e:
+            if inp.shape[0] == 1 or is_oom_error(e):
+                raise
+            self.batch_parity[shape_key] = False
+            logger.warning(
+                f"OCR det batched forward failed on {self.device} (torch {torch.__version__}, "
+                f"input shape {list(shape_key)}): {e}, falling back to single-image forward for this shape"
+            )
+            return self._single_forward(inp)
+        if batch_parity is None and inp.shape[0] > 1:
+            single_outputs = self._single_forward(inp)
+            max_diff = max(
+                (outputs[key].float() - single_outputs[key].float()).abs().max().item()
+                for key in single_outputs
+            )
+            self.batch_parity[shape_key] = max_diff <= BATCH_PARITY_TOLERANCE
+            if self.batch_parity[shape_key]:
+                logger.debug(
+                    f"OCR det batch parity check passed on {self.device}, "
+                    f"input shape {list(shape_key)}, max diff: {max_diff:.2e}"
+                )
+            else:
+                logger.warning(
+                    f"OCR det batched output differs from single-image output on {self.device} "
+                    f"(torch {torch.__version__}, input shape {list(shape_key)}, max diff: {max_diff:.2e}), "
+                    f"falling back to single-image forward for this shape"
+                )
+                return single_outputs
+        return outputs
+
+    def _single_forward(self, inp):
+        """逐张前向推理后按batch维拼接, 输出格式与self.net(inp)一致"""
+        single_outputs = [self.net(inp[i:i + 1]) for i in range(inp.shape[0])]
+        return {key: torch.cat([output[key] for output in single_outputs]) for key in single_outputs[0]}
+
     def batch_predict(self, img_list, max_batch_size=8):
         """
         批处理预测方法，支持多张图像同时检测
@@ -11,6 +11,13 @@ from . import pytorchocr_utility as utility
 from ...pytorchocr.postprocess import build_post_process
 from ...pytorchocr.modeling.backbones.rec_hgnet import ConvBNAct
 
+# 宽度分桶的步长, padding后宽度处于同一步长区间内的文本行才会放进同一个batch
+REC_WIDTH_BUCKET_STRIDE = 64
+# 输入尺寸固定或自行处理padding的算法, 不参与宽度分桶
+FIXED_SHAPE_REC_ALGORITHMS = ['SAR', 'SVTR', 'SRN', 'CAN', 'NRTR', 'ViTSTR', 'RFL']
+# uint8像素到归一化值的查找表, 与resize_norm_img中先按float64计算x / 127.5 - 1再转float32的结果逐位一致, 用于设备上的批量预处理
+REC_NORM_LUT = (np.arange(256) / 127.5 - 1).astype(np.float32)
+
 
 class TextRecognizer(BaseOCRV20):
     def __init__(self, args, **kwargs):
@@ -19,6 +26,10 @@ class TextRecognizer(BaseOCRV20):
         self.character_type = args.rec_char_type
         self.rec_batch_num = args.rec_batch_num
         self.rec_algorithm = args.rec_algorithm
+        self.rec_width_bucket = (
+            getattr(args, 'rec_width_bucket', False)
+            and self.rec_algorithm not in FIXED_SHAPE_REC_ALGORITHMS
+        )
         self.max_text_length = args.max_text_length
         postprocess_params = {
             'name': 'CTCLabelDecode',
@@ -94,6 +105,10 @@ class TextRecognizer(BaseOCRV20):
         self.load_state_dict(weights)
         self.net.eval()
         self.net.to(self.device)
+        # cuda设备上在显存中完成批量预处理的归一化和padding
+        self.norm_lut = None
+        if str(self.device).startswith('cuda'):
+            self.norm_lut = torch.from_numpy(REC_NORM_LUT).to(self.device)
         for module in self.net.modules():
             if isinstance(module, ConvBNAct):
                 if module.use_act:
@@ -101,6 +116,43 @@ class TextRecognizer(BaseOCRV20):
                 else:
                     torch.quantization.fuse_modules(module, ['conv', 'bn'], inplace=True)
 
+    def get_padded_width(self, max_wh_ratio):
+        """batch内最大宽高比为max_wh_ratio时, resize_norm_img将文本行padding到的宽度"""
+        imgC, imgH, imgW = self.rec_image_shape
+        max_wh_ratio = max(max_wh_ratio, imgW / imgH)
+        imgW = int(imgH * max_wh_ratio)
+        return max(min(imgW, self.limited_max_width), self.limited_min_width)
+
+    def get_batch_spans(self, width_list, indices, batch_num):
+        """
+        将按宽高比排序后的文本行划分为batch, 返回[(beg_img_no, end_img_no), ...]
+        未启用宽度分桶时每个batch固定batch_num张;
+        启用时按padding后的宽度分桶, 同一batch只包含同一个桶内的文本行, 且batch内padding后的总宽度
+        不超过batch_num个标准宽度, 窄文本行可以组成更大的batch, 宽文本行也不会被padding到远超自身的宽度。
+        """
+        img_num = len(indices)
+        if not self.rec_width_bucket:
+            return [(beg_img_no, min(img_num, beg_img_no + batch_num))
+                    for beg_img_no in range(0, img_num, batch_num)]
+
+        width_budget = batch_num * self.rec_image_shape[2]
+        spans = []
+        beg_img_no = 0
+        beg_bucket = None
+        for ino in range(img_num):
+            padded_width = self.get_padded_width(width_list[indices[ino]])
+            bucket = (padded_width + REC_WIDTH_BUCKET_STRIDE - 1) // REC_WIDTH_BUCKET_STRIDE
+            if ino > beg_img_no and (
+                    bucket != beg_bucket or (ino - beg_img_no + 1) * padded_width > width_budget
+            ):
+                spans.append((beg_img_no, ino))
+                beg_img_no = ino
+            if ino == beg_img_no:
+                beg_bucket = bucket
+        if img_num > beg_img_no:
+            spans.append((beg_img_no, img_num))
+        return spans
+
     def resize_norm_img(self, img, max_wh_ratio):
         imgC, imgH, imgW = self.rec_image_shape
         if self.rec_algorithm == 'NRTR' or self.rec_algorithm == 'ViTSTR':
@@ -131,9 +183,7 @@ class TextRecognizer(BaseOCRV20):
             return resized_image
 
         assert imgC == img.shape[2]
-        max_wh_ratio = max(max_wh_ratio, imgW / imgH)
-        imgW = int(imgH * max_wh_ratio)
-        imgW = max(min(imgW, self.limited_max_width), self.limited_min_width)
+        imgW = self.get_padded_width(max_wh_ratio)
         h, w = img.shape[:2]
         ratio = w / float(h)
         ratio_imgH = max(math.ceil(imgH * ratio), self.limited_min_width)
@@ -143,6 +193,40 @@ class TextRecognizer(BaseOCRV20):
         padding_im[:, :, 0:resized_w] = resized_image.transpose((2, 0, 1))
         return padding_im
 
+    def resize_norm_img_batch(self, img_list, max_wh_ratio):
+        """
+        resize_norm_img的批量版本, 结果与逐张处理后拼接的batch逐位一致。
+        各文本行resize后的uint8像素写入同一块预分配的缓冲区, 再整批归一化到预分配的float32缓冲区并将padding区域置0;
+        cuda设备上查表和padding在显存中完成, 直接返回设备上的tensor, 上传的数据量只有float32的四分之一。
+        """
+        imgC, imgH, _ = self.rec_image_shape
+        imgW = self.get_padded_width(max_wh_ratio)
+        batch = np.zeros((len(img_list), imgH, imgW, imgC), dtype=np.uint8)
+        resized_widths = np.empty(len(img_list), dtype=np.int64)
+        for i, img in enumerate(img_list):
+            assert imgC == img.shape[2]
+            h, w = img.shape[:2]
+            ratio = w / float(h)
+            ratio_imgH = max(math.ceil(imgH * ratio), self.limited_min_width)
+            resized_w = min(imgW, int(ratio_imgH))
+            batch[i, :, 0:resized_w] = cv2.resize(img, (resized_w, imgH))
+            resized_widths[i] = resized_w
+
+        if self.norm_lut is not None:
+            inp = torch.from_numpy(batch).to(self.device).permute(0, 3, 1, 2)
+            norm_img_batch = self.norm_lut[inp.long()]
+            widths = torch.from_numpy(resized_widths).to(self.device)
+            pad_mask = torch.arange(imgW, device=self.device)[None, :] >= widths[:, None]
+            return norm_img_batch.masked_fill_(pad_mask[:, None, None, :], 0.0)
+
+        # (x - 127.5) / 127.5按float32计算时对全部256个像素值都与原实现逐位一致
+        norm_img_batch = np.empty((len(img_list), imgC, imgH, imgW), dtype=np.float32)
+        np.subtract(batch.transpose((0, 3, 1, 2)), np.float32(127.5), out=norm_img_batch, dtype=np.float32)
+        np.divide(norm_img_batch, np.float32(127.5), out=norm_img_batch)
+        for i, resized_w in enumerate(resized_widths):
+            norm_img_batch[i, :, :, resized_w:] = 0
+        return norm_img_batch
+
     def resize_norm_img_svtr(self, img, image_shape):
 
         imgC, imgH, imgW = image_shape
@@ -287,7 +371,7 @@ class TextRecognizer(BaseOCRV20):
 
         return img
 
-    def __call__(self, img_list, tqdm_enable=False, tqdm_desc="OCR-rec Predict"):
+    def __call__(self, img_list, tqdm_enable=False, tqdm_desc="OCR-rec Predict", batch_num=None):
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
@@ -298,61 +382,67 @@ class TextRecognizer(BaseOCRV20):
 
         # rec_res = []
         rec_res = [['', 0.0]] * img_num
-        batch_num = self.rec_batch_num
+        if batch_num is None:
+            batch_num = self.rec_batch_num
         elapse = 0
         # for beg_img_no in range(0, img_num, batch_num):
         with tqdm(total=img_num, desc=tqdm_desc, disable=not tqdm_enable) as pbar:
-            index = 0
-            for beg_img_no in range(0, img_num, batch_num):
-                end_img_no = min(img_num, beg_img_no + batch_num)
-                norm_img_batch = []
+            for beg_img_no, end_img_no in self.get_batch_spans(width_list, indices, batch_num):
                 max_wh_ratio = width_list[indices[end_img_no - 1]]
-                for ino in range(beg_img_no, end_img_no):
-                    if self.rec_algorithm == "SAR":
-                        norm_img, _, _, valid_ratio = self.resize_norm_img_sar(
-                            img_list[indices[ino]], self.rec_image_shape)
-                        norm_img = norm_img[np.newaxis, :]
-                        valid_ratio = np.expand_dims(valid_ratio, axis=0)
-                        valid_ratios = []
-                        valid_ratios.append(valid_ratio)
-                        norm_img_batch.append(norm_img)
-
-                    elif self.rec_algorithm == "SVTR":
-                        norm_img = self.resize_norm_img_svtr(img_list[indices[ino]],
-                                                             self.rec_image_shape)
-                        norm_img = norm_img[np.newaxis, :]
-                        norm_img_batch.append(norm_img)
-                    elif self.rec_algorithm == "SRN":
-                        norm_img = self.process_image_srn(img_list[indices[ino]],
-                                                          self.rec_image_shape, 8,
-                                                          self.max_text_length)
-                        encoder_word_pos_list = []
-                        gsrm_word_pos_list = []
-                        gsrm_slf_attn_bias1_list = []
-                        gsrm_slf_attn_bias2_list = []
-                        encoder_word_pos_list.append(norm_img[1])
-                        gsrm_word_pos_list.append(norm_img[2])
-                        gsrm_slf_attn_bias1_list.append(norm_img[3])
-                        gsrm_slf_attn_bias2_list.append(norm_img[4])
-                        norm_img_batch.append(norm_img[0])
-                    elif self.rec_algorithm == "CAN":
-                        norm_img = self.norm_img_can(img_list[indices[ino]],
-                                                     max_wh_ratio)
-                        norm_img = norm_img[np.newaxis, :]
-                        norm_img_batch.append(norm_img)
-                        norm_image_mask = np.ones(norm_img.shape, dtype='float32')
-                        word_label = np.ones([1, 36], dtype='int64')
-                        norm_img_mask_batch = []
-                        word_label_list = []
-                        norm_img_mask_batch.append(norm_image_mask)
-                        word_label_list.append(word_label)
-                    else:
-                        norm_img = self.resize_norm_img(img_list[indices[ino]],
-                                                        max_wh_ratio)
-                        norm_img = norm_img[np.newaxis, :]
-                        norm_img_batch.append(norm_img)
-                norm_img_batch = np.concatenate(norm_img_batch)
-                norm_img_batch = norm_img_batch.copy()
+                batch_img_list = [img_list[indices[ino]] for ino in range(beg_img_no, end_img_no)]
+                if (
+                        self.rec_algorithm not in FIXED_SHAPE_REC_ALGORITHMS
+                        and all(img.dtype == np.uint8 for img in batch_img_list)
+                ):
+                    norm_img_batch = self.resize_norm_img_batch(batch_img_list, max_wh_ratio)
+                else:
+                    norm_img_batch = []
+                    for ino in range(beg_img_no, end_img_no):
+                        if self.rec_algorithm == "SAR":
+                            norm_img, _, _, valid_ratio = self.resize_norm_img_sar(
+                                img_list[indices[ino]], self.rec_image_shape)
+                            norm_img = norm_img[np.newaxis, :]
+                            valid_ratio = np.expand_dims(valid_ratio, axis=0)
+                            valid_ratios = []
+                            valid_ratios.append(valid_ratio)
+                            norm_img_batch.append(norm_img)
+
+                        elif self.rec_algorithm == "SVTR":
+                            norm_img = self.resize_norm_img_svtr(img_list[indices[ino]],
+                                                                 self.rec_image_shape)
+                            norm_img = norm_img[np.newaxis, :]
+                            norm_img_batch.append(norm_img)
+                        elif self.rec_algorithm == "SRN":
+                            norm_img = self.process_image_srn(img_list[indices[ino]],
+                                                              self.rec_image_shape, 8,
+                                                              self.max_text_length)
+                            encoder_word_pos_list = []
+                            gsrm_word_pos_list = []
+                            gsrm_slf_attn_bias1_list = []
+                            gsrm_slf_attn_bias2_list = []
+                            encoder_word_pos_list.append(norm_img[1])
+                            gsrm_word_pos_list.append(norm_img[2])
+                            gsrm_slf_attn_bias1_list.append(norm_img[3])
+                            gsrm_slf_attn_bias2_list.append(norm_img[4])
+                            norm_img_batch.append(norm_img[0])
+                        elif self.rec_algorithm == "CAN":
+                            norm_img = self.norm_img_can(img_list[indices[ino]],
+                                                         max_wh_ratio)
+                            norm_img = norm_img[np.newaxis, :]
+                            norm_img_batch.append(norm_img)
+                            norm_image_mask = np.ones(norm_img.shape, dtype='float32')
+                            word_label = np.ones([1, 36], dtype='int64')
+                            norm_img_mask_batch = []
+                            word_label_list = []
+                            norm_img_mask_batch.append(norm_image_mask)
+                            word_label_list.append(word_label)
+                        else:
+                            norm_img = self.resize_norm_img(img_list[indices[ino]],
+                                                            max_wh_ratio)
+                            norm_img = norm_img[np.newaxis, :]
+                            norm_img_batch.append(norm_img)
+                    norm_img_batch = np.concatenate(norm_img_batch)
+                    norm_img_batch = norm_img_batch.copy()
 
                 if self.rec_algorithm == "SRN":
                     starttime = time.time()
@@ -412,8 +502,11 @@ class TextRecognizer(BaseOCRV20):
                     starttime = time.time()
 
                     with torch.no_grad():
-                        inp = torch.from_numpy(norm_img_batch)
-                        inp = inp.to(self.device)
+                        if isinstance(norm_img_batch, torch.Tensor):
+                            inp = norm_img_batch
+                        else:
+                            inp = torch.from_numpy(norm_img_batch)
+                            inp = inp.to(self.device)
                         preds = self.net(inp)
 
                 with torch.no_grad():
@@ -423,10 +516,7 @@ class TextRecognizer(BaseOCRV20):
                     rec_res[indices[beg_img_no + rno]] = rec_result[rno]
                 elapse += time.time() - starttime
 
-                # 更新进度条，每次增加batch_size，但要注意最后一个batch可能不足batch_size
-                current_batch_size = min(batch_num, img_num - index * batch_num)
-                index += 1
-                pbar.update(current_batch_size)
+                pbar.update(end_img_no - beg_img_no)
 
         # Fix NaN values in recognition results
         for i in range(len(rec_res)):
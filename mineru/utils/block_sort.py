@@ -12,29 +12,59 @@ from mineru.utils.enum_class import BlockType, ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
 
 
-def sort_blocks_by_bbox(blocks, page_w, page_h, footnote_blocks):
+# layoutreader跨页批量推理时每个batch的页数
+LAYOUTREADER_BATCH_SIZE = 32
 
-    """获取所有line并计算正文line的高度"""
-    line_height = get_line_height(blocks)
 
-    """获取所有line并对line排序"""
-    sorted_bboxes = sort_lines_by_model(blocks, page_w, page_h, line_height, footnote_blocks)
+def sort_blocks_by_bbox(blocks, page_w, page_h, footnote_blocks):
+    return batch_sort_blocks_by_bbox([(blocks, page_w, page_h, footnote_blocks)])[0]
 
-    """根据line的中位数算block的序列关系"""
-    blocks = cal_block_index(blocks, sorted_bboxes)
 
-    """将image和table的block还原回group形式参与后续流程"""
-    blocks = revert_group_blocks(blocks)
+def batch_sort_blocks_by_bbox(page_list):
+    """
+    对多个页面的block排序, page_list中每个元素为(blocks, page_w, page_h, footnote_blocks)。
+    所有页面的line先收集起来, 由layoutreader按batch统一推理, 再分别计算各页block的顺序。
+    """
 
-    """重排block"""
-    sorted_blocks = sorted(blocks, key=lambda b: b['index'])
+    """获取所有line并计算正文line的高度"""
+    page_line_lists = []
+    page_boxes_list = []
+    for blocks, page_w, page_h, footnote_blocks in page_list:
+        line_height = get_line_height(blocks)
+        page_line_list, boxes = get_lines_for_model(blocks, page_w, page_h, line_height, footnote_blocks)
+        page_line_lists.append(page_line_list)
+        page_boxes_list.append(boxes)
 
-    """block内重排(img和table的block内多个caption或footnote的排序)"""
-    for block in sorted_blocks:
-        if block['type'] in [BlockType.IMAGE, BlockType.TABLE]:
-            block['blocks'] = sorted(block['blocks'], key=lambda b: b['index'])
+    """获取所有line并对line排序"""
+    predict_indices = [i for i, boxes in enumerate(page_boxes_list) if boxes is not None]
+    sorted_bboxes_list = [None] * len(page_list)
+    if predict_indices:
+        model_manager = ModelSingleton()
+        model = model_manager.get_model('layoutreader')
+        with torch.no_grad():
+            orders_list = batch_do_predict([page_boxes_list[i] for i in predict_indices], model)
+        for i, orders in zip(predict_indices, orders_list):
+            sorted_bboxes_list[i] = [page_line_lists[i][order] for order in orders]
+
+    sorted_blocks_list = []
+    for (blocks, _, _, _), sorted_bboxes in zip(page_list, sorted_bboxes_list):
+        """根据line的中位数算block的序列关系"""
+        blocks = cal_block_index(blocks, sorted_bboxes)
+
+        """将image和table的block还原回group形式参与后续流程"""
+        blocks = revert_group_blocks(blocks)
+
+        """重排block"""
+        sorted_blocks = sorted(blocks, key=lambda b: b['index'])
+
+        """block内重排(img和table的block内多个caption或footnote的排序)"""
+        for block in sorted_blocks:
+            if block['type'] in [BlockType.IMAGE, BlockType.TABLE]:
+                block['blocks'] = sorted(block['blocks'], key=lambda b: b['index'])
 
-    return sorted_blocks
+        sorted_blocks_list.append(sorted_blocks)
+
+    return sorted_blocks_list
 
 
 def get_line_height(blocks):
@@ -55,6 +85,21 @@ def get_line_height(blocks):
 
 
 def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks):
+    page_line_list, boxes = get_lines_for_model(fix_blocks, page_w, page_h, line_height, footnote_blocks)
+    if boxes is None:
+        return None
+
+    model_manager = ModelSingleton()
+    model = model_manager.get_model('layoutreader')
+    with torch.no_grad():
+        orders = do_predict(boxes, model)
+    sorted_bboxes = [page_line_list[i] for i in orders]
+
+    return sorted_bboxes
+
+
+def get_lines_for_model(fix_blocks, page_w, page_h, line_height, footnote_blocks):
+    """收集页面中所有line的bbox, 并转换为layoutreader的输入坐标, line过多时boxes为None"""
     page_line_list = []
 
     def add_lines_to_block(b):
@@ -88,7 +133,7 @@ def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks
         add_lines_to_block(footnote_block)
 
     if len(page_line_list) > 200:  # layoutreader最高支持512line
-        return None
+        return page_line_list, None
 
     # 使用layoutreader排序
     x_scale = 1000.0 / page_w
@@ -125,13 +170,8 @@ def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks
             1000 >= right >= left >= 0 and 1000 >= bottom >= top >= 0
         ), f'Invalid box. right: {right}, left: {left}, bottom: {bottom}, top: {top}'  # noqa: E126, E121
         boxes.append([left, top, right, bottom])
-    model_manager = ModelSingleton()
-    model = model_manager.get_model('layoutreader')
-    with torch.no_grad():
-        orders = do_predict(boxes, model)
-    sorted_bboxes = [page_line_list[i] for i in orders]
 
-    return sorted_bboxes
+    return page_line_list, boxes
 
 
 def insert_lines_into_block(block_bbox, line_height, page_w, page_h):
@@ -259,6 +299,33 @@ def do_predict(boxes: List[List[int]], model) -> List[int]:
     return parse_logits(logits, len(boxes))
 
 
+def batch_do_predict(boxes_list: List[List[List[int]]], model, batch_size: int = LAYOUTREADER_BATCH_SIZE) -> List[List[int]]:
+    """多页的boxes按长度排序后分batch推理, 减少padding, 返回与boxes_list顺序一致的orders"""
+    from mineru.model.reading_order.layout_reader import (
+        batch_boxes2inputs, parse_logits, prepare_inputs)
+
+    orders_list = [None] * len(boxes_list)
+    # 空页面不需要推理
+    sorted_indices = sorted(
+        (i for i, boxes in enumerate(boxes_list) if len(boxes) > 0), key=lambda i: len(boxes_list[i])
+    )
+    for i, boxes in enumerate(boxes_list):
+        if len(boxes) == 0:
+            orders_list[i] = []
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=FutureWarning, module="transformers")
+
+        for start in range(0, len(sorted_indices), batch_size):
+            batch_indices = sorted_indices[start: start + batch_size]
+            inputs = batch_boxes2inputs([boxes_list[i] for i in batch_indices])
+            inputs = prepare_inputs(inputs, model)
+            logits = model(**inputs).logits.cpu()
+            for logit, i in zip(logits, batch_indices):
+                orders_list[i] = parse_logits(logit, len(boxes_list[i]))
+    return orders_list
+
+
 def cal_block_index(fix_blocks, sorted_bboxes):
 
     if sorted_bboxes is not None:
@@ -1,6 +1,14 @@
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
 from loguru import logger
 
-from .pdf_image_tools import cut_image
+from .hash_utils import bytes_md5, str_md5
+from .os_env_config import get_image_export_format, get_image_export_quality, get_image_export_threads, \
+    get_page_image_id_mode
+from .pdf_image_tools import cut_image, get_crop_img, get_cut_image_path
+from .pdf_reader import image_to_bytes
 
 
 def cut_image_and_table(span, page_pil_img, page_img_md5, page_id, image_writer, scale=2):
@@ -12,6 +20,10 @@ def cut_image_and_table(span, page_pil_img, page_img_md5, page_id, image_writer,
 
     if not check_img_bbox(span["bbox"]) or not image_writer:
         span["image_path"] = ""
+    elif isinstance(image_writer, ImageExporter):
+        span["image_path"] = image_writer.submit(
+            span["bbox"], page_id, page_pil_img, return_path=return_path(span_type), scale=scale
+        )
     else:
         span["image_path"] = cut_image(
             span["bbox"], page_id, page_pil_img, return_path=return_path(span_type), image_writer=image_writer, scale=scale
@@ -20,8 +32,149 @@ def cut_image_and_table(span, page_pil_img, page_img_md5, page_id, image_writer,
     return span
 
 
+def set_pdf_doc_key(pdf_doc, pdf_bytes):
+    """记录pdf_doc对应的PDF文件的md5, 用于计算页面标识"""
+    pdf_doc._mineru_doc_key = bytes_md5(pdf_bytes)
+    return pdf_doc
+
+
+def get_page_img_id(page_pil_img, page, page_index, scale) -> str:
+    """
+    页面标识, 作为裁剪图片路径的前缀。
+    默认使用整页图片的md5, 与旧版本的图片路径一致;
+    MINERU_PAGE_IMAGE_ID_MODE=source 且pdf_doc记录了md5时, 由PDF文件的md5、页码、缩放比例和图片尺寸计算,
+    避免对每页整张图片拷贝并计算md5, 但输出的图片文件名会与旧版本不同。
+    """
+    doc_key = getattr(page.pdf, '_mineru_doc_key', None)
+    if doc_key is None or get_page_image_id_mode() == 'md5':
+        return bytes_md5(page_pil_img.tobytes())
+    return str_md5(f"{doc_key}_{page_index}_{scale}_{page_pil_img.width}x{page_pil_img.height}")
+
+
 def check_img_bbox(bbox) -> bool:
     if any([bbox[0] >= bbox[2], bbox[1] >= bbox[3]]):
         logger.warning(f"image_bboxes: 错误的box, {bbox}")
         return False
     return True
+
+
+class ImageExportPoolSingleton:
+    """常驻的图片导出线程池, 在多个文档之间复用, 线程数由环境变量 MINERU_IMAGE_EXPORT_THREADS 决定。"""
+    _instance = None
+    _executor = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                ImageExportPoolSingleton._executor = ThreadPoolExecutor(
+                    max_workers=get_image_export_threads(), thread_name_prefix="mineru-image-export"
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+            ImageExportPoolSingleton._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+class ImageExporter:
+    """
+    文档级的图片导出阶段, 替代逐个span同步地裁剪、编码、写入图片:
+    - submit同步计算并返回图片路径, 裁剪、编码和写入在线程池中执行, 与后续页面的处理并行;
+    - 同一路径只导出一次; 内容相同的裁剪图只编码、写入一次, 重复的图片不再写出, 其路径记录为第一张图片的路径;
+    - flush等待所有任务完成, 任一任务失败时抛出异常, 并将传入的page_info中重复图片的image_path改为第一张图片的路径。
+    图片格式和编码质量由环境变量 MINERU_IMAGE_EXPORT_FORMAT / MINERU_IMAGE_EXPORT_QUALITY 决定。
+    """
+    def __init__(self, image_writer):
+        self.image_writer = image_writer
+        self.image_format = get_image_export_format()
+        self.quality = get_image_export_quality()
+        self._paths = set()     # 已提交的图片路径
+        self._futures = []
+        self._encoded = {}      # (mode, size) -> [[bbox, 页面图片, scale, crc32, 图片路径]]
+        self._aliases = {}      # 重复图片的路径 -> 内容相同的第一张图片的路径
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.image_writer)
+
+    def submit(self, bbox, page_num, page_pil_img, return_path, scale=2) -> str:
+        img_path = get_cut_image_path(bbox, page_num, return_path, self.image_format)
+        if img_path not in self._paths:
+            self._paths.add(img_path)
+            self._futures.append(ImageExportPoolSingleton().get_executor().submit(
+                self._export, img_path, tuple(bbox), page_pil_img, scale
+            ))
+        return img_path
+
+    def _export(self, img_path, bbox, page_pil_img, scale):
+        crop_img = get_crop_img(bbox, page_pil_img, scale=scale)
+        size_key = (crop_img.mode, crop_img.size)
+        first_path = self._find_exported(size_key, crop_img)
+        if first_path is not None:
+            with self._lock:
+                self._aliases[img_path] = first_path
+            return
+        img_bytes = image_to_bytes(crop_img, image_format=self.image_format, quality=self.quality)
+        with self._lock:
+            # 只记录裁剪位置, 不保留裁剪图本身, 需要比较时再重新裁剪
+            self._encoded.setdefault(size_key, []).append([bbox, page_pil_img, scale, None, img_path])
+        self.image_writer.write(img_path, img_bytes)
+
+    def _find_exported(self, size_key, crop_img):
+        """
+        查找内容相同的已导出裁剪图, 返回其路径。大多数裁剪图的尺寸各不相同, 只有尺寸相同时才计算crc32,
+        crc32相同再逐字节比较, 不会因hash碰撞引用错误的图片。
+        """
+        with self._lock:
+            candidates = list(self._encoded.get(size_key, ()))
+        if not candidates:
+            return None
+        crop_bytes = crop_img.tobytes()
+        crop_crc = zlib.crc32(crop_bytes)
+        for entry in candidates:
+            bbox, page_pil_img, scale, entry_crc, img_path = entry
+            entry_bytes = None
+            if entry_crc is None:
+                entry_bytes = get_crop_img(bbox, page_pil_img, scale=scale).tobytes()
+                entry_crc = entry[3] = zlib.crc32(entry_bytes)
+            if entry_crc != crop_crc:
+                continue
+            if entry_bytes is None:
+                entry_bytes = get_crop_img(bbox, page_pil_img, scale=scale).tobytes()
+            if entry_bytes == crop_bytes:
+                return img_path
+        return None
+
+    def flush(self, page_info_list=None):
+        """等待所有图片导出完成, 并将page_info_list中重复图片的image_path替换为第一张图片的路径"""
+        futures, self._futures = self._futures, []
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            self._encoded.clear()
+        aliases, self._aliases = self._aliases, {}
+        if aliases and page_info_list is not None:
+            _replace_image_paths(page_info_list, aliases)
+
+
+def _replace_image_paths(obj, aliases):
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            image_path = obj.get("image_path")
+            if isinstance(image_path, str) and image_path in aliases:
+                obj["image_path"] = aliases[image_path]
+            stack.extend(value for value in obj.values() if isinstance(value, (dict, list)))
+        elif isinstance(obj, list):
+            stack.extend(value for value in obj if isinstance(value, (dict, list)))
@@ -1,6 +1,7 @@
 import os
 import time
 import gc
+from collections import defaultdict
 from PIL import Image
 from loguru import logger
 import numpy as np
@@ -47,6 +48,18 @@ def crop_img(input_res, input_img, crop_paste_x=0, crop_paste_y=0):
     return return_image, return_list
 
 
+def group_indices_by_image_size(images) -> dict:
+    """按图片尺寸(宽, 高)对下标分组, 组内保持原有顺序"""
+    groups = defaultdict(list)
+    for index, image in enumerate(images):
+        if isinstance(image, Image.Image):
+            size = image.size
+        else:
+            size = (image.shape[1], image.shape[0])
+        groups[size].append(index)
+    return groups
+
+
 def get_coords_and_area(block_with_poly):
     """Extract coordinates and area from a table."""
     xmin, ymin = int(block_with_poly['poly'][0]), int(block_with_poly['poly'][1])
@@ -413,6 +426,13 @@ def get_res_list_from_layout_res(layout_res, iou_threshold=0.7, overlap_threshol
     return ocr_res_list, filtered_table_res_list, single_page_mfdetrec_res
 
 
+def is_oom_error(e: Exception) -> bool:
+    """推理异常是否为显存不足。
+    torch.cuda.OutOfMemoryError是RuntimeError的子类, npu/musa/mlu等设备的OOM通常也以RuntimeError抛出,
+    因此按异常信息判断, 不需要依赖torch。"""
+    return isinstance(e, RuntimeError) and "out of memory" in str(e).lower()
+
+
 def clean_memory(device='cuda'):
     if str(device).startswith("cuda"):
         if torch.cuda.is_available():
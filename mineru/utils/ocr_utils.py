@@ -9,6 +9,7 @@ class OcrConfidence:
     min_width = 3
 
 LINE_WIDTH_TO_HEIGHT_RATIO_THRESHOLD = 4  # 一般情况下，行宽度超过高度4倍时才是一个正常的横向文本块
+AXIS_ALIGNED_CROP_TOLERANCE = 1.0  # 文本框四个顶点与外接矩形对应顶点的偏差都不超过该像素数时，直接切片代替透视变换
 
 
 def merge_spans_to_line(spans, threshold=0.6):
@@ -413,6 +414,30 @@ def is_bbox_aligned_rect(points):
     unique_y = np.unique(y_coords)
     return len(unique_x) == 2 and len(unique_y) == 2
 
+def get_axis_aligned_crop_image(img, points, img_crop_width, img_crop_height):
+    """
+    近似轴对齐文本框的快速裁剪
+    points按左上、右上、右下、左下的顺序排列，且每个顶点与外接矩形对应顶点的偏差不超过AXIS_ALIGNED_CROP_TOLERANCE时，
+    以左上角顶点为原点直接切出与透视变换相同尺寸的区域。四个顶点恰好构成整数坐标的矩形时与透视变换的结果完全一致，
+    否则与透视变换的结果至多相差AXIS_ALIGNED_CROP_TOLERANCE像素的平移。不满足条件或切片超出图像范围时返回None。
+    """
+    xmin, ymin = points.min(axis=0)
+    xmax, ymax = points.max(axis=0)
+    bbox_points = np.array([[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]], dtype=points.dtype)
+    if np.abs(points - bbox_points).max() > AXIS_ALIGNED_CROP_TOLERANCE:
+        return None
+    left = int(round(float(points[0][0])))
+    top = int(round(float(points[0][1])))
+    img_height, img_width = img.shape[0:2]
+    if (
+        img_crop_width <= 0 or img_crop_height <= 0
+        or left < 0 or top < 0
+        or left + img_crop_width > img_width or top + img_crop_height > img_height
+    ):
+        return None
+    return img[top:top + img_crop_height, left:left + img_crop_width].copy()
+
+
 def get_rotate_crop_image(img, points):
     '''
     img_height, img_width = img.shape[0:2]
@@ -443,15 +468,17 @@ def get_rotate_crop_image(img, points):
         max(
             np.linalg.norm(points[0] - points[3]),
             np.linalg.norm(points[1] - points[2])))
-    pts_std = np.float32([[0, 0], [img_crop_width, 0],
-                          [img_crop_width, img_crop_height],
-                          [0, img_crop_height]])
-    M = cv2.getPerspectiveTransform(points, pts_std)
-    dst_img = cv2.warpPerspective(
-        img,
-        M, (img_crop_width, img_crop_height),
-        borderMode=cv2.BORDER_REPLICATE,
-        flags=cv2.INTER_CUBIC)
+    dst_img = get_axis_aligned_crop_image(img, points, img_crop_width, img_crop_height)
+    if dst_img is None:
+        pts_std = np.float32([[0, 0], [img_crop_width, 0],
+                              [img_crop_width, img_crop_height],
+                              [0, img_crop_height]])
+        M = cv2.getPerspectiveTransform(points, pts_std)
+        dst_img = cv2.warpPerspective(
+            img,
+            M, (img_crop_width, img_crop_height),
+            borderMode=cv2.BORDER_REPLICATE,
+            flags=cv2.INTER_CUBIC)
     dst_img_height, dst_img_width = dst_img.shape[0:2]
     rotate_radio = 2
     if dst_img_height * 1.0 / dst_img_width >= rotate_radio:
@@ -16,6 +16,135 @@ def get_load_images_threads() -> int:
     return get_value_from_string(env_value, 4)
 
 
+def get_load_images_shm_enable() -> bool:
+    env_value = os.getenv('MINERU_PDF_RENDER_SHM_ENABLE', 'false')
+    return env_value.lower() in ('1', 'true', 'yes')
+
+
+def get_pdf_worker_source_mode() -> str:
+    """
+    渲染子进程获取PDF的方式:
+    - file: PDF写入临时文件一次, 子进程按路径打开并由pdfium按需读取页面
+    - bytes: 每个任务将整个pdf_bytes经pickle传给子进程
+    """
+    env_value = os.getenv('MINERU_PDF_WORKER_SOURCE', 'file').lower()
+    if env_value in ('file', 'bytes'):
+        return env_value
+    return 'file'
+
+
+def get_load_images_prefetch_depth() -> int:
+    env_value = os.getenv('MINERU_PDF_RENDER_PREFETCH_DEPTH', None)
+    if env_value is not None:
+        try:
+            return max(0, int(env_value))
+        except ValueError:
+            return 1
+    return 1
+
+
+def get_pdf_render_chunk_size() -> int:
+    """预取渲染时第一个窗口的页数, 之后的窗口逐个翻倍直到推理窗口大小"""
+    env_value = os.getenv('MINERU_PDF_RENDER_CHUNK_SIZE', None)
+    return get_value_from_string(env_value, 16)
+
+
+def get_min_batch_inference_size() -> int:
+    env_value = os.getenv('MINERU_MIN_BATCH_INFERENCE_SIZE', None)
+    return get_value_from_string(env_value, 384)
+
+
+def get_pipeline_window_size() -> int:
+    """pipeline后端流式处理的页面窗口大小, 未设置时返回0表示不启用流式处理"""
+    env_value = os.getenv('MINERU_PIPELINE_WINDOW_SIZE', None)
+    return get_value_from_string(env_value, 0)
+
+
+def get_adaptive_batch_enable() -> bool:
+    """是否根据显存占用自适应调整pipeline各阶段的batch大小, 默认开启"""
+    env_value = os.getenv('MINERU_ADAPTIVE_BATCH_ENABLE', 'true')
+    return env_value.lower() in ('1', 'true', 'yes')
+
+
+def get_ocr_det_batch_enable() -> bool | None:
+    """是否对OCR检测使用批量推理, 未设置时返回None, 由ocr_det_batch_setting决定(默认开启)"""
+    env_value = os.getenv('MINERU_OCR_DET_BATCH_ENABLE', None)
+    if env_value is None:
+        return None
+    return env_value.lower() in ('1', 'true', 'yes')
+
+
+def get_adaptive_batch_target_utilization() -> float:
+    """自适应batch的目标显存占用比例, 取值范围(0, 1], 默认0.8"""
+    env_value = os.getenv('MINERU_ADAPTIVE_BATCH_TARGET_UTILIZATION', None)
+    if env_value is not None:
+        try:
+            utilization = float(env_value)
+            if 0 < utilization <= 1:
+                return utilization
+        except ValueError:
+            pass
+    return 0.8
+
+
+def get_pdf_classify_mode() -> str:
+    """
+    PDF类型判断方式:
+    - pdfminer: 抽取页面后用pdfminer检查, 默认方式
+    - fast: 基于pypdfium2直接在原文档上检查无效字符和图像覆盖率, 尚未在大规模样本上验证与pdfminer方式的一致性
+    """
+    env_value = os.getenv('MINERU_PDF_CLASSIFY_MODE', 'pdfminer').lower()
+    if env_value in ('fast', 'pdfminer'):
+        return env_value
+    return 'pdfminer'
+
+
+def get_page_image_id_mode() -> str:
+    """
+    裁剪图片路径中页面标识的计算方式:
+    - md5: 整页图片像素的md5, 与旧版本的图片路径一致, 默认方式
+    - source: 由PDF文件的md5、页码、缩放比例和图片尺寸计算, 不需要对整页图片做hash, 但会改变输出的图片文件名
+    """
+    env_value = os.getenv('MINERU_PAGE_IMAGE_ID_MODE', 'md5').lower()
+    if env_value in ('source', 'md5'):
+        return env_value
+    return 'md5'
+
+
+def get_image_export_format() -> str:
+    """裁剪图片的编码格式, 支持JPEG和WEBP, 默认JPEG"""
+    env_value = os.getenv('MINERU_IMAGE_EXPORT_FORMAT', 'JPEG').upper()
+    if env_value in ('JPEG', 'JPG'):
+        return 'JPEG'
+    if env_value == 'WEBP':
+        return 'WEBP'
+    return 'JPEG'
+
+
+def get_image_export_quality() -> int | None:
+    """裁剪图片的编码质量, 取值范围[1, 100], 未设置时使用PIL的默认值"""
+    env_value = os.getenv('MINERU_IMAGE_EXPORT_QUALITY', None)
+    if env_value is not None:
+        try:
+            quality = int(env_value)
+            if 1 <= quality <= 100:
+                return quality
+        except ValueError:
+            pass
+    return None
+
+
+def get_image_export_threads() -> int:
+    env_value = os.getenv('MINERU_IMAGE_EXPORT_THREADS', None)
+    return get_value_from_string(env_value, 4)
+
+
+def get_ocr_rec_batch_size() -> int:
+    """OCR文本识别每个batch容纳的标准宽度文本行数, 更宽的文本行按padding后的宽度折算"""
+    env_value = os.getenv('MINERU_OCR_REC_BATCH_SIZE', None)
+    return get_value_from_string(env_value, 6)
+
+
 def get_value_from_string(env_value: str, default_value: int) -> int:
     if env_value is not None:
         try:
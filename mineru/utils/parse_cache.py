@@ -0,0 +1,296 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from loguru import logger
+
+from mineru.utils.hash_utils import bytes_md5, dict_md5
+from mineru.utils.config_reader import get_llm_aided_config
+from mineru.utils.os_env_config import (
+    get_image_export_format,
+    get_image_export_quality,
+    get_page_image_id_mode,
+    get_value_from_string,
+)
+from mineru.version import __version__
+
+
+MIDDLE_JSON_FILE_NAME = "middle.json"
+MODEL_OUTPUT_FILE_NAME = "model.json"
+IMAGES_DIR_NAME = "images"
+PAGES_DIR_NAME = ".pages"
+
+
+def get_parse_cache_dir() -> str | None:
+    return os.getenv('MINERU_PARSE_CACHE_DIR', None) or None
+
+
+def get_parse_cache_max_size() -> int:
+    """缓存目录的最大容量(MB)"""
+    env_value = os.getenv('MINERU_PARSE_CACHE_MAX_SIZE', None)
+    return get_value_from_string(env_value, 10240)
+
+
+def make_parse_cache_key(
+        pdf_bytes, start_page_id, end_page_id, backend, parse_method, lang, formula_enable, table_enable
+) -> str:
+    """解析结果缓存的键, 由pdf内容、页码范围和所有影响解析结果的参数共同决定。
+
+    pdf_bytes须为用户输入的原始字节: 按页码范围重写后的pdf中pdfium会写入随机的trailer /ID, 每次都不相同。
+    """
+    return dict_md5({
+        "pdf_md5": bytes_md5(pdf_bytes),
+        "start_page_id": start_page_id,
+        "end_page_id": end_page_id,
+        "backend": backend,
+        "parse_method": parse_method,
+        "lang": lang,
+        "formula_enable": formula_enable,
+        "table_enable": table_enable,
+        "image_export_format": get_image_export_format(),
+        "image_export_quality": get_image_export_quality(),
+        "page_image_id_mode": get_page_image_id_mode(),
+        "table_merge_enable": os.getenv('MINERU_TABLE_MERGE_ENABLE', 'true').lower(),
+        "llm_aided_config": get_llm_aided_config(),
+        "version": __version__,
+    })
+
+
+def _get_image_paths(middle_json) -> set:
+    """middle_json中引用的所有图片路径(相对于图片目录)"""
+    image_paths = set()
+    stack = [middle_json]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            image_path = obj.get("image_path")
+            if isinstance(image_path, str) and image_path:
+                image_paths.add(image_path)
+            stack.extend(obj.values())
+        elif isinstance(obj, list):
+            stack.extend(obj)
+    return image_paths
+
+
+def _evict_cache_dir(cache_dir: str, max_size: int):
+    """按最近访问时间淘汰缓存条目, 直到整个缓存目录不超过max_size。
+    文档级条目(cache_dir下的子目录)和单页模型输出条目(.pages下的json文件)共用同一个容量上限。
+    """
+    entries = []
+    total_size = 0
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        if name.startswith(".") or not os.path.isdir(entry_dir):
+            continue
+        entry_size = 0
+        for root, _, files in os.walk(entry_dir):
+            for file in files:
+                try:
+                    entry_size += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    pass
+        try:
+            entry_mtime = os.stat(entry_dir).st_mtime
+        except OSError:
+            continue
+        entries.append((entry_mtime, entry_size, entry_dir))
+        total_size += entry_size
+
+    pages_dir = os.path.join(cache_dir, PAGES_DIR_NAME)
+    if os.path.isdir(pages_dir):
+        with os.scandir(pages_dir) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+    if total_size <= max_size:
+        return
+    entries.sort()
+    for _, entry_size, entry_path in entries:
+        if total_size <= max_size:
+            break
+        if os.path.isdir(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+            logger.debug(f"parse cache evicted: {os.path.basename(entry_path)}")
+        else:
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        total_size -= entry_size
+
+
+class ParseCache:
+    """基于内容寻址的解析结果磁盘缓存, 按最近访问时间进行LRU淘汰。
+
+    每个条目是cache_dir下以缓存键命名的目录, 包含model_output、middle_json以及截取的图片,
+    条目先写入临时目录再整体重命名, 多个进程共享同一缓存目录时也不会读到写了一半的条目。
+    """
+    def __init__(self, cache_dir: str, max_size_mb: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str, local_image_dir: str):
+        """命中时将缓存的图片复制到local_image_dir, 返回(middle_json, model_output), 未命中返回None"""
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, MIDDLE_JSON_FILE_NAME), "r", encoding="utf-8") as f:
+                middle_json = json.load(f)
+            with open(os.path.join(entry_dir, MODEL_OUTPUT_FILE_NAME), "r", encoding="utf-8") as f:
+                model_output = json.load(f)
+            shutil.copytree(os.path.join(entry_dir, IMAGES_DIR_NAME), local_image_dir, dirs_exist_ok=True)
+            # 更新访问时间, 用于LRU淘汰
+            os.utime(entry_dir)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        logger.info(f"parse cache hit: {key}, hits: {self.hits}, misses: {self.misses}")
+        return middle_json, model_output
+
+    def put(self, key: str, middle_json, model_output, local_image_dir: str):
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+        tmp_dir = os.path.join(self.cache_dir, f".tmp_{key}_{uuid.uuid4().hex[:8]}")
+        try:
+            os.makedirs(tmp_dir)
+            with open(os.path.join(tmp_dir, MIDDLE_JSON_FILE_NAME), "w", encoding="utf-8") as f:
+                json.dump(middle_json, f, ensure_ascii=False)
+            with open(os.path.join(tmp_dir, MODEL_OUTPUT_FILE_NAME), "w", encoding="utf-8") as f:
+                json.dump(model_output, f, ensure_ascii=False)
+            images_dir = os.path.join(tmp_dir, IMAGES_DIR_NAME)
+            os.makedirs(images_dir)
+            # local_image_dir在同一输出目录的多次解析之间共享, 只缓存middle_json中引用的图片
+            for image_path in _get_image_paths(middle_json):
+                dst_path = os.path.join(images_dir, image_path)
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                shutil.copyfile(os.path.join(local_image_dir, image_path), dst_path)
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # 其他进程已写入同一条目或写入失败, 缓存失败不影响解析结果
+            logger.warning(f"Failed to write parse cache entry {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        _evict_cache_dir(self.cache_dir, self.max_size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def make_page_model_cache_key(page_img_md5, ocr_enable, lang, formula_enable, table_enable) -> str:
+    """单页模型输出缓存的键, 由渲染后页面图像的md5和影响模型输出的参数共同决定"""
+    return dict_md5({
+        "page_img_md5": page_img_md5,
+        "ocr_enable": ocr_enable,
+        "lang": lang,
+        "formula_enable": formula_enable,
+        "table_enable": table_enable,
+        "version": __version__,
+    })
+
+
+class PageModelCache:
+    """按页缓存pipeline模型输出的layout_dets, 页面范围重新解析或中途失败后重跑时跳过已推理过的页面。
+
+    每个条目是cache_dir/.pages下以缓存键命名的json文件, 同样先写临时文件再重命名,
+    与文档级的解析结果缓存共用cache_dir的容量上限。
+    """
+    def __init__(self, cache_dir: str, max_size_mb: int):
+        self.cache_dir = cache_dir
+        self.pages_dir = os.path.join(cache_dir, PAGES_DIR_NAME)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.pages_dir, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.pages_dir, f"{key}.json")
+
+    def get(self, key: str):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                layout_dets = json.load(f)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return layout_dets
+
+    def put_many(self, items):
+        """写入多个(key, layout_dets), 写完后统一做一次淘汰"""
+        for key, layout_dets in items:
+            entry_path = self._entry_path(key)
+            tmp_path = os.path.join(self.pages_dir, f".tmp_{key}_{uuid.uuid4().hex[:8]}")
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(layout_dets, f, ensure_ascii=False)
+                os.replace(tmp_path, entry_path)
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning(f"Failed to write page model cache entry {key}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self.evict()
+
+    def evict(self):
+        _evict_cache_dir(self.cache_dir, self.max_size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_parse_cache_instances = {}
+_page_model_cache_instances = {}
+_parse_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> ParseCache | None:
+    """返回环境变量MINERU_PARSE_CACHE_DIR对应的缓存实例, 未设置时返回None表示不启用缓存"""
+    cache_dir = get_parse_cache_dir()
+    if cache_dir is None:
+        return None
+    with _parse_cache_lock:
+        if cache_dir not in _parse_cache_instances:
+            _parse_cache_instances[cache_dir] = ParseCache(cache_dir, get_parse_cache_max_size())
+        return _parse_cache_instances[cache_dir]
+
+
+def get_page_model_cache() -> PageModelCache | None:
+    """返回MINERU_PARSE_CACHE_DIR下的单页模型输出缓存实例, 未设置时返回None表示不启用缓存"""
+    cache_dir = get_parse_cache_dir()
+    if cache_dir is None:
+        return None
+    with _parse_cache_lock:
+        if cache_dir not in _page_model_cache_instances:
+            _page_model_cache_instances[cache_dir] = PageModelCache(cache_dir, get_parse_cache_max_size())
+        return _page_model_cache_instances[cache_dir]
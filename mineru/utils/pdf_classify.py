@@ -1,8 +1,10 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import ctypes
 import re
 from io import BytesIO
 import numpy as np
 import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 from loguru import logger
 from pdfminer.high_level import extract_text
 from pdfminer.pdfparser import PDFParser
@@ -13,71 +15,99 @@ from pdfminer.pdfinterp import PDFPageInterpreter
 from pdfminer.layout import LAParams, LTImage, LTFigure
 from pdfminer.converter import PDFPageAggregator
 
+from mineru.utils.os_env_config import get_pdf_classify_mode
+from mineru.utils.pdf_text_layer import get_doc_text_layer, get_cleaned_chars_count
 
-def classify(pdf_bytes):
+
+def classify(pdf_bytes, pdf_doc=None):
     """
     判断PDF文件是可以直接提取文本还是需要OCR
 
     Args:
         pdf_bytes: PDF文件的字节数据
+        pdf_doc: 可选, 由pdf_bytes打开的文档, 传入时字符统计使用该文档的文本层缓存,
+            后续提取文本时不会再次解析抽样的页面
 
     Returns:
         str: 'txt' 表示可以直接提取文本，'ocr' 表示需要OCR
     """
+    return classify_doc(pdf_bytes, pdf_doc)[0]
+
+
+def classify_doc(pdf_bytes, pdf_doc=None):
+    """
+    与classify相同, 额外返回文档是否因乱码被判定为需要OCR
+
+    Returns:
+        tuple: (文档类型, 是否为乱码文档), 乱码文档的页面不能单独判断为txt
+    """
 
     # 从字节数据加载PDF
-    sample_pdf_bytes = extract_pages(pdf_bytes)
-    pdf = pdfium.PdfDocument(sample_pdf_bytes)
+    own_pdf_doc = pdf_doc is None
+    if own_pdf_doc:
+        pdf_doc = pdfium.PdfDocument(pdf_bytes)
     try:
         # 获取PDF页数
-        page_count = len(pdf)
+        page_count = len(pdf_doc)
 
         # 如果PDF页数为0，直接返回OCR
         if page_count == 0:
-            return 'ocr'
+            return 'ocr', False
 
         # 检查的页面数（最多检查10页）
         pages_to_check = min(page_count, 10)
+        page_indices = np.random.choice(page_count, pages_to_check, replace=False).tolist()
 
         # 设置阈值：如果每页平均少于50个有效字符，认为需要OCR
         chars_threshold = 50
 
-        # 检查平均字符数和无效字符
-        if (get_avg_cleaned_chars_per_page(pdf, pages_to_check) < chars_threshold) or detect_invalid_chars(sample_pdf_bytes):
-            return 'ocr'
+        # 检查平均字符数, 扫描件在这一步即可判定, 不需要再抽取页面
+        if get_avg_cleaned_chars_per_page(pdf_doc, pages_to_check, page_indices) < chars_threshold:
+            return 'ocr', False
+
+        if get_pdf_classify_mode() == 'fast':
+            # 直接在原文档上检查无效字符和图像覆盖率
+            if detect_invalid_chars_by_pdfium(pdf_doc, page_indices):
+                return 'ocr', True
+            if get_high_image_coverage_ratio_by_pdfium(pdf_doc, page_indices) >= 0.8:
+                return 'ocr', False
+            return 'txt', False
+
+        sample_pdf_bytes = extract_pages(pdf_bytes, page_indices)
+
+        # 检查无效字符
+        if detect_invalid_chars(sample_pdf_bytes):
+            return 'ocr', True
 
         # 检查图像覆盖率
         if get_high_image_coverage_ratio(sample_pdf_bytes, pages_to_check) >= 0.8:
-            return 'ocr'
+            return 'ocr', False
 
-        return 'txt'
+        return 'txt', False
 
     except Exception as e:
         logger.error(f"判断PDF类型时出错: {e}")
-        # 出错时默认使用OCR
-        return 'ocr'
+        # 出错时默认使用OCR, 无法判断文档是否乱码, 同样不允许页面单独判断为txt
+        return 'ocr', True
 
     finally:
-        # 无论执行哪个路径，都确保PDF被关闭
-        pdf.close()
+        # 无论执行哪个路径，都确保自行打开的PDF被关闭
+        if own_pdf_doc:
+            get_doc_text_layer(pdf_doc).clear()
+            pdf_doc.close()
 
 
-def get_avg_cleaned_chars_per_page(pdf_doc, pages_to_check):
-    # 总字符数
-    total_chars = 0
+def get_avg_cleaned_chars_per_page(pdf_doc, pages_to_check, page_indices=None):
     # 清理后的总字符数
     cleaned_total_chars = 0
 
-    # 检查前几页的文本
-    for i in range(pages_to_check):
-        page = pdf_doc[i]
-        text_page = page.get_textpage()
-        text = text_page.get_text_bounded()
-        total_chars += len(text)
+    if page_indices is None:
+        page_indices = range(pages_to_check)
 
-        # 清理提取的文本，移除空白字符
-        cleaned_text = re.sub(r'\s+', '', text)
-        cleaned_total_chars += len(cleaned_text)
+    # 检查抽样页面的文本, textpage保留在文档的文本层缓存中供后续提取文本时复用
+    doc_text_layer = get_doc_text_layer(pdf_doc)
+    for i in page_indices:
+        cleaned_total_chars += doc_text_layer.get_cleaned_chars_count(i)
 
     # 计算平均每页字符数
     avg_cleaned_chars_per_page = cleaned_total_chars / pages_to_check
@@ -176,12 +206,51 @@ def get_high_image_coverage_ratio(sample_pdf_bytes, pages_to_check):
     return high_coverage_ratio
 
 
-def extract_pages(src_pdf_bytes: bytes) -> bytes:
+def get_high_image_coverage_ratio_by_pdfium(pdf_doc, page_indices):
+    """
+    get_high_image_coverage_ratio的pypdfium2版本, 统计页面顶层图像和Form XObject(对应pdfminer的LTImage/LTFigure)的面积,
+    不需要抽取页面和pdfminer解析
+    """
+    # 文档不允许提取内容时默认为高覆盖率, 与pdfminer的is_extractable判断一致
+    if not pdfium_c.FPDF_GetDocPermissions(pdf_doc.raw) & 0x10:
+        return 1.0
+
+    if len(page_indices) == 0:
+        return 0.0
+
+    high_image_coverage_pages = 0
+    for page_index in page_indices:
+        if get_page_image_coverage_ratio(pdf_doc[page_index]) >= 0.8:
+            high_image_coverage_pages += 1
+
+    return high_image_coverage_pages / len(page_indices)
+
+
+def get_page_image_coverage_ratio(page: pdfium.PdfPage) -> float:
+    """页面顶层图像和Form XObject的面积占页面面积的比例"""
+    page_width, page_height = page.get_size()
+    page_area = page_width * page_height
+
+    # 计算图像覆盖的总面积
+    image_area = 0
+    left, bottom, right, top = ctypes.c_float(), ctypes.c_float(), ctypes.c_float(), ctypes.c_float()
+    for obj_index in range(pdfium_c.FPDFPage_CountObjects(page.raw)):
+        obj = pdfium_c.FPDFPage_GetObject(page.raw, obj_index)
+        if pdfium_c.FPDFPageObj_GetType(obj) not in (pdfium_c.FPDF_PAGEOBJ_IMAGE, pdfium_c.FPDF_PAGEOBJ_FORM):
+            continue
+        if pdfium_c.FPDFPageObj_GetBounds(obj, left, bottom, right, top):
+            image_area += (right.value - left.value) * (top.value - bottom.value)
+
+    return min(image_area / page_area, 1.0) if page_area > 0 else 0
+
+
+def extract_pages(src_pdf_bytes: bytes, page_indices: list | None = None) -> bytes:
     """
     从PDF字节数据中随机提取最多10页，返回新的PDF字节数据
 
     Args:
         src_pdf_bytes: PDF文件的字节数据
+        page_indices: 可选, 指定要提取的页面, 不传时随机选择
 
     Returns:
         bytes: 提取页面后的PDF字节数据
@@ -197,11 +266,12 @@ def extract_pages(src_pdf_bytes: bytes) -> bytes:
         logger.warning("PDF is empty, return empty document")
         return b''
 
-    # 选择最多10页
-    select_page_cnt = min(10, total_page)
+    if page_indices is None:
+        # 选择最多10页
+        select_page_cnt = min(10, total_page)
 
-    # 从总页数中随机选择页面
-    page_indices = np.random.choice(total_page, select_page_cnt, replace=False).tolist()
+        # 从总页数中随机选择页面
+        page_indices = np.random.choice(total_page, select_page_cnt, replace=False).tolist()
 
     # 创建一个新的PDF文档
     sample_docs = pdfium.PdfDocument.new()
@@ -260,6 +330,58 @@ def detect_invalid_chars(sample_pdf_bytes: bytes) -> bool:
         return False   # 正常文档
 
 
+def detect_invalid_chars_by_pdfium(pdf_doc, page_indices) -> bool:
+    """
+    detect_invalid_chars的pypdfium2版本, 统计抽样页面中无法映射到unicode的字符(对应pdfminer提取结果中的(cid:xxx))的比例,
+    textpage与get_avg_cleaned_chars_per_page共用
+    """
+    doc_text_layer = get_doc_text_layer(pdf_doc)
+    total_chars = 0
+    invalid_chars = 0
+    for page_index in page_indices:
+        page_total_chars, page_invalid_chars = count_invalid_chars(doc_text_layer.get_textpage(page_index))
+        total_chars += page_total_chars
+        invalid_chars += page_invalid_chars
+    return is_invalid_chars_ratio_high(total_chars, invalid_chars)
+
+
+def count_invalid_chars(textpage: pdfium.PdfTextPage):
+    """返回textpage的字符数和其中无法映射到unicode的字符数"""
+    char_count = textpage.count_chars()
+    invalid_chars = 0
+    for char_index in range(char_count):
+        if pdfium_c.FPDFText_HasUnicodeMapError(textpage.raw, char_index) == 1:
+            invalid_chars += 1
+    return char_count, invalid_chars
+
+
+def is_invalid_chars_ratio_high(total_chars, invalid_chars) -> bool:
+    if total_chars == 0:
+        return False
+    # 当一篇文章存在5%以上的文本是乱码时,认为该文档为乱码文档
+    return invalid_chars / total_chars > 0.05
+
+
+def classify_page(page: pdfium.PdfPage, textpage: pdfium.PdfTextPage, doc_type):
+    """
+    单页判断是否需要OCR, 明显是扫描页时返回'ocr', 明显是文本页时返回'txt', 其余情况沿用文档类型doc_type。
+    只使用pypdfium2, 在渲染进程中按窗口调用, textpage由调用方加载并继续用于提取文本层。
+    """
+    try:
+        image_coverage_ratio = get_page_image_coverage_ratio(page)
+        cleaned_chars = get_cleaned_chars_count(textpage)
+        if cleaned_chars < 50 and image_coverage_ratio >= 0.8:
+            return 'ocr'
+        if cleaned_chars >= 50 and image_coverage_ratio < 0.8:
+            # 乱码页面即使有足够的字符也需要OCR
+            if is_invalid_chars_ratio_high(*count_invalid_chars(textpage)):
+                return 'ocr'
+            return 'txt'
+    except Exception as e:
+        logger.warning(f"判断页面类型时出错: {e}")
+    return doc_type
+
+
 if __name__ == '__main__':
     with open('/Users/myhloli/pdf/luanma2x10.pdf', 'rb') as f:
         p_bytes = f.read()
@@ -1,8 +1,17 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import asyncio
+import atexit
 import os
+import shutil
 import signal
+import tempfile
+import threading
 import time
+import uuid
+from collections import OrderedDict, deque
 from io import BytesIO
+from multiprocessing import resource_tracker, shared_memory
+from queue import Queue, Full
 
 import numpy as np
 import pypdfium2 as pdfium
@@ -11,13 +20,16 @@ from PIL import Image, ImageOps
 
 from mineru.data.data_reader_writer import FileBasedDataWriter
 from mineru.utils.check_sys_env import is_windows_environment
-from mineru.utils.os_env_config import get_load_images_timeout, get_load_images_threads
+from mineru.utils.os_env_config import get_load_images_timeout, get_load_images_threads, \
+    get_load_images_prefetch_depth, get_load_images_shm_enable, get_image_export_format, get_image_export_quality, \
+    get_pdf_worker_source_mode, get_pdf_render_chunk_size
 from mineru.utils.pdf_reader import image_to_b64str, image_to_bytes, page_to_image
 from mineru.utils.enum_class import ImageType
-from mineru.utils.hash_utils import str_sha256
+from mineru.utils.hash_utils import bytes_md5, str_sha256
 from mineru.utils.pdf_page_id import get_end_page_id
 
-from concurrent.futures import ProcessPoolExecutor, wait, ALL_COMPLETED
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, ALL_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
 
 def pdf_page_to_image(page: pdfium.PdfPage, dpi=200, image_type=ImageType.PIL) -> dict:
@@ -43,13 +55,184 @@ def pdf_page_to_image(page: pdfium.PdfPage, dpi=200, image_type=ImageType.PIL) -
     return image_dict
 
 
+# 常驻渲染进程中缓存最近打开的文档, 同一文档的多个页面范围无需重复解析
+_WORKER_PDF_DOC_CACHE_SIZE = 4
+_worker_pdf_doc_cache = OrderedDict()
+
+
+def _get_worker_pdf_doc(pdf_source, doc_key):
+    """pdf_source为pdf_bytes或WorkerPdfSourceSingleton写出的临时文件路径,
+    按路径打开时pdfium只读取用到的页面, 子进程中不保留整个文件的拷贝"""
+    pdf_doc = _worker_pdf_doc_cache.get(doc_key)
+    if pdf_doc is not None:
+        _worker_pdf_doc_cache.move_to_end(doc_key)
+        return pdf_doc
+    pdf_doc = pdfium.PdfDocument(pdf_source)
+    _worker_pdf_doc_cache[doc_key] = pdf_doc
+    while len(_worker_pdf_doc_cache) > _WORKER_PDF_DOC_CACHE_SIZE:
+        _, evicted_pdf_doc = _worker_pdf_doc_cache.popitem(last=False)
+        evicted_pdf_doc.close()
+    return pdf_doc
+
+
+class WorkerPdfSourceSingleton:
+    """渲染子进程使用的PDF来源。
+    每个文档只写入一次临时文件, 提交给子进程的任务中只包含文件路径, 不再每个任务pickle一份完整的pdf_bytes,
+    子进程按路径打开文档后由pdfium按需读取页面。文件按引用计数管理, 最后一个使用方释放后删除。
+    MINERU_PDF_WORKER_SOURCE=bytes 或写入临时文件失败时仍直接传递pdf_bytes。"""
+    _instance = None
+    _lock = threading.Lock()
+    _sources = {}  # doc_key -> [path, 引用计数]
+    _dir = None  # (pid, 本进程的临时目录)
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            atexit.register(cls._instance.clear)
+        return cls._instance
+
+    def _source_dir(self) -> str:
+        """本进程独占的临时目录, 由mkdtemp创建(权限0700), 其他本地用户无法读取其中的文档"""
+        pid = os.getpid()
+        if self._dir is None or self._dir[0] != pid:
+            # fork出的子进程不复用父进程的目录, 避免父进程退出时被删除
+            self._sources.clear()
+            WorkerPdfSourceSingleton._dir = (pid, tempfile.mkdtemp(prefix="mineru_pdf_sources_"))
+        return self._dir[1]
+
+    def acquire(self, pdf_bytes, doc_key):
+        """返回传给子进程的PDF来源(文件路径或pdf_bytes), 使用完毕后需调用release"""
+        if get_pdf_worker_source_mode() != 'file':
+            return pdf_bytes
+        with self._lock:
+            source = self._sources.get(doc_key)
+            if source is not None and self._dir is not None and self._dir[0] == os.getpid():
+                source[1] += 1
+                return source[0]
+            tmp_path = None
+            try:
+                source_dir = self._source_dir()
+                path = os.path.join(source_dir, f"{doc_key}.pdf")
+                tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(pdf_bytes)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Failed to write pdf source file, pass pdf bytes to workers: {e}")
+                if tmp_path is not None:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                return pdf_bytes
+            self._sources[doc_key] = [path, 1]
+            return path
+
+    def get(self, doc_key) -> str | None:
+        """已写出的文件路径, 不增加引用计数"""
+        with self._lock:
+            source = self._sources.get(doc_key)
+            return source[0] if source is not None else None
+
+    def release(self, doc_key):
+        with self._lock:
+            source = self._sources.get(doc_key)
+            if source is None:
+                return
+            source[1] -= 1
+            if source[1] > 0:
+                return
+            del self._sources[doc_key]
+        # 子进程已打开的文档持有文件句柄, 删除文件不影响其继续读取
+        try:
+            os.remove(source[0])
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            paths = [source[0] for source in self._sources.values()]
+            self._sources.clear()
+            source_dir = None
+            if self._dir is not None and self._dir[0] == os.getpid():
+                source_dir = self._dir[1]
+                WorkerPdfSourceSingleton._dir = None
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if source_dir is not None:
+            shutil.rmtree(source_dir, ignore_errors=True)
+
+
 def _load_images_from_pdf_worker(
-    pdf_bytes, dpi, start_page_id, end_page_id, image_type
+    pdf_source, dpi, start_page_id, end_page_id, image_type, doc_key
 ):
     """用于进程池的包装函数"""
-    return load_images_from_pdf_core(
-        pdf_bytes, dpi, start_page_id, end_page_id, image_type
-    )
+    pdf_doc = _get_worker_pdf_doc(pdf_source, doc_key)
+    return [
+        pdf_page_to_image(pdf_doc[index], dpi=dpi, image_type=image_type)
+        for index in range(start_page_id, end_page_id + 1)
+    ]
+
+
+def _load_images_from_pdf_to_shm_worker(
+    pdf_source, dpi, start_page_id, end_page_id, shm_prefix, doc_key
+):
+    """用于进程池的包装函数, 将页面的RGB像素写入共享内存, 仅返回轻量的描述信息,
+    避免整页位图经过pickle和管道在进程间拷贝"""
+    descriptors = []
+    pdf_doc = _get_worker_pdf_doc(pdf_source, doc_key)
+    for index in range(start_page_id, end_page_id + 1):
+        pil_img, scale = page_to_image(pdf_doc[index], dpi=dpi)
+        if pil_img.mode != "RGB":
+            pil_img = pil_img.convert("RGB")
+        np_img = np.asarray(pil_img)
+        shm = shared_memory.SharedMemory(
+            name=f"{shm_prefix}_{index}", create=True, size=max(np_img.nbytes, 1)
+        )
+        shm_view = np.ndarray(np_img.shape, dtype=np.uint8, buffer=shm.buf)
+        shm_view[:] = np_img
+        del shm_view
+        shm.close()
+        # 共享内存的生命周期由父进程负责, 避免子进程退出时被resource_tracker回收
+        resource_tracker.unregister(shm._name, "shared_memory")
+        descriptors.append({
+            "shm_name": shm.name,
+            "shape": np_img.shape,
+            "scale": scale,
+        })
+    return descriptors
+
+
+def _image_dict_from_shm(descriptor) -> dict:
+    """在父进程中映射子进程写入的共享内存并构造image_dict, 构造完成后立即释放共享内存"""
+    shm = shared_memory.SharedMemory(name=descriptor["shm_name"])
+    try:
+        # np_view 是共享内存上的零拷贝视图, 构造PIL图片时在进程内做一次内存拷贝
+        np_view = np.ndarray(descriptor["shape"], dtype=np.uint8, buffer=shm.buf)
+        pil_img = Image.fromarray(np_view)
+        del np_view
+    finally:
+        shm.close()
+        shm.unlink()
+    return {"scale": descriptor["scale"], "img_pil": pil_img}
+
+
+def _release_shm_pages(shm_prefix, start_page_id, end_page_id):
+    """异常或超时后清理可能残留的共享内存"""
+    for index in range(start_page_id, end_page_id + 1):
+        try:
+            shm = shared_memory.SharedMemory(name=f"{shm_prefix}_{index}")
+        except (FileNotFoundError, OSError):
+            continue
+        shm.close()
+        try:
+            shm.unlink()
+        except (FileNotFoundError, OSError):
+            pass
 
 
 def load_images_from_pdf(
@@ -76,59 +259,125 @@ def load_images_from_pdf(
         TimeoutError: 当转换超时时抛出
     """
     pdf_doc = pdfium.PdfDocument(pdf_bytes)
+    end_page_id = get_end_page_id(end_page_id, len(pdf_doc))
+    try:
+        images_list = _load_images_from_pdf_pages(
+            pdf_bytes, dpi, start_page_id, end_page_id, image_type, timeout, threads
+        )
+    except Exception:
+        pdf_doc.close()
+        raise
+    return images_list, pdf_doc
+
+
+def _load_images_from_pdf_pages(
+    pdf_bytes: bytes,
+    dpi,
+    start_page_id,
+    end_page_id,
+    image_type=ImageType.PIL,
+    timeout=None,
+    threads=None,
+    doc_key=None,
+):
+    """渲染[start_page_id, end_page_id]范围内的页面, end_page_id需已确定。
+    非Windows环境下渲染全部在常驻进程池中完成，父进程不访问pdfium，因此可以在后台线程中安全调用。
+    doc_key用于子进程缓存已解析的文档, 为None时使用pdf_bytes的md5。
+    """
     if is_windows_environment():
         # Windows 环境下不使用多进程
         return load_images_from_pdf_core(
             pdf_bytes,
             dpi,
             start_page_id,
-            get_end_page_id(end_page_id, len(pdf_doc)),
+            end_page_id,
             image_type,
-        ), pdf_doc
-    else:
-        if timeout is None:
-            timeout = get_load_images_timeout()
-        if threads is None:
-            threads = get_load_images_threads()
+        )
+
+    if timeout is None:
+        timeout = get_load_images_timeout()
+    if threads is None:
+        threads = get_load_images_threads()
+    if doc_key is None:
+        doc_key = bytes_md5(pdf_bytes)
+
+    source_registry = WorkerPdfSourceSingleton()
+    pdf_source = source_registry.acquire(pdf_bytes, doc_key)
+    try:
+        return _render_pages_in_pool(
+            pdf_source, dpi, start_page_id, end_page_id, image_type, timeout, threads, doc_key
+        )
+    finally:
+        source_registry.release(doc_key)
+
+
+def _render_pages_in_pool(
+    pdf_source,
+    dpi,
+    start_page_id,
+    end_page_id,
+    image_type,
+    timeout,
+    threads,
+    doc_key,
+):
+    """在常驻进程池中渲染[start_page_id, end_page_id]范围内的页面, pdf_source为文件路径或pdf_bytes"""
+    render_pool = RenderPoolSingleton()
 
-        end_page_id = get_end_page_id(end_page_id, len(pdf_doc))
+    # 计算总页数
+    total_pages = end_page_id - start_page_id + 1
 
-        # 计算总页数
-        total_pages = end_page_id - start_page_id + 1
+    # 实际使用的进程数不超过总页数
+    actual_threads = min(render_pool.max_workers, threads, total_pages)
 
-        # 实际使用的进程数不超过总页数
-        actual_threads = min(os.cpu_count() or 1, threads, total_pages)
+    # 根据实际进程数分组页面范围
+    pages_per_thread = max(1, total_pages // actual_threads)
+    page_ranges = []
 
-        # 根据实际进程数分组页面范围
-        pages_per_thread = max(1, total_pages // actual_threads)
-        page_ranges = []
+    for i in range(actual_threads):
+        range_start = start_page_id + i * pages_per_thread
+        if i == actual_threads - 1:
+            # 最后一个进程处理剩余所有页面
+            range_end = end_page_id
+        else:
+            range_end = start_page_id + (i + 1) * pages_per_thread - 1
 
-        for i in range(actual_threads):
-            range_start = start_page_id + i * pages_per_thread
-            if i == actual_threads - 1:
-                # 最后一个进程处理剩余所有页面
-                range_end = end_page_id
-            else:
-                range_end = start_page_id + (i + 1) * pages_per_thread - 1
+        page_ranges.append((range_start, range_end))
 
-            page_ranges.append((range_start, range_end))
+    logger.debug(f"PDF to images using {actual_threads} processes, page ranges: {page_ranges}")
 
-        logger.debug(f"PDF to images using {actual_threads} processes, page ranges: {page_ranges}")
+    # PIL图片通过共享内存传回父进程, base64字符串体积小, 仍走默认的pickle方式
+    use_shm = image_type == ImageType.PIL and get_load_images_shm_enable()
 
-        executor = ProcessPoolExecutor(max_workers=actual_threads)
+    # 进程池被其他调用方因超时终止或子进程崩溃时, 本次提交的任务会失败, 此时重试一次
+    for attempt in range(2):
+        executor = render_pool.get_executor()
+        shm_prefix = f"mineru_{uuid.uuid4().hex[:8]}"
+        futures = []
         try:
             # 提交所有任务
-            futures = []
             future_to_range = {}
             for range_start, range_end in page_ranges:
-                future = executor.submit(
-                    _load_images_from_pdf_worker,
-                    pdf_bytes,
-                    dpi,
-                    range_start,
-                    range_end,
-                    image_type,
-                )
+                if use_shm:
+                    future = executor.submit(
+                        _load_images_from_pdf_to_shm_worker,
+                        pdf_source,
+                        dpi,
+                        range_start,
+                        range_end,
+                        shm_prefix,
+                        doc_key,
+                    )
+                else:
+                    future = executor.submit(
+                        _load_images_from_pdf_worker,
+                        pdf_source,
+                        dpi,
+                        range_start,
+                        range_end,
+                        image_type,
+                        doc_key,
+                    )
                 futures.append(future)
                 future_to_range[future] = range_start
 
@@ -137,9 +386,10 @@ def load_images_from_pdf(
 
             # 检查是否有未完成的任务（超时情况）
             if not_done:
-                # 超时：强制终止所有子进程
-                _terminate_executor_processes(executor)
-                pdf_doc.close()
+                # 超时：强制终止所有子进程, 进程池在下次使用时重建
+                render_pool.reset(executor)
+                if use_shm:
+                    _release_shm_pages(shm_prefix, start_page_id, end_page_id)
                 raise TimeoutError(f"PDF to images conversion timeout after {timeout}s")
 
             # 所有任务完成，收集结果
@@ -148,6 +398,8 @@ def load_images_from_pdf(
                 range_start = future_to_range[future]
                 # 这里不需要 timeout，因为任务已完成
                 images_list = future.result()
+                if use_shm:
+                    images_list = [_image_dict_from_shm(descriptor) for descriptor in images_list]
                 all_results.append((range_start, images_list))
 
             # 按起始页码排序并合并结果
@@ -156,17 +408,244 @@ def load_images_from_pdf(
             for _, imgs in all_results:
                 images_list.extend(imgs)
 
-            return images_list, pdf_doc
+            return images_list
 
-        except Exception as e:
-            # 发生任何异常时，确保清理子进程
-            _terminate_executor_processes(executor)
-            pdf_doc.close()
-            if isinstance(e, TimeoutError):
-                raise
+        except TimeoutError:
+            raise
+        except BrokenProcessPool:
+            if use_shm:
+                _release_shm_pages(shm_prefix, start_page_id, end_page_id)
+            # 子进程异常退出或进程池已被其他任务终止, 重建进程池后重试一次
+            render_pool.reset(executor)
+            if attempt == 0:
+                logger.warning("Render pool is broken, restarting and retrying")
+                continue
+            raise
+        except Exception:
+            # 发生异常时取消本次提交的其余任务, 常驻进程池不受影响
+            for future in futures:
+                future.cancel()
+            if use_shm:
+                wait(futures, timeout=timeout)
+                _release_shm_pages(shm_prefix, start_page_id, end_page_id)
             raise
+
+
+class RenderPoolSingleton:
+    """常驻的PDF渲染进程池, 每个进程只创建一次并在多个文档、多个请求之间复用,
+    避免每个文档都重新创建进程。任务超时或子进程崩溃时终止所有子进程, 下次使用时自动重建。
+    进程数由环境变量 MINERU_PDF_RENDER_THREADS 决定。"""
+    _instance = None
+    _executor = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    @property
+    def max_workers(self) -> int:
+        return max(1, min(os.cpu_count() or 1, get_load_images_threads()))
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                RenderPoolSingleton._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def reset(self, executor) -> bool:
+        """终止executor的所有子进程并丢弃该进程池, 若进程池已被其他调用方重建则返回False"""
+        with self._lock:
+            if self._executor is not executor:
+                return False
+            RenderPoolSingleton._executor = None
+        _terminate_executor_processes(executor)
+        executor.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def warm_up(self):
+        """预先启动全部子进程"""
+        executor = self.get_executor()
+        wait([executor.submit(os.getpid) for _ in range(self.max_workers)])
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+            RenderPoolSingleton._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_page_windows(page_count_list, window_size, first_window_size=None):
+    """将多个文档的页面按顺序切分为不超过window_size页的窗口,
+    每个窗口是若干(pdf_idx, start_page_id, end_page_id)片段, 窗口可以跨越文档边界。
+    设置first_window_size时第一个窗口为first_window_size页, 之后每个窗口翻倍, 直到window_size。"""
+    current_size = min(first_window_size or window_size, window_size)
+    window = []
+    window_pages = 0
+    for pdf_idx, page_count in enumerate(page_count_list):
+        start_page_id = 0
+        while start_page_id < page_count:
+            take = min(current_size - window_pages, page_count - start_page_id)
+            window.append((pdf_idx, start_page_id, start_page_id + take - 1))
+            window_pages += take
+            start_page_id += take
+            if window_pages >= current_size:
+                yield window
+                window = []
+                window_pages = 0
+                current_size = min(current_size * 2, window_size)
+    if window:
+        yield window
+
+
+def iter_prefetch_windows(page_count_list, window_size, prefetch_depth=None):
+    """
+    供load_images_by_windows使用的窗口。
+    预取只能让下一个窗口的渲染与当前窗口的推理重叠, 若窗口直接取window_size, 多数文档只有一个窗口, 渲染完全无法与推理重叠。
+    因此第一个窗口只有MINERU_PDF_RENDER_CHUNK_SIZE页, 之后逐个翻倍直到window_size:
+    只有第一个小窗口的渲染处于关键路径上, 之后的窗口在前一个窗口推理时渲染, 推理的batch也很快恢复到window_size。
+    不预取时(prefetch_depth为0或Windows环境)直接按window_size切分。
+    """
+    if prefetch_depth is None:
+        prefetch_depth = get_load_images_prefetch_depth()
+    if prefetch_depth <= 0 or is_windows_environment():
+        return iter_page_windows(page_count_list, window_size)
+    return iter_page_windows(page_count_list, window_size, get_pdf_render_chunk_size())
+
+
+def load_images_by_windows(
+    pdf_bytes_list,
+    windows,
+    dpi=200,
+    image_type=ImageType.PIL,
+    prefetch_depth=None,
+    doc_keys=None,
+):
+    """按窗口依次渲染页面, 逐个产出(window, window_images), window_images与window中的片段一一对应。
+
+    后台线程最多提前渲染prefetch_depth个窗口并放入有界队列, 使第N+1个窗口的渲染与第N个窗口的推理重叠。
+    prefetch_depth为None时从环境变量MINERU_PDF_RENDER_PREFETCH_DEPTH读取, 若未设置则默认为1, 为0时不预取。
+    Windows环境下渲染在当前进程内完成, pdfium不支持多线程, 因此不预取。
+    doc_keys为与pdf_bytes_list对应的文档md5(通常取自set_pdf_doc_key记录的值), 为None时在渲染线程中计算。
+    """
+    if prefetch_depth is None:
+        prefetch_depth = get_load_images_prefetch_depth()
+
+    doc_keys = dict(enumerate(doc_keys)) if doc_keys is not None else {}
+    # 文档的临时文件在其所有窗口渲染期间保持存在, 不必每个窗口重新写出。
+    # 消费方最多落后prefetch_depth+1个窗口, 且会在窗口中继续使用该文件(如提取文本层),
+    # 因此文档最后出现的窗口之后再过prefetch_depth+2个窗口才释放
+    source_registry = WorkerPdfSourceSingleton()
+    acquired_doc_keys = {}
+    acquired_lock = threading.Lock()
+    recent_window_docs = deque()
+    release_lag = max(prefetch_depth, 0) + 2
+
+    def release_sources(pdf_indices=None):
+        with acquired_lock:
+            if pdf_indices is None:
+                pdf_indices = list(acquired_doc_keys)
+            for pdf_idx in pdf_indices:
+                if pdf_idx in acquired_doc_keys:
+                    source_registry.release(acquired_doc_keys.pop(pdf_idx))
+
+    def render_window(window):
+        window_images = []
+        for pdf_idx, start_page_id, end_page_id in window:
+            if pdf_idx not in doc_keys:
+                doc_keys[pdf_idx] = bytes_md5(pdf_bytes_list[pdf_idx])
+                if not is_windows_environment():
+                    source_registry.acquire(pdf_bytes_list[pdf_idx], doc_keys[pdf_idx])
+                    with acquired_lock:
+                        acquired_doc_keys[pdf_idx] = doc_keys[pdf_idx]
+            window_images.append(_load_images_from_pdf_pages(
+                pdf_bytes_list[pdf_idx], dpi, start_page_id, end_page_id, image_type,
+                doc_key=doc_keys[pdf_idx],
+            ))
+        recent_window_docs.append({pdf_idx for pdf_idx, _, _ in window})
+        while len(recent_window_docs) > release_lag:
+            expired_docs = recent_window_docs.popleft()
+            release_sources([
+                pdf_idx for pdf_idx in expired_docs
+                if not any(pdf_idx in window_docs for window_docs in recent_window_docs)
+            ])
+        return window_images
+
+    if prefetch_depth <= 0 or is_windows_environment():
+        try:
+            for window in windows:
+                yield window, render_window(window)
+        finally:
+            release_sources()
+        return
+
+    queue = Queue(maxsize=prefetch_depth)
+    stop_event = threading.Event()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for window in windows:
+                if not put((window, render_window(window), None)):
+                    return
+        except Exception as e:
+            put((None, None, e))
+            return
+        put(None)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            window, window_images, error = item
+            if error is not None:
+                raise error
+            yield window, window_images
+    finally:
+        # 消费方提前退出或出错时通知生产线程停止
+        stop_event.set()
+        thread.join()
+        release_sources()
+
+
+class AsyncWindowIterator:
+    """
+    在事件循环中推进load_images_by_windows返回的生成器, 生成器只在同一个线程中推进和关闭,
+    被取消时close会等正在进行的next返回后执行, 及时停止预取线程并释放子进程使用的临时文件。
+    非Windows环境下渲染在子进程中完成, 在单独的线程中等待渲染结果, 不阻塞事件循环;
+    Windows环境下渲染在当前进程内完成且pdfium不支持多线程, 直接在事件循环线程中推进, 避免与事件循环中的pdfium调用并发。
+    """
+    def __init__(self, window_iter):
+        self.window_iter = window_iter
+        self.executor = None if is_windows_environment() else ThreadPoolExecutor(max_workers=1)
+
+    async def next(self):
+        """返回下一个(window, window_images), 所有窗口产出完毕后返回None"""
+        if self.executor is None:
+            return next(self.window_iter, None)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, next, self.window_iter, None)
+
+    async def close(self):
+        if self.executor is None:
+            self.window_iter.close()
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.window_iter.close)
         finally:
-            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor.shutdown(wait=False)
 
 
 def _terminate_executor_processes(executor):
@@ -225,8 +704,24 @@ def cut_image(
 ):
     """从第page_num页的page中，根据bbox进行裁剪出一张jpg图片，返回图片路径 save_path：需要同时支持s3和本地,
     图片存放在save_path下，文件名是:
-    {page_num}_{bbox[0]}_{bbox[1]}_{bbox[2]}_{bbox[3]}.jpg , bbox内数字取整。"""
+    {page_num}_{bbox[0]}_{bbox[1]}_{bbox[2]}_{bbox[3]}.jpg , bbox内数字取整。
+    编码格式和质量可通过环境变量MINERU_IMAGE_EXPORT_FORMAT/MINERU_IMAGE_EXPORT_QUALITY设置。"""
+
+    image_format = get_image_export_format()
+    img_hash256_path = get_cut_image_path(bbox, page_num, return_path, image_format)
+
+    crop_img = get_crop_img(bbox, page_pil_img, scale=scale)
+
+    img_bytes = image_to_bytes(crop_img, image_format=image_format, quality=get_image_export_quality())
+
+    image_writer.write(img_hash256_path, img_bytes)
+    return img_hash256_path
+
+
+IMAGE_FORMAT_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
 
+
+def get_cut_image_path(bbox: tuple, page_num: int, return_path, image_format="JPEG") -> str:
     # 拼接文件名
     filename = f"{page_num}_{int(bbox[0])}_{int(bbox[1])}_{int(bbox[2])}_{int(bbox[3])}"
 
@@ -234,15 +729,8 @@ def cut_image(
     img_path = f"{return_path}_{filename}" if return_path is not None else None
 
     # 新版本生成平铺路径
-    img_hash256_path = f"{str_sha256(img_path)}.jpg"
     # img_hash256_path = f'{img_path}.jpg'
-
-    crop_img = get_crop_img(bbox, page_pil_img, scale=scale)
-
-    img_bytes = image_to_bytes(crop_img, image_format="JPEG")
-
-    image_writer.write(img_hash256_path, img_bytes)
-    return img_hash256_path
+    return f"{str_sha256(img_path)}.{IMAGE_FORMAT_EXTENSIONS[image_format]}"
 
 
 def get_crop_img(bbox: tuple, pil_img, scale=2):
@@ -34,9 +34,11 @@ def image_to_bytes(
     image: Image.Image,
     # image_format: str = "PNG",  # 也可以用 "JPEG"
     image_format: str = "JPEG",
+    quality: int | None = None,
 ) -> bytes:
+    save_kwargs = {} if quality is None else {"quality": quality}
     with BytesIO() as image_buffer:
-        image.save(image_buffer, format=image_format)
+        image.save(image_buffer, format=image_format, **save_kwargs)
         return image_buffer.getvalue()
 
 
@@ -0,0 +1,295 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import math
+import re
+import threading
+import weakref
+from contextlib import contextmanager
+
+import numpy as np
+import pypdfium2 as pdfium
+from loguru import logger
+
+from mineru.utils.check_sys_env import is_windows_environment
+from mineru.utils.os_env_config import get_load_images_timeout
+from mineru.utils.pdf_text_tool import get_page
+
+# 每个子进程任务提取的页数
+TEXT_LAYER_CHUNK_SIZE = 16
+
+
+class PageTextLayer:
+    """
+    单页文本层, 由pdftext提取的字符和行组成, 以数组形式保存, 便于在进程间传递和向量化处理。
+    只保留旋转角度为0/90/180/270的行中的字符, 与txt_spans_extract的处理方式一致。
+    """
+    __slots__ = ("chars", "char_bboxes", "char_indices", "line_bboxes", "line_texts")
+
+    def __init__(self, chars, char_bboxes, char_indices, line_bboxes, line_texts):
+        self.chars = chars                  # list[str], 每个字符
+        self.char_bboxes = char_bboxes      # float64[n, 4]
+        self.char_indices = char_indices    # int64[n], 字符在页面中的原始顺序
+        self.line_bboxes = line_bboxes      # float64[m, 4]
+        self.line_texts = line_texts        # list[str], 每行所有span的文本
+
+    @classmethod
+    def from_page_dict(cls, page_dict):
+        chars = []
+        char_bboxes = []
+        char_indices = []
+        line_bboxes = []
+        line_texts = []
+        for block in page_dict['blocks']:
+            for line in block['lines']:
+                rotation_degrees = math.degrees(line['rotation'])
+                # 旋转角度不为0, 90, 180, 270的行，直接跳过（rotation_degrees的值可能不为整数）
+                if not any(abs(rotation_degrees - angle) < 0.1 for angle in [0, 90, 180, 270]):
+                    continue
+                line_bboxes.append(_bbox_to_list(line['bbox']))
+                line_texts.append(''.join(span['text'] for span in line['spans']))
+                for span in line['spans']:
+                    for char in span['chars']:
+                        chars.append(char['char'])
+                        char_bboxes.append(_bbox_to_list(char['bbox']))
+                        char_indices.append(char['char_idx'])
+        return cls(
+            chars,
+            np.asarray(char_bboxes, dtype=np.float64).reshape(-1, 4),
+            np.asarray(char_indices, dtype=np.int64),
+            np.asarray(line_bboxes, dtype=np.float64).reshape(-1, 4),
+            line_texts,
+        )
+
+    def get_char_dicts(self):
+        """转换为txt_spans_extract使用的字符字典列表"""
+        return [
+            {'char': char, 'bbox': bbox, 'char_idx': char_idx}
+            for char, bbox, char_idx in zip(self.chars, self.char_bboxes.tolist(), self.char_indices.tolist())
+        ]
+
+
+def get_cleaned_chars_count(textpage: pdfium.PdfTextPage) -> int:
+    """textpage去除空白字符后的字符数"""
+    return len(re.sub(r'\s+', '', textpage.get_text_bounded()))
+
+
+def _bbox_to_list(bbox):
+    # pdftext的Bbox对象通过.bbox取得坐标列表
+    return list(getattr(bbox, 'bbox', bbox))
+
+
+def extract_page_text_layer(page: pdfium.PdfPage, textpage: pdfium.PdfTextPage | None = None) -> PageTextLayer:
+    return PageTextLayer.from_page_dict(get_page(page, textpage=textpage))
+
+
+def _extract_text_layers_worker(pdf_source, start_page_id, end_page_id, doc_key):
+    """子进程中提取[start_page_id, end_page_id]的文本层, pdf_source为文件路径或pdf_bytes"""
+    from mineru.utils.pdf_image_tools import _get_worker_pdf_doc
+    pdf_doc = _get_worker_pdf_doc(pdf_source, doc_key)
+    return [
+        extract_page_text_layer(pdf_doc[page_index])
+        for page_index in range(start_page_id, end_page_id + 1)
+    ]
+
+
+def _classify_and_extract_text_layers_worker(pdf_source, start_page_id, end_page_id, doc_key, doc_type):
+    """子进程中逐页判断[start_page_id, end_page_id]的类型, txt页面复用判断时加载的textpage提取文本层,
+    返回[(页面类型, 文本层)], ocr页面的文本层为None"""
+    from mineru.utils.pdf_classify import classify_page
+    from mineru.utils.pdf_image_tools import _get_worker_pdf_doc
+    pdf_doc = _get_worker_pdf_doc(pdf_source, doc_key)
+    results = []
+    for page_index in range(start_page_id, end_page_id + 1):
+        page = pdf_doc[page_index]
+        textpage = page.get_textpage()
+        try:
+            page_type = classify_page(page, textpage, doc_type)
+            page_text_layer = extract_page_text_layer(page, textpage=textpage) if page_type == 'txt' else None
+        finally:
+            textpage.close()
+        results.append((page_type, page_text_layer))
+    return results
+
+
+class DocTextLayer:
+    """
+    文档级文本层缓存, 保证每页的文本层只解析一次:
+    - 类型判断时加载的textpage会被保留, 之后提取该页的文本层时直接复用;
+    - prefetch将页面的提取任务提交到渲染进程池, 与模型推理并行执行;
+    - prefetch_page_types在渲染进程池中逐页判断页面类型, 同时提取txt页面的文本层;
+    - take_page取出某页的文本层后即从缓存中删除, 流式处理时不会累积内存。
+    """
+    def __init__(self, pdf_doc: pdfium.PdfDocument):
+        self._pdf_doc_ref = weakref.ref(pdf_doc)
+        self._textpages = {}
+        self._pages = {}
+        self._futures = {}  # page_index -> (future, start_page_id)
+        self._page_types = {}
+        self._type_futures = {}  # page_index -> (future, start_page_id)
+        # 与渲染共用set_pdf_doc_key记录的md5, 未记录时在首次预取时计算
+        self._doc_key = getattr(pdf_doc, '_mineru_doc_key', None)
+        self._lock = threading.Lock()
+
+    def get_textpage(self, page_index) -> pdfium.PdfTextPage:
+        """返回某页的textpage, 加载后保留到该页的文本层被取出为止"""
+        textpage = self._textpages.get(page_index)
+        if textpage is None:
+            textpage = self._pdf_doc_ref()[page_index].get_textpage()
+            self._textpages[page_index] = textpage
+        return textpage
+
+    @contextmanager
+    def open_textpage(self, page_index):
+        """已加载时返回缓存的textpage, 否则返回临时的textpage并在退出时关闭, 不保留在缓存中"""
+        textpage = self._textpages.get(page_index)
+        if textpage is not None:
+            yield textpage
+            return
+        textpage = self._pdf_doc_ref()[page_index].get_textpage()
+        try:
+            yield textpage
+        finally:
+            textpage.close()
+
+    def get_cleaned_chars_count(self, page_index) -> int:
+        """页面去除空白字符后的字符数, 用于判断PDF类型"""
+        return get_cleaned_chars_count(self.get_textpage(page_index))
+
+    def prefetch(self, pdf_bytes, page_indices):
+        """
+        在渲染进程池中提取page_indices中尚未提取的页面, 非linux/macOS系统下不做预取。
+        按窗口调用, 使文本层提取与该窗口的模型推理并行, 且不会阻塞后续窗口的渲染任务。
+        """
+        with self._lock:
+            # 已提取、已提交或已加载textpage的页面不再重复提取
+            page_indices = [
+                page_index for page_index in page_indices
+                if page_index not in self._pages and page_index not in self._futures
+                and page_index not in self._type_futures and page_index not in self._textpages
+            ]
+        self._submit_chunks(pdf_bytes, page_indices, self._futures, _extract_text_layers_worker)
+
+    def prefetch_page_types(self, pdf_bytes, page_indices, doc_type):
+        """
+        在渲染进程池中逐页判断page_indices的类型, 无法单独判断的页面沿用doc_type, 非linux/macOS系统下不做预取。
+        txt页面复用判断时加载的textpage同时提取文本层, 每页只打开一次textpage。
+        应在该窗口推理之前提前一个窗口调用, 使判断与前一个窗口的推理并行。
+        """
+        with self._lock:
+            page_indices = [
+                page_index for page_index in page_indices
+                if page_index not in self._page_types and page_index not in self._type_futures
+            ]
+        self._submit_chunks(
+            pdf_bytes, page_indices, self._type_futures, _classify_and_extract_text_layers_worker, doc_type
+        )
+
+    def _submit_chunks(self, pdf_bytes, page_indices, futures, worker, *args):
+        """将page_indices中的连续页面按块提交到渲染进程池, 结果记录在futures中"""
+        if is_windows_environment() or not page_indices:
+            return
+        from mineru.utils.pdf_image_tools import RenderPoolSingleton, WorkerPdfSourceSingleton
+        from mineru.utils.hash_utils import bytes_md5
+
+        if self._doc_key is None:
+            self._doc_key = bytes_md5(pdf_bytes)
+        # 渲染时写出的临时文件仍存在时只传递路径, 否则传递pdf_bytes
+        pdf_source = WorkerPdfSourceSingleton().get(self._doc_key) or pdf_bytes
+        executor = RenderPoolSingleton().get_executor()
+        chunks = []
+        for page_index in sorted(page_indices):
+            if chunks and page_index == chunks[-1][-1] + 1 and len(chunks[-1]) < TEXT_LAYER_CHUNK_SIZE:
+                chunks[-1].append(page_index)
+            else:
+                chunks.append([page_index])
+        with self._lock:
+            for chunk in chunks:
+                future = executor.submit(worker, pdf_source, chunk[0], chunk[-1], self._doc_key, *args)
+                for page_index in chunk:
+                    futures[page_index] = (future, chunk[0])
+
+    def get_page_type(self, page_index, doc_type) -> str:
+        """返回某页的类型, 预取结果中txt页面的文本层放入缓存, 未预取的页面在当前进程中判断"""
+        with self._lock:
+            page_type = self._page_types.pop(page_index, None)
+            future_info = self._type_futures.pop(page_index, None)
+        if page_type is not None:
+            return page_type
+
+        if future_info is not None:
+            future, start_page_id = future_info
+            try:
+                results = future.result(timeout=get_load_images_timeout())
+            except Exception as e:
+                logger.warning(f"Page classify prefetch failed, classify in current process: {e}")
+            else:
+                with self._lock:
+                    for offset, (other_type, page_text_layer) in enumerate(results):
+                        other_index = start_page_id + offset
+                        if other_index != page_index:
+                            # 同一个任务中的其他页面放入缓存, 已被取走的页面不再放回
+                            if self._type_futures.get(other_index, (None,))[0] is not future:
+                                continue
+                            self._type_futures.pop(other_index)
+                            self._page_types[other_index] = other_type
+                        if page_text_layer is not None:
+                            self._pages[other_index] = page_text_layer
+                return results[page_index - start_page_id][0]
+
+        from mineru.utils.pdf_classify import classify_page
+        with self.open_textpage(page_index) as textpage:
+            return classify_page(self._pdf_doc_ref()[page_index], textpage, doc_type)
+
+    def take_page(self, page_index) -> PageTextLayer:
+        """取出某页的文本层, 未预取的页面在当前进程中提取"""
+        with self._lock:
+            page_text_layer = self._pages.pop(page_index, None)
+            future_info = self._futures.pop(page_index, None)
+            textpage = self._textpages.pop(page_index, None)
+        if page_text_layer is not None:
+            return page_text_layer
+
+        if future_info is not None:
+            future, start_page_id = future_info
+            try:
+                page_text_layers = future.result(timeout=get_load_images_timeout())
+            except Exception as e:
+                logger.warning(f"Text layer prefetch failed, extract in current process: {e}")
+            else:
+                with self._lock:
+                    for offset, layer in enumerate(page_text_layers):
+                        other_index = start_page_id + offset
+                        # 同一个任务中的其他页面放入缓存, 已被取走的页面不再放回
+                        if other_index != page_index and self._futures.get(other_index, (None,))[0] is future:
+                            self._futures.pop(other_index)
+                            self._pages[other_index] = layer
+                return page_text_layers[page_index - start_page_id]
+
+        page = self._pdf_doc_ref()[page_index]
+        return extract_page_text_layer(page, textpage=textpage)
+
+    def clear(self):
+        with self._lock:
+            for future, _ in list(self._futures.values()) + list(self._type_futures.values()):
+                future.cancel()
+            self._futures.clear()
+            self._type_futures.clear()
+            self._page_types.clear()
+            self._pages.clear()
+            self._textpages.clear()
+
+
+_doc_text_layers_lock = threading.Lock()
+
+
+def get_doc_text_layer(pdf_doc: pdfium.PdfDocument) -> DocTextLayer:
+    """
+    返回pdf_doc对应的文本层缓存, 随pdf_doc一起释放。
+    缓存的textpage持有对pdf_doc的引用, 因此缓存挂在pdf_doc上而不是放在以pdf_doc为键的WeakKeyDictionary中,
+    否则pdf_doc永远不会被回收。
+    """
+    with _doc_text_layers_lock:
+        doc_text_layer = getattr(pdf_doc, '_mineru_text_layer', None)
+        if doc_text_layer is None:
+            doc_text_layer = DocTextLayer(pdf_doc)
+            pdf_doc._mineru_text_layer = doc_text_layer
+        return doc_text_layer
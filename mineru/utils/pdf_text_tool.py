@@ -11,9 +11,11 @@ def get_page(
     quote_loosebox: bool =True,
     superscript_height_threshold: float = 0.7,
     line_distance_threshold: float = 0.1,
+    textpage: pdfium.PdfTextPage | None = None,
 ) -> dict:
 
-        textpage = page.get_textpage()
+        if textpage is None:
+            textpage = page.get_textpage()
         page_bbox: List[float] = page.get_bbox()
         page_width = math.ceil(abs(page_bbox[2] - page_bbox[0]))
         page_height = math.ceil(abs(page_bbox[1] - page_bbox[3]))
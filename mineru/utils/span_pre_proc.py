@@ -1,6 +1,4 @@
 # Copyright (c) Opendatalab. All rights reserved.
-import collections
-import math
 import re
 import statistics
 
@@ -12,7 +10,8 @@ from mineru.utils.boxbase import calculate_overlap_area_in_bbox1_area_ratio, cal
     get_minbox_if_overlap_by_ratio
 from mineru.utils.enum_class import BlockType, ContentType
 from mineru.utils.pdf_image_tools import get_crop_img
-from mineru.utils.pdf_text_tool import get_page
+from mineru.utils.pdf_text_layer import extract_page_text_layer
+from mineru.utils.spatial_index import BBoxIndex
 
 
 def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
@@ -30,79 +29,130 @@ def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
     other_block_bboxes = get_block_bboxes(all_bboxes, other_block_type)
     discarded_block_bboxes = get_block_bboxes(all_discarded_blocks, [BlockType.DISCARDED])
 
+    # 只有与span相交的block才可能有重叠面积, 通过空间索引筛选候选block
+    image_index = BBoxIndex(image_bboxes)
+    table_index = BBoxIndex(table_bboxes)
+    other_block_index = BBoxIndex(other_block_bboxes)
+    discarded_block_index = BBoxIndex(discarded_block_bboxes)
+
+    def overlap_any(span_bbox, block_bboxes, block_index, ratio):
+        return any(
+            calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bboxes[i]) > ratio
+            for i in block_index.query(span_bbox)
+        )
+
     new_spans = []
 
     for span in spans:
         span_bbox = span['bbox']
         span_type = span['type']
 
-        if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.4 for block_bbox in
-               discarded_block_bboxes):
+        if overlap_any(span_bbox, discarded_block_bboxes, discarded_block_index, 0.4):
             new_spans.append(span)
             continue
 
         if span_type == ContentType.IMAGE:
-            if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.5 for block_bbox in
-                   image_bboxes):
+            if overlap_any(span_bbox, image_bboxes, image_index, 0.5):
                 new_spans.append(span)
         elif span_type == ContentType.TABLE:
-            if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.5 for block_bbox in
-                   table_bboxes):
+            if overlap_any(span_bbox, table_bboxes, table_index, 0.5):
                 new_spans.append(span)
         else:
-            if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.5 for block_bbox in
-                   other_block_bboxes):
+            if overlap_any(span_bbox, other_block_bboxes, other_block_index, 0.5):
                 new_spans.append(span)
 
     return new_spans
 
 
+def _freeze(value):
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _get_equal_span_ids(spans):
+    """值相等(==)的span分配相同的id, 用于替代span之间的==比较和在列表中的in查找"""
+    ids = []
+    try:
+        id_map = {}
+        for span in spans:
+            ids.append(id_map.setdefault(_freeze(span), len(id_map)))
+    except TypeError:
+        # span中含有不可哈希的值时退回逐个比较
+        ids = []
+        for index, span in enumerate(spans):
+            ids.append(next(i for i in range(index + 1) if spans[i] == span))
+    return ids
+
+
+def _remove_dropped_spans(spans, span_ids, dropped_ids):
+    """与依次调用spans.remove(dropped_span)等价: 每个被删除的值只删除列表中第一个与之相等的span"""
+    remaining_ids = set(dropped_ids)
+    removed_indices = set()
+    for index, span_id in enumerate(span_ids):
+        if span_id in remaining_ids:
+            removed_indices.add(index)
+            remaining_ids.discard(span_id)
+    spans[:] = [span for index, span in enumerate(spans) if index not in removed_indices]
+
+
 def remove_overlaps_low_confidence_spans(spans):
     dropped_spans = []
-    #  删除重叠spans中置信度低的的那些
-    for span1 in spans:
-        for span2 in spans:
-            if span1 != span2:
+    dropped_ids = set()
+    span_ids = _get_equal_span_ids(spans)
+    candidates_list = BBoxIndex([span['bbox'] for span in spans]).query_all()
+    #  删除重叠spans中置信度低的的那些, 只有相交的span之间iou才可能大于0
+    for i, span1 in enumerate(spans):
+        for j in candidates_list[i]:
+            span2 = spans[j]
+            if span_ids[i] != span_ids[j]:
                 # span1 或 span2 任何一个都不应该在 dropped_spans 中
-                if span1 in dropped_spans or span2 in dropped_spans:
+                if span_ids[i] in dropped_ids or span_ids[j] in dropped_ids:
                     continue
                 else:
                     if calculate_iou(span1['bbox'], span2['bbox']) > 0.9:
                         if span1['score'] < span2['score']:
-                            span_need_remove = span1
+                            need_remove_index = i
                         else:
-                            span_need_remove = span2
-                        if (
-                            span_need_remove is not None
-                            and span_need_remove not in dropped_spans
-                        ):
-                            dropped_spans.append(span_need_remove)
+                            need_remove_index = j
+                        if span_ids[need_remove_index] not in dropped_ids:
+                            dropped_ids.add(span_ids[need_remove_index])
+                            dropped_spans.append(spans[need_remove_index])
 
     if len(dropped_spans) > 0:
-        for span_need_remove in dropped_spans:
-            spans.remove(span_need_remove)
+        _remove_dropped_spans(spans, span_ids, dropped_ids)
 
     return spans, dropped_spans
 
 
 def remove_overlaps_min_spans(spans):
     dropped_spans = []
-    #  删除重叠spans中较小的那些
-    for span1 in spans:
-        for span2 in spans:
-            if span1 != span2:
+    dropped_ids = set()
+    span_ids = _get_equal_span_ids(spans)
+    candidates_list = BBoxIndex([span['bbox'] for span in spans]).query_all()
+    # bbox对应的第一个span
+    first_index_by_bbox = {}
+    for index, span in enumerate(spans):
+        first_index_by_bbox.setdefault(tuple(span['bbox']), index)
+    #  删除重叠spans中较小的那些, 只有相交的span之间才可能有重叠
+    for i, span1 in enumerate(spans):
+        for j in candidates_list[i]:
+            span2 = spans[j]
+            if span_ids[i] != span_ids[j]:
                 # span1 或 span2 任何一个都不应该在 dropped_spans 中
-                if span1 in dropped_spans or span2 in dropped_spans:
+                if span_ids[i] in dropped_ids or span_ids[j] in dropped_ids:
                     continue
                 else:
                     overlap_box = get_minbox_if_overlap_by_ratio(span1['bbox'], span2['bbox'], 0.65)
                     if overlap_box is not None:
-                        span_need_remove = next((span for span in spans if span['bbox'] == overlap_box), None)
-                        if span_need_remove is not None and span_need_remove not in dropped_spans:
-                            dropped_spans.append(span_need_remove)
+                        need_remove_index = first_index_by_bbox[tuple(overlap_box)]
+                        if span_ids[need_remove_index] not in dropped_ids:
+                            dropped_ids.add(span_ids[need_remove_index])
+                            dropped_spans.append(spans[need_remove_index])
     if len(dropped_spans) > 0:
-        for span_need_remove in dropped_spans:
-            spans.remove(span_need_remove)
+        _remove_dropped_spans(spans, span_ids, dropped_ids)
 
     return spans, dropped_spans
 
@@ -121,22 +171,12 @@ def __replace_unicode(text: str):
 
 
 """pdf_text dict方案 char级别"""
-def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded_blocks):
-
-    page_dict = get_page(pdf_page)
+def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded_blocks, text_layer=None):
+    """text_layer为预先提取的该页文本层(PageTextLayer), 为None时从pdf_page提取"""
+    if text_layer is None:
+        text_layer = extract_page_text_layer(pdf_page)
 
-    page_all_chars = []
-    page_all_lines = []
-    for block in page_dict['blocks']:
-        for line in block['lines']:
-            rotation_degrees = math.degrees(line['rotation'])
-            # 旋转角度不为0, 90, 180, 270的行，直接跳过（rotation_degrees的值可能不为整数）
-            if not any(abs(rotation_degrees - angle) < 0.1 for angle in [0, 90, 180, 270]):
-                continue
-            page_all_lines.append(line)
-            for span in line['spans']:
-                for char in span['chars']:
-                    page_all_chars.append(char)
+    page_all_chars = text_layer.get_char_dicts()
 
     # 计算所有sapn的高度的中位数
     span_height_list = []
@@ -171,11 +211,10 @@ def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded
 
     """垂直的span框直接用line进行填充"""
     if len(vertical_spans) > 0:
-        for pdfium_line in page_all_lines:
+        for line_bbox, line_text in zip(text_layer.line_bboxes.tolist(), text_layer.line_texts):
             for span in vertical_spans:
-                if calculate_overlap_area_in_bbox1_area_ratio(pdfium_line['bbox'].bbox, span['bbox']) > 0.5:
-                    for pdfium_span in pdfium_line['spans']:
-                        span['content'] += pdfium_span['text']
+                if calculate_overlap_area_in_bbox1_area_ratio(line_bbox, span['bbox']) > 0.5:
+                    span['content'] += line_text
                     break
 
         for span in vertical_spans:
@@ -190,7 +229,7 @@ def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded
             span['chars'] = []
             new_spans.append(span)
 
-    need_ocr_spans = fill_char_in_spans(new_spans, page_all_chars, median_span_height)
+    need_ocr_spans = fill_char_in_spans(new_spans, page_all_chars, median_span_height, text_layer.char_bboxes)
 
     """对未填充的span进行ocr"""
     if len(need_ocr_spans) > 0:
@@ -211,29 +250,23 @@ def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded
     return spans
 
 
-def fill_char_in_spans(spans, all_chars, median_span_height):
+def fill_char_in_spans(spans, all_chars, median_span_height, char_bboxes=None):
+    """
+    将char填充到span中, 返回需要ocr的span。
+    char_bboxes为all_chars的bbox数组(float64[n, 4]), 已有时传入可避免重复构建。
+    """
     # 简单从上到下排一下序
     spans = sorted(spans, key=lambda x: x['bbox'][1])
 
-    grid_size = median_span_height
-    grid = collections.defaultdict(list)
-    for i, span in enumerate(spans):
-        start_cell = int(span['bbox'][1] / grid_size)
-        end_cell = int(span['bbox'][3] / grid_size)
-        for cell_idx in range(start_cell, end_cell + 1):
-            grid[cell_idx].append(i)
-
-    for char in all_chars:
-        char_center_y = (char['bbox'][1] + char['bbox'][3]) / 2
-        cell_idx = int(char_center_y / grid_size)
-
-        candidate_span_indices = grid.get(cell_idx, [])
+    if char_bboxes is None:
+        char_bboxes = np.asarray([char['bbox'] for char in all_chars], dtype=np.float64).reshape(-1, 4)
+    span_bboxes = np.asarray([span['bbox'] for span in spans], dtype=np.float64).reshape(-1, 4)
 
-        for span_idx in candidate_span_indices:
-            span = spans[span_idx]
-            if calculate_char_in_span(char['bbox'], span['bbox'], char['char']):
-                span['chars'].append(char)
-                break
+    # median_span_height非正时原先的网格中不会有任何候选span
+    if median_span_height > 0:
+        assignment = assign_chars_to_spans(char_bboxes, [char['char'] for char in all_chars], span_bboxes)
+        for char_index in np.flatnonzero(assignment >= 0).tolist():
+            spans[assignment[char_index]]['chars'].append(all_chars[char_index])
 
     need_ocr_spans = []
     for span in spans:
@@ -285,6 +318,71 @@ def calculate_char_in_span(char_bbox, span_bbox, char, span_height_radio=Span_He
             return False
 
 
+# 每次向量化判断的char数量
+CHAR_BLOCK_SIZE = 256
+
+
+def assign_chars_to_spans(char_bboxes, chars, span_bboxes, span_height_radio=Span_Height_Radio) -> np.ndarray:
+    """
+    calculate_char_in_span的向量化版本, 返回每个char所属span的下标, 不属于任何span时为-1。
+    每个char取按span顺序第一个满足条件的span, 与逐个调用calculate_char_in_span的结果一致。
+    char按中心点纵坐标排序后分块, 每块只与纵向范围相交的span做判断, 避免构建完整的char*span矩阵。
+    """
+    char_count = len(char_bboxes)
+    assignment = np.full(char_count, -1, dtype=np.int64)
+    if char_count == 0 or len(span_bboxes) == 0:
+        return assignment
+
+    char_center_x = (char_bboxes[:, 0] + char_bboxes[:, 2]) / 2
+    char_center_y = (char_bboxes[:, 1] + char_bboxes[:, 3]) / 2
+    # 同时属于两类的符号(如")按LINE_STOP_FLAG处理
+    is_stop_flag = np.fromiter((char in LINE_STOP_FLAG for char in chars), dtype=bool, count=char_count)
+    is_start_flag = np.fromiter((char in LINE_START_FLAG for char in chars), dtype=bool, count=char_count) & ~is_stop_flag
+
+    span_x0, span_y0, span_x1, span_y1 = span_bboxes.T
+    span_center_y = (span_y0 + span_y1) / 2
+    span_height = span_y1 - span_y0
+    max_center_offset = span_height * span_height_radio
+    stop_left_bound = span_x1 - span_height
+    start_right_bound = span_x0 + span_height
+
+    order = np.argsort(char_center_y, kind='stable')
+    for block_start in range(0, char_count, CHAR_BLOCK_SIZE):
+        char_indices = order[block_start:block_start + CHAR_BLOCK_SIZE]
+        center_y = char_center_y[char_indices]
+        # 纵向条件要求span_y0 < center_y < span_y1, 先筛出与本块纵向范围相交的span, 保持span顺序
+        candidates = np.flatnonzero((span_y0 < center_y.max()) & (span_y1 > center_y.min()))
+        if len(candidates) == 0:
+            continue
+
+        center_y = center_y[:, None]
+        center_x = char_center_x[char_indices][:, None]
+        char_x0 = char_bboxes[char_indices, 0][:, None]
+        char_x1 = char_bboxes[char_indices, 2][:, None]
+        cand_x0 = span_x0[candidates]
+        cand_x1 = span_x1[candidates]
+
+        in_y = (
+            (span_y0[candidates] < center_y) & (center_y < span_y1[candidates])
+            & (np.abs(center_y - span_center_y[candidates]) < max_center_offset[candidates])
+        )
+        hit = (cand_x0 < center_x) & (center_x < cand_x1)
+        # 结尾符号: 左边界在span右侧一个span高度内
+        hit |= is_stop_flag[char_indices][:, None] & (
+            (stop_left_bound[candidates] < char_x0) & (char_x0 < cand_x1) & (center_x > cand_x0)
+        )
+        # 开头符号: 右边界在span左侧一个span高度内
+        hit |= is_start_flag[char_indices][:, None] & (
+            (cand_x0 < char_x1) & (char_x1 < start_right_bound[candidates]) & (center_x < cand_x1)
+        )
+        hit &= in_y
+
+        has_hit = hit.any(axis=1)
+        assignment[char_indices[has_hit]] = candidates[hit[has_hit].argmax(axis=1)]
+
+    return assignment
+
+
 def chars_to_content(span):
     # 检查span中的char是否为空
     if len(span['chars']) == 0:
@@ -298,17 +396,15 @@ def chars_to_content(span):
         # Calculate the median width
         median_width = statistics.median(char_widths)
 
-        content = ''
-        for char in span['chars']:
-
+        parts = []
+        for char1, char2 in zip(span['chars'], span['chars'][1:] + [None]):
             # 如果下一个char的x0和上一个char的x1距离超过0.25个字符宽度，则需要在中间插入一个空格
-            char1 = char
-            char2 = span['chars'][span['chars'].index(char) + 1] if span['chars'].index(char) + 1 < len(span['chars']) else None
-            if char2 and char2['bbox'][0] - char1['bbox'][2] > median_width * 0.25 and char['char'] != ' ' and char2['char'] != ' ':
-                content += f"{char['char']} "
+            if char2 and char2['bbox'][0] - char1['bbox'][2] > median_width * 0.25 and char1['char'] != ' ' and char2['char'] != ' ':
+                parts.append(f"{char1['char']} ")
             else:
-                content += char['char']
+                parts.append(char1['char'])
 
+        content = ''.join(parts)
         content = __replace_unicode(content)
         content = __replace_ligatures(content)
         content = __replace_ligatures(content)
@@ -339,4 +435,27 @@ def calculate_contrast(img, img_mode) -> float:
     # 对比度定义为标准差除以平均值（加上小常数避免除零错误）
     contrast = std_dev / (mean_value + 1e-6)
     # logger.debug(f"contrast: {contrast}")
-    return round(contrast, 2)
\ No newline at end of file
+    return round(contrast, 2)
+
+if __name__ == '__main__':
+    # 稠密页面(如长表格行、公式密集的页面)上char填充的耗时
+    import random
+    import time
+
+    random.seed(0)
+    for rows, cols, chars_per_span in [(60, 6, 18), (120, 12, 18), (40, 1, 500)]:
+        spans = []
+        all_chars = []
+        for row in range(rows):
+            y = row * 14
+            for col in range(cols):
+                x = col * 5.2 * (chars_per_span + 2)
+                spans.append({'bbox': [x, y, x + 5.2 * chars_per_span, y + 12], 'type': ContentType.TEXT,
+                              'chars': [], 'content': '', 'height': 12, 'width': 5.2 * chars_per_span})
+                for k in range(chars_per_span):
+                    char_x = x + k * 5.2
+                    all_chars.append({'char': random.choice('abcdefgh.,('), 'bbox': [char_x, y + 1.5, char_x + 4.8, y + 10.5],
+                                      'char_idx': len(all_chars)})
+        start = time.time()
+        fill_char_in_spans(spans, all_chars, 12)
+        print(f'{len(spans)} spans, {len(all_chars)} chars: {round(time.time() - start, 3)}s')
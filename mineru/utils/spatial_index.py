@@ -0,0 +1,96 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import math
+from collections import defaultdict
+
+import numpy as np
+
+# 覆盖网格数超过该值的bbox不放入网格, 每次查询都作为候选
+MAX_CELLS_PER_BBOX = 64
+
+
+class BBoxIndex:
+    """
+    基于均匀网格的bbox空间索引, 用于快速找出与给定bbox相交(含边界相接)的所有bbox。
+    query返回的是候选集合经过精确相交判断后的结果, 下标按升序排列,
+    调用方可以按原来双重循环的顺序只遍历这些候选, 结果与遍历全部bbox一致。
+    """
+    def __init__(self, bboxes, cell_size: float | None = None):
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self._grid = defaultdict(list)
+        self._large = []
+        if len(self.bboxes) == 0:
+            self.cell_size = 1.0
+            return
+
+        if cell_size is None:
+            # 以bbox边长的中位数作为网格大小, 使每个bbox只落在少量网格中
+            sizes = np.maximum(self.bboxes[:, 2] - self.bboxes[:, 0], self.bboxes[:, 3] - self.bboxes[:, 1])
+            cell_size = float(np.median(sizes))
+        self.cell_size = cell_size if math.isfinite(cell_size) and cell_size >= 1 else 1.0
+
+        for index, (cx0, cy0, cx1, cy1) in enumerate(self._cell_ranges(self.bboxes)):
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_BBOX:
+                self._large.append(index)
+                continue
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._grid[(cx, cy)].append(index)
+
+    def _cell_ranges(self, bboxes):
+        # x1 < x0的bbox与任何bbox都不相交, 其网格范围为空
+        cells = np.floor(bboxes / self.cell_size).astype(np.int64)
+        return cells.tolist()
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def query(self, bbox) -> np.ndarray:
+        """返回与bbox相交的bbox下标(升序)"""
+        if len(self.bboxes) == 0:
+            return np.empty(0, dtype=np.int64)
+        cx0, cy0, cx1, cy1 = self._cell_ranges(np.asarray([bbox], dtype=np.float64))[0]
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_BBOX:
+            # 查询范围很大时直接对所有bbox做相交判断
+            candidates = np.arange(len(self.bboxes), dtype=np.int64)
+        else:
+            candidate_set = set(self._large)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    candidate_set.update(self._grid.get((cx, cy), ()))
+            if not candidate_set:
+                return np.empty(0, dtype=np.int64)
+            candidates = np.fromiter(sorted(candidate_set), dtype=np.int64, count=len(candidate_set))
+        boxes = self.bboxes[candidates]
+        x0, y0, x1, y1 = bbox
+        mask = (
+            (np.maximum(boxes[:, 0], x0) <= np.minimum(boxes[:, 2], x1))
+            & (np.maximum(boxes[:, 1], y0) <= np.minimum(boxes[:, 3], y1))
+        )
+        return candidates[mask]
+
+    def query_all(self) -> list:
+        """对索引中的每个bbox调用query, 返回每个bbox的相交下标列表"""
+        return [self.query(bbox).tolist() for bbox in self.bboxes.tolist()]
+
+
+if __name__ == '__main__':
+    # 稠密页面上span重叠处理的耗时随span数量的变化
+    import random
+    import time
+
+    from mineru.utils.span_pre_proc import remove_overlaps_low_confidence_spans, remove_overlaps_min_spans
+
+    random.seed(0)
+    for span_count in [500, 1000, 2000, 5000]:
+        spans = []
+        for _ in range(span_count):
+            x, y = random.uniform(0, 1200), random.uniform(0, 1700)
+            spans.append({
+                'bbox': [x, y, x + random.uniform(5, 60), y + random.uniform(8, 14)],
+                'score': random.random(),
+                'type': 'text',
+            })
+        start = time.time()
+        spans, _ = remove_overlaps_low_confidence_spans(spans)
+        spans, _ = remove_overlaps_min_spans(spans)
+        print(f'{span_count} spans: {round(time.time() - start, 3)}s')
@@ -0,0 +1,16 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import pytest
+
+
+@pytest.fixture
+def model_root():
+    """返回模型所在的本地目录, 模型无法下载(例如离线环境)时跳过当前测试"""
+    from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
+
+    def _model_root(relative_path: str) -> str:
+        try:
+            return auto_download_and_get_model_root_path(relative_path)
+        except Exception as e:
+            pytest.skip(f"model {relative_path} is not available: {e}")
+
+    return _model_root
@@ -0,0 +1,49 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import pytest
+
+pytest.importorskip("torch")
+
+from mineru.backend.pipeline.batch_controller import BatchSizeController
+
+
+def test_oom_retries_only_the_failed_batch():
+    """某一批OOM时只拆分重试这一批, 之前完成的批次不重新推理, 结果保持items的顺序"""
+    calls = []
+
+    def predict_fn(batch_items, batch_size):
+        calls.append(list(batch_items))
+        if len(batch_items) > 2 and batch_items[0] >= 8:
+            raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return [item * 10 for item in batch_items]
+
+    controller = BatchSizeController()
+    results = controller.run("cpu", "test_oom_backoff", predict_fn, list(range(12)), 4, 1)
+
+    assert results == [item * 10 for item in range(12)]
+    assert calls == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [8, 9], [10, 11]]
+    assert controller.get_batch_size("cpu", "test_oom_backoff", 4) == 2
+
+
+def test_batches_are_split_by_item_size():
+    """item_size_fn计入每个样本的数量, 单个样本超过batch大小时单独成批"""
+    calls = []
+
+    def predict_fn(batch_items, batch_size):
+        calls.append(list(batch_items))
+        return list(batch_items)
+
+    items = [3, 1, 5, 2, 2, 0]
+    results = BatchSizeController().run(
+        "cpu", "test_item_size", predict_fn, items, 4, 1, item_size_fn=lambda item: item
+    )
+
+    assert results == items
+    assert calls == [[3, 1], [5], [2, 2, 0]]
+
+
+def test_non_oom_errors_are_raised():
+    def predict_fn(batch_items, batch_size):
+        raise RuntimeError("shape mismatch")
+
+    with pytest.raises(RuntimeError, match="shape mismatch"):
+        BatchSizeController().run("cpu", "test_non_oom", predict_fn, [1, 2], 2, 1)
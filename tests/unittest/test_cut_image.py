@@ -0,0 +1,54 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+
+from PIL import Image
+
+from mineru.data.data_reader_writer import DataWriter
+from mineru.utils.cut_image import ImageExporter, ImageExportPoolSingleton
+
+
+class MemoryDataWriter(DataWriter):
+    def __init__(self):
+        self.written = {}
+        self._lock = threading.Lock()
+
+    def write(self, path: str, data: bytes) -> None:
+        with self._lock:
+            self.written[path] = data
+
+
+def test_identical_crops_are_written_once(monkeypatch):
+    """内容相同的裁剪图只写出一次, flush后重复图片的image_path指向第一张图片"""
+    # 单线程导出, 保证第一张图片先于重复图片完成编码
+    ImageExportPoolSingleton().shutdown()
+    monkeypatch.setenv("MINERU_IMAGE_EXPORT_THREADS", "1")
+
+    page_img = Image.new("RGB", (200, 100), "white")
+    page_img.paste(Image.new("RGB", (20, 20), "red"), (10, 10))
+    page_img.paste(Image.new("RGB", (20, 20), "red"), (110, 10))
+    page_img.paste(Image.new("RGB", (20, 20), "blue"), (150, 60))
+    other_page_img = page_img.copy()
+
+    writer = MemoryDataWriter()
+    image_exporter = ImageExporter(writer)
+    # 同页两个内容相同的区域、另一页的同一区域, 以及一个内容不同的区域
+    submits = [
+        (page_img, 0, [5, 5, 15, 15]),
+        (page_img, 0, [55, 5, 65, 15]),
+        (other_page_img, 1, [5, 5, 15, 15]),
+        (page_img, 0, [75, 30, 85, 40]),
+    ]
+    spans = []
+    for pil_img, page_num, bbox in submits:
+        img_path = image_exporter.submit(bbox, page_num, pil_img, return_path="image/page", scale=2)
+        spans.append({"type": "image", "bbox": bbox, "image_path": img_path})
+    assert len({span["image_path"] for span in spans}) == 4
+    page_info_list = [{"para_blocks": [{"lines": [{"spans": spans[:3]}]}], "discarded_blocks": [{"lines": [{"spans": spans[3:]}]}]}]
+    image_exporter.flush(page_info_list)
+    ImageExportPoolSingleton().shutdown()
+
+    first_path = spans[0]["image_path"]
+    assert spans[1]["image_path"] == first_path
+    assert spans[2]["image_path"] == first_path
+    assert spans[3]["image_path"] != first_path
+    assert sorted(writer.written) == sorted([first_path, spans[3]["image_path"]])
@@ -0,0 +1,61 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("doclayout_yolo")
+pytest.importorskip("ultralytics")
+
+from mineru.backend.pipeline.model_init import AtomModelSingleton
+from mineru.backend.pipeline.model_list import AtomicModel
+from mineru.cli.common import read_fn
+from mineru.utils.config_reader import get_device
+from mineru.utils.enum_class import ModelPath
+from mineru.utils.pdf_image_tools import load_images_from_pdf
+
+
+def test_layout_mfd_batch_parity(model_root):
+    """layout和公式检测按尺寸分组的批量推理应与逐张推理的结果一致"""
+    layout_weights = os.path.join(model_root(ModelPath.doclayout_yolo), ModelPath.doclayout_yolo)
+    mfd_weights = os.path.join(model_root(ModelPath.yolo_v8_mfd), ModelPath.yolo_v8_mfd)
+    __dir__ = os.path.dirname(os.path.abspath(__file__))
+    pdf_bytes = read_fn(os.path.join(__dir__, "pdfs", "test.pdf"))
+    images_list, pdf_doc = load_images_from_pdf(pdf_bytes)
+    pdf_doc.close()
+
+    # 不同尺寸的图片交错排列, 覆盖分组、组内分批以及结果按原顺序回填
+    page_img = images_list[0]["img_pil"]
+    half_img = page_img.resize((page_img.width // 2, page_img.height // 2))
+    top_img = page_img.crop((0, 0, page_img.width, page_img.height // 2))
+    images = [page_img, half_img, top_img, page_img, half_img, page_img, top_img]
+
+    device = get_device()
+    atom_model_manager = AtomModelSingleton()
+    layout_model = atom_model_manager.get_atom_model(
+        atom_model_name=AtomicModel.Layout,
+        doclayout_yolo_weights=layout_weights,
+        device=device,
+    )
+    mfd_model = atom_model_manager.get_atom_model(
+        atom_model_name=AtomicModel.MFD,
+        mfd_weights=mfd_weights,
+        device=device,
+    )
+
+    layout_batch_results = layout_model.batch_predict(images, batch_size=2)
+    for image, batch_res in zip(images, layout_batch_results):
+        single_res = layout_model.batch_predict([image], batch_size=1)[0]
+        assert [res["category_id"] for res in batch_res] == [res["category_id"] for res in single_res]
+        if len(single_res) > 0:
+            batch_polys = np.array([res["poly"] for res in batch_res])
+            single_polys = np.array([res["poly"] for res in single_res])
+            assert np.abs(batch_polys - single_polys).max() <= 1
+
+    mfd_batch_results = mfd_model.batch_predict(images, batch_size=2)
+    for image, batch_pred in zip(images, mfd_batch_results):
+        single_pred = mfd_model.predict(image)
+        assert batch_pred.boxes.cls.tolist() == single_pred.boxes.cls.tolist()
+        if len(single_pred.boxes) > 0:
+            assert np.abs(batch_pred.boxes.xyxy.numpy() - single_pred.boxes.xyxy.numpy()).max() <= 1
@@ -0,0 +1,107 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from mineru.backend.pipeline.model_init import AtomModelSingleton
+from mineru.backend.pipeline.model_list import AtomicModel
+from mineru.cli.common import read_fn
+from mineru.model.utils.pytorchocr.modeling.architectures.base_model import BaseModel
+from mineru.model.utils.tools.infer.predict_det import TextDetector
+from mineru.model.utils.tools.infer.pytorchocr_utility import get_arch_config
+from mineru.utils.config_reader import get_device
+from mineru.utils.enum_class import ModelPath
+from mineru.utils.pdf_image_tools import load_images_from_pdf
+
+
+def _build_det_net(model_name):
+    """按arch_config构建随机初始化的检测网络, 不需要下载权重"""
+    torch.manual_seed(0)
+    net = BaseModel(get_arch_config(model_name)).eval()
+    for module in net.modules():
+        if hasattr(module, 'rep'):
+            module.rep()
+    return net.to(get_device())
+
+
+def _text_detector_with_net(net):
+    text_detector = object.__new__(TextDetector)
+    text_detector.device = get_device()
+    text_detector.net = net
+    text_detector.batch_parity = {}
+    return text_detector
+
+
+@pytest.mark.parametrize("model_name", ["ch_PP-OCRv5_det_infer.pth", "Multilingual_PP-OCRv3_det_infer.pth"])
+def test_det_net_batch_parity(model_name):
+    """当前torch版本和设备上, 检测网络的批量前向应与逐张前向的输出一致"""
+    net = _build_det_net(model_name)
+    for height, width in [(32, 32), (64, 960), (352, 480), (960, 96)]:
+        inp = (torch.rand(4, 3, height, width) * 4 - 2).to(get_device())
+        with torch.no_grad():
+            batch_maps = net(inp)["maps"]
+            single_maps = torch.cat([net(inp[i:i + 1])["maps"] for i in range(inp.shape[0])])
+        assert (batch_maps - single_maps).abs().max().item() <= 1e-3
+
+
+def test_batch_forward_parity_is_checked_per_shape():
+    """批量前向的一致性按输入尺寸分别检查, 某一尺寸不一致时只有该尺寸改为逐张前向"""
+    det_net = _build_det_net("ch_PP-OCRv5_det_infer.pth")
+    batch_sizes = []
+
+    def net(inp):
+        batch_sizes.append(inp.shape[0])
+        outputs = det_net(inp)
+        if inp.shape[0] > 1 and inp.shape[2] == 64:
+            outputs = {"maps": outputs["maps"] + 0.1}
+        return outputs
+
+    text_detector = _text_detector_with_net(net)
+    with torch.no_grad():
+        for height, expected_batch_sizes in [(32, [3, 1, 1, 1]), (64, [3, 1, 1, 1]), (32, [3]), (64, [1, 1, 1])]:
+            batch_sizes.clear()
+            text_detector._batch_forward(torch.rand(3, 3, height, 96).to(get_device()))
+            assert batch_sizes == expected_batch_sizes
+    assert text_detector.batch_parity == {(3, 32, 96): True, (3, 64, 96): False}
+
+
+def test_ocr_det_batch_parity(model_root):
+    """批量OCR检测与逐张检测的结果应一致, 用于发现torch升级或新设备上批量推理的不一致"""
+    model_root(ModelPath.pytorch_paddle)
+    __dir__ = os.path.dirname(os.path.abspath(__file__))
+    pdf_bytes = read_fn(os.path.join(__dir__, "pdfs", "test.pdf"))
+    images_list, pdf_doc = load_images_from_pdf(pdf_bytes)
+    pdf_doc.close()
+
+    # 将页面切成相同尺寸的白底图块, 以便组成一个batch
+    tile_size = 640
+    tiles = []
+    for image_dict in images_list:
+        bgr_img = cv2.cvtColor(np.asarray(image_dict["img_pil"]), cv2.COLOR_RGB2BGR)
+        h, w = bgr_img.shape[:2]
+        for y in range(0, h, tile_size):
+            for x in range(0, w, tile_size):
+                tile = np.full((tile_size, tile_size, 3), 255, dtype=np.uint8)
+                crop = bgr_img[y:y + tile_size, x:x + tile_size]
+                tile[:crop.shape[0], :crop.shape[1]] = crop
+                tiles.append(tile)
+
+    ocr_model = AtomModelSingleton().get_atom_model(
+        atom_model_name=AtomicModel.OCR,
+        det_db_box_thresh=0.3,
+        lang="en",
+    )
+    text_detector = ocr_model.text_detector
+    text_detector.batch_parity = {}
+    batch_results = text_detector.batch_predict(tiles, len(tiles))
+    assert False not in text_detector.batch_parity.values(), "batched OCR det output differs from single-image output"
+
+    for tile, (batch_boxes, _) in zip(tiles, batch_results):
+        single_boxes, _ = text_detector(tile)
+        assert len(batch_boxes) == len(single_boxes)
+        if len(single_boxes) > 0:
+            assert np.abs(np.array(batch_boxes, dtype=np.int32) - np.array(single_boxes, dtype=np.int32)).max() <= 1
@@ -0,0 +1,40 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import cv2
+import numpy as np
+
+from mineru.utils.ocr_utils import get_axis_aligned_crop_image
+
+
+def test_axis_aligned_crop_parity():
+    """轴对齐文本框的切片快速路径应与透视变换的裁剪结果一致"""
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 256, (800, 600, 3), dtype=np.uint8), (5, 5), 0)
+    for _ in range(500):
+        w, h = int(rng.integers(1, 300)), int(rng.integers(1, 300))
+        x, y = int(rng.integers(0, 600 - w)), int(rng.integers(0, 800 - h - 1))
+        points = np.float32([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+        pts_std = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+        warped = cv2.warpPerspective(
+            img, cv2.getPerspectiveTransform(points, pts_std), (w, h),
+            borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC
+        )
+        assert np.array_equal(get_axis_aligned_crop_image(img, points, w, h), warped)
+
+        # 1像素倾斜的文本框同样走快速路径, 与透视变换的差异不超过整体平移1像素带来的差异
+        skewed = points.copy()
+        skewed[1:3, 1] += 1
+        skewed_w = int(np.linalg.norm(skewed[0] - skewed[1]))
+        skewed_h = int(max(np.linalg.norm(skewed[0] - skewed[3]), np.linalg.norm(skewed[1] - skewed[2])))
+        warped = cv2.warpPerspective(
+            img, cv2.getPerspectiveTransform(skewed, np.float32([[0, 0], [skewed_w, 0], [skewed_w, skewed_h], [0, skewed_h]])),
+            (skewed_w, skewed_h), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC
+        )
+        crop = get_axis_aligned_crop_image(img, skewed, skewed_w, skewed_h)
+        assert crop is not None
+        assert np.array_equal(crop, img[y:y + skewed_h, x:x + skewed_w])
+        crop = crop.astype(np.int32)
+        warped = warped.astype(np.int32)
+        shifted = img[y + 1:y + 1 + skewed_h, x:x + skewed_w].astype(np.int32)
+        assert np.abs(crop - warped).mean() <= np.abs(crop - shifted).mean()
+        # 双三次插值的过冲会让个别像素略超出平移1像素的差异
+        assert (np.abs(crop - warped) - np.abs(crop - shifted)).max() <= 16
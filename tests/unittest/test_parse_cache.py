@@ -0,0 +1,82 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+
+import pytest
+
+from mineru.utils.enum_class import ModelPath
+from mineru.utils.parse_cache import PAGES_DIR_NAME, PageModelCache, ParseCache, get_parse_cache
+
+
+def _write_file(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_put_caches_only_referenced_images(tmp_path):
+    """图片目录在多次解析之间共享, 缓存条目只应包含middle_json引用的图片"""
+    image_dir = tmp_path / "images"
+    _write_file(str(image_dir / "stale.jpg"), b"stale")
+    _write_file(str(image_dir / "a.jpg"), b"a")
+    _write_file(str(image_dir / "b.jpg"), b"b")
+    middle_json = {"pdf_info": [{"para_blocks": [
+        {"lines": [{"spans": [{"type": "image", "image_path": "a.jpg"}]}]},
+        {"blocks": [{"lines": [{"spans": [{"type": "table", "image_path": "b.jpg"}]}]}]},
+        {"lines": [{"spans": [{"type": "text", "content": "text"}]}]},
+    ]}]}
+
+    parse_cache = ParseCache(str(tmp_path / "cache"), 1024)
+    parse_cache.put("key", middle_json, [], str(image_dir))
+
+    restored_dir = tmp_path / "restored"
+    assert parse_cache.get("key", str(restored_dir)) == (middle_json, [])
+    assert sorted(os.listdir(restored_dir)) == ["a.jpg", "b.jpg"]
+    assert parse_cache.stats() == {"hits": 1, "misses": 0}
+
+
+def test_doc_and_page_entries_share_one_budget(tmp_path):
+    """文档级条目和单页模型输出条目共用MINERU_PARSE_CACHE_MAX_SIZE, 超出后淘汰最久未访问的条目"""
+    cache_dir = str(tmp_path / "cache")
+    image_dir = str(tmp_path / "images")
+    _write_file(os.path.join(image_dir, "a.jpg"), b"x" * 4096)
+    middle_json = {"pdf_info": [{"image_path": "a.jpg"}]}
+
+    parse_cache = ParseCache(cache_dir, 1)
+    page_model_cache = PageModelCache(cache_dir, 1)
+    parse_cache.max_size = page_model_cache.max_size = 12 * 1024
+
+    parse_cache.put("doc_0", middle_json, [], image_dir)
+    os.utime(os.path.join(cache_dir, "doc_0"), (0, 0))
+    page_model_cache.put_many([(f"page_{i}", [{"poly": [0] * 8, "text": "x" * 1024}]) for i in range(4)])
+    parse_cache.put("doc_1", middle_json, [], image_dir)
+
+    def cache_size():
+        total_size = 0
+        for root, _, files in os.walk(cache_dir):
+            total_size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+        return total_size
+
+    assert cache_size() <= parse_cache.max_size
+    assert not os.path.exists(os.path.join(cache_dir, "doc_0"))
+    assert os.path.exists(os.path.join(cache_dir, "doc_1"))
+    assert len(os.listdir(os.path.join(cache_dir, PAGES_DIR_NAME))) > 0
+
+
+def test_parse_cache_hit(tmp_path, monkeypatch, model_root):
+    """相同文档以相同参数再次解析时应命中解析结果缓存, 影响解析结果的参数不同时不命中"""
+    pytest.importorskip("torch")
+    model_root(ModelPath.doclayout_yolo)
+    model_root(ModelPath.pytorch_paddle)
+    from mineru.cli.common import do_parse, read_fn
+
+    output_dir = str(tmp_path / "output")
+    monkeypatch.setenv("MINERU_PARSE_CACHE_DIR", str(tmp_path / "cache"))
+    pdf_bytes = read_fn(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdfs", "test.pdf"))
+    parse_cache = get_parse_cache()
+    for _ in range(2):
+        do_parse(output_dir, ["test"], [pdf_bytes], ["en"], backend="pipeline")
+    assert parse_cache.stats() == {"hits": 1, "misses": 1}
+    assert os.path.exists(os.path.join(output_dir, "test", "auto", "test.md"))
+
+    do_parse(output_dir, ["test"], [pdf_bytes], ["en"], backend="pipeline", formula_enable=False)
+    assert parse_cache.stats() == {"hits": 1, "misses": 2}
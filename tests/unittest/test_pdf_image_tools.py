@@ -0,0 +1,59 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import asyncio
+import threading
+
+import pytest
+
+from mineru.utils import pdf_image_tools
+from mineru.utils.pdf_image_tools import AsyncWindowIterator, iter_page_windows, iter_prefetch_windows
+
+
+def _window_sizes(windows):
+    return [sum(end_page_id - start_page_id + 1 for _, start_page_id, end_page_id in window) for window in windows]
+
+
+def test_prefetch_windows_ramp_up_to_window_size(monkeypatch):
+    """预取时第一个窗口为MINERU_PDF_RENDER_CHUNK_SIZE页, 之后逐个翻倍直到window_size, 窗口可以跨越文档边界"""
+    monkeypatch.setattr(pdf_image_tools, "is_windows_environment", lambda: False)
+    monkeypatch.setenv("MINERU_PDF_RENDER_CHUNK_SIZE", "16")
+
+    assert _window_sizes(iter_prefetch_windows([1000], 384, prefetch_depth=1)) == [16, 32, 64, 128, 256, 384, 120]
+    assert list(iter_prefetch_windows([10, 30], 384, prefetch_depth=1)) == [
+        [(0, 0, 9), (1, 0, 5)],
+        [(1, 6, 29)],
+    ]
+    # 不预取时直接按window_size切分
+    assert _window_sizes(iter_prefetch_windows([1000], 384, prefetch_depth=0)) == [384, 384, 232]
+    assert _window_sizes(iter_page_windows([1000], 384)) == [384, 384, 232]
+
+
+@pytest.mark.parametrize("windows_env", [False, True])
+def test_async_window_iterator_advances_on_one_thread(monkeypatch, windows_env):
+    """生成器只在同一个线程中推进和关闭, Windows环境下在事件循环线程中推进"""
+    monkeypatch.setattr(pdf_image_tools, "is_windows_environment", lambda: windows_env)
+    thread_ids = []
+
+    def window_iter():
+        try:
+            for i in range(3):
+                thread_ids.append(threading.get_ident())
+                yield i
+        finally:
+            thread_ids.append(threading.get_ident())
+
+    async def consume():
+        async_window_iter = AsyncWindowIterator(window_iter())
+        items = []
+        try:
+            while (item := await async_window_iter.next()) is not None:
+                items.append(item)
+                if len(items) == 2:
+                    break
+        finally:
+            await async_window_iter.close()
+        return items, threading.get_ident()
+
+    items, loop_thread_id = asyncio.run(consume())
+    assert items == [0, 1]
+    assert len(thread_ids) == 3 and len(set(thread_ids)) == 1
+    assert (thread_ids[0] == loop_thread_id) == windows_env